@@ -0,0 +1,75 @@
+import json
+import os
+import threading
+import time
+
+class IngestionJournal:
+
+    def __init__(self, journal_path:str, name:str='journal'):
+        """Append-only journal of the clips whose embeddings are already stored in the database, used
+        to resume an interrupted ingestion. Each process writes its own file, and the clips completed
+        by any process sharing the journal's directory are considered completed.
+
+        Parameters
+        ----------
+        journal_path : str
+            The directory of the journal.
+        name : str, optional
+            The name of the file written by this process, by default 'journal'
+        """
+        os.makedirs(journal_path, exist_ok=True)
+        self.journal_path = journal_path
+        self.file = os.path.join(journal_path, f'{name}.jsonl')
+
+        self.completed = set()
+        self.last_id = None
+        self._lock = threading.Lock()
+        self._read()
+
+    def _read(self):
+        for file_name in sorted(os.listdir(self.journal_path)):
+            if not file_name.endswith('.jsonl'):
+                continue
+            with open(os.path.join(self.journal_path, file_name), 'r') as fp:
+                for line in fp:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError: # Partially written line
+                        continue
+                    self.completed.update(entry['ids'])
+                    if file_name == os.path.basename(self.file):
+                        self.last_id = entry['last_id']
+
+    def clear(self):
+        """Forgets every completed clip, deleting the files of all processes. Must be called whenever
+        the collections the journal refers to are rewritten.
+        """
+        with self._lock:
+            for file_name in os.listdir(self.journal_path):
+                if file_name.endswith('.jsonl'):
+                    os.remove(os.path.join(self.journal_path, file_name))
+            self.completed = set()
+            self.last_id = None
+
+    def is_completed(self, id:int) -> bool:
+        """Returns whether the clip was already stored in the database.
+        """
+        return id in self.completed
+
+    def record(self, ids:list):
+        """Records that the clips were stored in the database.
+
+        Parameters
+        ----------
+        ids : list
+            The ids of the clips.
+        """
+        if not ids:
+            return
+        with self._lock:
+            with open(self.file, 'a') as fp:
+                fp.write(json.dumps({'ids': list(ids), 'last_id': ids[-1], 'time': time.time()}) + '\n')
+                fp.flush()
+                os.fsync(fp.fileno())
+            self.completed.update(ids)
+            self.last_id = ids[-1]
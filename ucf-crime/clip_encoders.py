@@ -0,0 +1,178 @@
+import numpy as np
+import torch
+import gc
+from transformers import CLIPModel, AutoProcessor
+
+from vision_encoders import EmbeddingModel, _fingerprint, _is_model_ready, _normalize_frames, _encode_clips
+from vision_encoders import _resolve_device, _quantize, _autocast, _compile_forward, _check_dtype
+from frame_filters import FrameFilterBuilder
+from metrics import metrics
+
+class CLIP(EmbeddingModel):
+
+    def __init__(self, model_name:str='openai/clip-vit-large-patch14', batch_size:int=32,
+                 precision:str='fp32', compile_mode:str='eager', device:str=None,
+                 dtype:str='float32', frame_filter:str=None, filter_threshold:float=None):
+        """Uses HuggingFace's CLIP model to obtain the embeddings of the clips.
+
+        Parameters
+        ----------
+        model_name : str, optional
+            The specific CLIP model from the HuggingFace repository. By default, openai/clip-vit-large-patch14
+        batch_size : int, optional
+            Maximum number of frames encoded in a single forward pass. By default, 32.
+        precision : str, optional
+            The precision of the inference. Can be one of the specified in the \'vision_encoders.possible_precisions\'
+            variable. By default, 'fp32'.
+        compile_mode : str, optional
+            How the image encoder is compiled. Can be one of the specified in the
+            \'vision_encoders.possible_compile_modes\' variable. By default, 'eager'.
+        device : str, optional
+            The device running the model. If not specified, CUDA if available, otherwise CPU.
+        dtype : str, optional
+            The type of the embeddings. Can be one of the specified in the \'vision_encoders.possible_dtypes\'
+            variable. By default, 'float32'.
+        frame_filter : str, optional
+            The filter skipping the frames that barely change, whose embedding is that of the previous
+            keyframe. Can be one of the specified in the \'frame_filters.possible_frame_filters\' variable.
+            If not specified, every frame is encoded.
+        filter_threshold : float, optional
+            The threshold of the frame filter. If not specified, the filter's default.
+        """
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.precision = precision
+        self.compile_mode = compile_mode
+        self.dtype = _check_dtype(dtype)
+        self.frame_filter = FrameFilterBuilder.build(frame_filter, threshold=filter_threshold) if frame_filter else None
+        try:
+            self.device = _resolve_device(device)
+            self.model = CLIPModel.from_pretrained(model_name)
+            self.model.to(self.device)
+            self.model = _quantize(self.model, precision, self.device)
+            self.processor = AutoProcessor.from_pretrained(model_name)
+        except OSError as e:
+            print(f'OSError: Model \'{model_name}\' not listed in HuggingFace repository. {e}')
+            return
+
+        self._image_forward = _compile_forward(lambda pixel_values: self.model.get_image_features(pixel_values=pixel_values),
+                                               compile_mode, self.model)
+
+    def _get_img_embedding(self, img:np.ndarray):
+        return self._get_img_embeddings([img])
+
+    def _get_img_embeddings(self, imgs:list):
+        with metrics.timer('encoder_preprocess_seconds', 'Time spent preprocessing a batch of frames'):
+            if _is_model_ready(imgs, self.get_input_size()):
+                image_processor = self.processor.image_processor
+                inputs = {'pixel_values': _normalize_frames(imgs, image_processor.image_mean, image_processor.image_std, self.device)}
+            else:
+                inputs = self.processor(images=imgs, return_tensors='pt').to(self.device)
+
+        with metrics.timer('encoder_forward_seconds', 'Time spent in the forward pass of a batch of frames'), _autocast(self.device, self.precision):
+            image_features = self._image_forward(inputs['pixel_values'])
+            return image_features.float().cpu().detach().numpy()
+
+    def get_input_size(self) -> int:
+        return self.processor.image_processor.crop_size['height']
+
+    def _encode_texts(self, sentences:list) -> np.ndarray:
+        inputs = self.processor(text=sentences, return_tensors='pt', padding=True, truncation=True).to(self.device)
+        with _autocast(self.device, self.precision):
+            return self.model.get_text_features(**inputs).float().cpu().numpy()
+
+    def share_memory(self):
+        self.model.share_memory()
+
+    def unload(self):
+        del self.model
+        gc.collect()
+        if self.device.type == 'cuda':
+            torch.cuda.empty_cache()
+
+    def get_clip_embedding(self, clip_array:list):
+        """Generates the embeddings for each frame of the clip. One should be careful with this implementation,
+        since it returns a list of embeddings, not an embedding.
+
+        Parameters
+        ----------
+        clip_array : list
+            A list of the frames belonging to the clip.
+
+        Returns
+        -------
+        np.ndarray
+            A NumPy array with all the embeddings of each one of the frames.
+        """
+        embs_array = _encode_clips(self._get_img_embeddings, [clip_array], 768, self.batch_size, self.dtype, self.frame_filter)[0]
+        return embs_array
+
+    def get_clips_embedding(self, clips:list) -> list:
+        """Generates the embeddings for each frame of several clips, batching frames
+        of different clips together in the same forward pass.
+
+        Parameters
+        ----------
+        clips : list
+            A list of clips, each of them being a list of frames.
+
+        Returns
+        -------
+        list
+            A NumPy array per clip with the embeddings of each one of its frames.
+        """
+        return _encode_clips(self._get_img_embeddings, clips, 768, self.batch_size, self.dtype, self.frame_filter)
+
+    def get_clips_embedding_and_keyframes(self, clips:list) -> tuple:
+        return _encode_clips(self._get_img_embeddings, clips, 768, self.batch_size, self.dtype, self.frame_filter,
+                             return_keyframes=True)
+
+    def get_fingerprint(self) -> str:
+        # The commit hash identifies the revision of the weights downloaded from HuggingFace
+        return _fingerprint(self.get_encoder_params(), self.model_name,
+                            getattr(self.model.config, '_commit_hash', None), self.precision,
+                            self.frame_filter.get_params() if self.frame_filter else None)
+    
+    def get_encoder_params(self) -> dict:
+        params = {
+            'model_name': 'clip',
+            'embedding_size': 768,
+            'embedding_list': True,
+            'dtype': self.dtype
+        }
+        return params
+    
+class CLIPCentroid(CLIP):
+
+    def get_clip_embedding(self, clip_array:list):
+        """Generates the embedding of the clip by averaging the CLIP-generated embeddings
+        of the frames. With a frame filter, each keyframe is weighted by the number of frames it represents.
+
+        Parameters
+        ----------
+        clip_array : list
+            A list of the frames belonging to the clip.
+
+        Returns
+        -------
+        np.ndarray
+            A single embedding which is the average of the embeddings of the clip's frames.
+        """
+        emb = np.mean(super().get_clip_embedding(clip_array), axis=0)
+        return emb
+
+    def get_clips_embedding(self, clips:list) -> list:
+        return [np.mean(embs_array, axis=0) for embs_array in super().get_clips_embedding(clips)]
+
+    def get_clips_embedding_and_keyframes(self, clips:list) -> tuple:
+        embs, keyframes = super().get_clips_embedding_and_keyframes(clips)
+        return [np.mean(embs_array, axis=0) for embs_array in embs], keyframes
+    
+    def get_encoder_params(self) -> dict:
+        params = {
+            'model_name': 'clipcentroid',
+            'embedding_size': 768,
+            'dtype': self.dtype,
+            'embedding_list': False
+        }
+        return params
@@ -1,41 +1,207 @@
 import numpy as np
+import pandas as pd
+import json
 import os
+import time
+import fcntl
+import importlib
+from contextlib import contextmanager
 
 # Utils
-from my_utils import distances
-from env import *
-
-# Milvus
-from pymilvus import MilvusClient
-
-# QDrant
-from qdrant_client import QdrantClient
-from qdrant_client.models import PointStruct, Distance, VectorParams
+from my_utils import stable_frame_id
+from local_index import possible_indexes, exact_search, IVFIndex
+from quantization import possible_codecs, QuantizedIndex
+from metrics import metrics
 
 # Chroma
 #import chromadb
 
-possible_databases = [
-    'local',
-    'milvus',
-    'qdrant',
-]
+# Module and class of each database's handler. Handlers of external databases live in their own
+# modules, so their clients are only imported when they are used.
+database_registry = {
+    'local': ('databases', 'LocalDatabase'),
+    'milvus': ('milvus_database', 'MilvusDatabase'),
+    'qdrant': ('qdrant_database', 'QDrantDatabase'),
+}
+possible_databases = list(database_registry)
+
+def register_database(database_name:str, module_name:str, class_name:str):
+    """Registers a database's handler, which is only imported once it is built.
+
+    Parameters
+    ----------
+    database_name : str
+        The name of the database.
+    module_name : str
+        The module of the handler.
+    class_name : str
+        The class of the handler.
+    """
+    database_registry[database_name] = (module_name, class_name)
+    if database_name not in possible_databases:
+        possible_databases.append(database_name)
+
+def __getattr__(name:str):
+    # Handlers moved to their own modules can still be imported from this one
+    for module_name, class_name in database_registry.values():
+        if class_name == name and module_name != __name__:
+            return getattr(importlib.import_module(module_name), class_name)
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
 
 class DatabaseHandler:
     def __init__(self, encoder_params:dict):
         raise NotImplementedError
     
     def __enter__(self):
-        raise NotImplementedError
+        return self
     
     def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Flushes any buffered embedding and closes the connection to the database.
+        """
         raise NotImplementedError
 
-    def upload_embedding(self):
-        """Uploads embedding to the database
+    def _init_buffer(self, buffer_rows:int, buffer_bytes:int, buffer_delay:float):
+        # Must be called by the constructor of every handler
+        self.buffer_rows = buffer_rows
+        self.buffer_bytes = buffer_bytes
+        self.buffer_delay = buffer_delay
+
+        self._buffer = []
+        self._buffered_rows = 0
+        self._buffered_bytes = 0
+        self._last_flush = time.monotonic()
+
+        self.written_rows = 0
+        self.write_time = 0.
+
+        # Functions called with the ids of the clips after they are written
+        self.on_write = []
+
+    def _count_rows(self, emb:np.ndarray) -> int:
+        return len(emb) if self.emb_list else 1
+
+    def _write(self, entries:list):
+        """Writes a batch of embeddings to the database in as few requests as possible.
+
+        Parameters
+        ----------
+        entries : list
+            A list of (id, emb, metadata) tuples.
+        """
+        raise NotImplementedError
+
+    def upload_embedding(self, id:int, emb:np.ndarray, metadata:dict):
+        """Uploads embedding to the database, without buffering it.
+
+        Parameters
+        ----------
+        id : int
+            The id of the clip.
+        emb : np.ndarray
+            The embedding (or a list of embeddings).
+        metadata : dict
+            The metadata to store alongside the embedding.
+        """
+        self._timed_write([(id, emb, metadata)])
+
+    def add(self, id:int, emb:np.ndarray, metadata:dict):
+        """Buffers the embedding to be uploaded alongside others. The buffer is flushed once it reaches
+        the maximum number of rows or bytes, or once the maximum delay since the last flush has passed.
+
+        Parameters
+        ----------
+        id : int
+            The id of the clip.
+        emb : np.ndarray
+            The embedding (or a list of embeddings).
+        metadata : dict
+            The metadata to store alongside the embedding.
+        """
+        emb = np.asarray(emb)
+        self._buffer.append((id, emb, metadata))
+        self._buffered_rows += self._count_rows(emb)
+        self._buffered_bytes += emb.nbytes
+
+        if (self._buffered_rows >= self.buffer_rows
+            or self._buffered_bytes >= self.buffer_bytes
+            or time.monotonic() - self._last_flush >= self.buffer_delay):
+            self.flush()
+
+    def flush(self):
+        """Uploads all the buffered embeddings to the database.
+        """
+        if self._buffer:
+            self._timed_write(self._buffer)
+
+        self._buffer = []
+        self._buffered_rows = 0
+        self._buffered_bytes = 0
+        self._last_flush = time.monotonic()
+
+    def _timed_write(self, entries:list):
+        start_write = time.perf_counter()
+        self._write(entries)
+        end_write = time.perf_counter()
+
+        rows = sum(self._count_rows(np.asarray(emb)) for _, emb, _ in entries)
+        self.written_rows += rows
+        self.write_time += end_write - start_write
+        metrics.histogram('database_write_seconds', 'Time spent writing a batch of rows to the database').observe(end_write - start_write)
+        metrics.counter('database_rows_total', 'Rows written to the database').inc(rows)
+
+        for callback in self.on_write:
+            callback([id for id, _, _ in entries])
+
+    def write_throughput(self) -> float:
+        """Returns the number of rows written per second spent writing.
+        """
+        return self.written_rows / self.write_time if self.write_time > 0 else 0.
+
+    def _report(self):
+        print(f"[DB_HAND]: Wrote {self.written_rows} rows in {self.write_time:.2f}s ({self.write_throughput():.2f} rows/s)")
+
+    def build_index(self):
+        """Writes any buffered embedding and builds the index used to search the collection, returning
+        once the index covers every written embedding.
+        """
+        self.flush()
+
+    def search(self, query_vectors:np.ndarray, k:int=10, filter:dict=None) -> list:
+        """Searches the k embeddings most similar to each one of the query vectors, in a single request.
+
+        Parameters
+        ----------
+        query_vectors : np.ndarray
+            The query vectors, one per row (or a single query vector).
+        k : int, optional
+            The number of results per query, by default 10
+        filter : dict, optional
+            The value (or list of accepted values) of the metadata fields results must match,
+            e.g. {'class_name': 'Abuse', 'dataset': ['val', 'test'], 'anomaly': True}. By default, None.
+
+        Returns
+        -------
+        list
+            A list per query with its results sorted from most to least similar. Each result is a dict
+            with the id of the embedding, its score (the higher, the more similar) and its metadata.
+            Per-frame embeddings have the id of their clip (clip_id) and their frame among the metadata.
         """
         raise NotImplementedError
 
+def _as_queries(query_vectors:np.ndarray) -> np.ndarray:
+    # A single query vector is a batch of one
+    return np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+
+def _filter_conditions(filter:dict) -> list:
+    # Each field of the filter with the list of its accepted values
+    if not filter:
+        return []
+    return [(field, list(values) if isinstance(values, (list, tuple, set)) else [values])
+            for field, values in filter.items()]
+
 class DatabaseBuilder:
 
     def build(database_name, encoder_params, *args, **kwargs) -> DatabaseHandler:
@@ -57,242 +223,460 @@ class DatabaseBuilder:
             If the specified database handler is not implemented.
         """
 
-        match database_name:
-            case 'local':
-                return LocalDatabase(encoder_params, *args, **kwargs)
-            case 'milvus':
-                return MilvusDatabase(encoder_params, *args, **kwargs)
-            case 'qdrant':
-                return QDrantDatabase(encoder_params, *args, **kwargs)
-            case _:
-                raise TypeError(f'TypeError: Encoder {database_name} not found among implemented. Please, use one of the following: {possible_databases}.')
+        if database_name not in database_registry:
+            raise TypeError(f'TypeError: Encoder {database_name} not found among implemented. Please, use one of the following: {possible_databases}.')
 
-class LocalDatabase(DatabaseHandler):
+        # Import the handler's module only once it is used
+        module_name, class_name = database_registry[database_name]
+        handler_class = getattr(importlib.import_module(module_name), class_name)
+        return handler_class(encoder_params, *args, **kwargs)
 
-    def __init__(self, encoder_params:dict, save_path:str='/home/pablo/Documents/TFM/ucf-crime/clip_embs'):
-        """This database saves the embeddings in NumPy .npy file in the specified path.
+    def build_multi(database_name, outputs_params:dict, *args, **kwargs) -> DatabaseHandler:
+        """Returns a handler grouping one database's handler per output of a multi-output encoder.
 
         Parameters
         ----------
-        encoder_params : dict
-            The parameters defined by the encoder.
-        save_path : str, optional
-            The path to save the embeddings, by default '/home/pablo/Documents/TFM/ucf-crime/clip_embs'
+        database_name : str
+            The name of the database. Can be one of the specified in the \'databases.possible_databases\' variable.
+        outputs_params : dict
+            The encoder params of each output.
+
+        Returns
+        -------
+        DatabaseHandler
+            The handler grouping the handler of each output.
         """
+        return MultiDatabase({output: DatabaseBuilder.build(database_name, encoder_params, *args, **kwargs)
+                              for output, encoder_params in outputs_params.items()})
 
-        # Get encoder params
-        self.encoder_name = encoder_params['model_name']
-        self.emb_size = encoder_params['embedding_size']
-        self.emb_list = encoder_params['embedding_list']
-        self.distance = encoder_params['distance']
+class MultiDatabase(DatabaseHandler):
 
-        self.save_path = save_path
+    def __init__(self, handlers:dict):
+        """Groups the handlers of the collections where each output of a multi-output encoder is stored.
 
-    def __enter__(self):
-        pass
+        Parameters
+        ----------
+        handlers : dict
+            The handler of each output.
+        """
+        self.handlers = handlers
+
+        # A clip is written once it has been written to the collection of every output
+        self.on_write = []
+        self._pending = {}
+        for handler in handlers.values():
+            handler.on_write.append(self._output_written)
+
+    def _output_written(self, ids:list):
+        written = []
+        for id in ids:
+            self._pending[id] = self._pending.get(id, 0) + 1
+            if self._pending[id] == len(self.handlers):
+                del self._pending[id]
+                written.append(id)
+        if written:
+            for callback in self.on_write:
+                callback(written)
+
+    def upload_embedding(self, id:int, embs:dict, metadata:dict):
+        """Uploads each embedding to the database of its output.
 
-    def __exit__(self):
-        pass
+        Parameters
+        ----------
+        id : int
+            The id of the clip.
+        embs : dict
+            The embedding (or list of embeddings) of each output.
+        metadata : dict
+            The metadata to store alongside the embeddings.
+        """
+        for output, handler in self.handlers.items():
+            handler.upload_embedding(id, embs[output], metadata)
 
-    def upload_embedding(self, id:int, emb:np.ndarray, metadata:dict):
-        """Save the embedding to the file
+    def add(self, id:int, embs:dict, metadata:dict):
+        """Buffers each embedding in the database of its output.
 
         Parameters
         ----------
         id : int
             The id of the clip.
-        emb : np.ndarray
-            The embedding (or a list of embeddings).
+        embs : dict
+            The embedding (or list of embeddings) of each output.
         metadata : dict
-            The metadata to store alongside the embedding.
+            The metadata to store alongside the embeddings.
         """
-        #np_file_name = str(id) + '_' + metadata['video'] + '_' + str(metadata['start_frame']) + '-' + str(metadata['end_frame']) + '.npy'
-        if self.emb_list:
-            for i, vector in enumerate(emb):
-                np_file_name = f'{id:06d}-{i}_{metadata["video"]}_{metadata["start_frame"]}-{metadata["end_frame"]}.npy'
-                np.save(os.path.join(self.save_path, np_file_name), vector)
-        else:
-            np_file_name = f'{id:06d}_{metadata["video"]}_{metadata["start_frame"]}-{metadata["end_frame"]}.npy'
-            np.save(os.path.join(self.save_path, np_file_name), emb)
+        for output, handler in self.handlers.items():
+            handler.add(id, embs[output], metadata)
 
-class MilvusDatabase(DatabaseHandler):
+    @property
+    def written_rows(self) -> int:
+        return sum(handler.written_rows for handler in self.handlers.values())
 
-    def __init__(self, encoder_params:dict,
-                 host:str=DATABASE_HOST,
-                 port:int=MILVUS_PORT,
+    @property
+    def write_time(self) -> float:
+        return sum(handler.write_time for handler in self.handlers.values())
+
+    def flush(self):
+        for handler in self.handlers.values():
+            handler.flush()
+
+    def build_index(self):
+        for handler in self.handlers.values():
+            handler.build_index()
+
+    def close(self):
+        for handler in self.handlers.values():
+            handler.close()
+
+LOCAL_VECTORS_FILE = 'vectors.bin'
+LOCAL_METADATA_FILE = 'metadata.jsonl'
+LOCAL_HEADER_FILE = 'header.json'
+LOCAL_INDEX_FILE = 'index.npz'
+LOCAL_CODES_FILE = 'codes.npz'
+LOCAL_LOCK_FILE = 'collection.lock'
+class LocalDatabase(DatabaseHandler):
+
+    def __init__(self, encoder_params:dict, save_path:str='/home/pablo/Documents/TFM/ucf-crime/clip_embs',
                  rewrite:bool=True,
-                 token:str='root:Milvus'):
-        """Milvus Database handler.
+                 dtype:str=None,
+                 initial_capacity:int=1024,
+                 buffer_rows:int=1024,
+                 buffer_bytes:int=64*2**20,
+                 buffer_delay:float=5.,
+                 index:str='exact',
+                 nlist:int=None,
+                 nprobe:int=8,
+                 codec:str=None,
+                 rerank:int=4,
+                 pq_subspaces:int=None):
+        """This database appends the embeddings of a collection to a single, growable matrix file,
+        alongside a table with the metadata of each clip and the rows of the matrix holding its
+        embeddings. The whole collection can then be loaded without copies with load_collection. Several
+        handlers, even of different processes, can write to the same collection, since each write locks it.
 
         Parameters
         ----------
         encoder_params : dict
             The parameters defined by the encoder.
-        host : str, optional
-            The host where the database is running, by default 'localhost'
-        port : int, optional
-            The port where the database is running, by default 19530
+        save_path : str, optional
+            The path to save the collections, by default '/home/pablo/Documents/TFM/ucf-crime/clip_embs'
         rewrite : bool, optional
             Whether to delete any previous collection with the same name, by default True
-        token : _type_, optional
-            Token to acces Milvus database, by default 'root:Milvus'
+        dtype : str, optional
+            The type of the stored embeddings, 'float32' or 'float16'. If not specified, the type of the
+            encoder's embeddings.
+        initial_capacity : int, optional
+            Number of rows preallocated when the collection is created, by default 1024. The capacity
+            is doubled whenever it is exhausted.
+        buffer_rows : int, optional
+            Maximum number of buffered rows before they are written, by default 1024
+        buffer_bytes : int, optional
+            Maximum size of the buffered embeddings before they are written, by default 64 MiB
+        buffer_delay : float, optional
+            Maximum seconds since the last write before buffered rows are written, by default 5
+        index : str, optional
+            The index used to search the collection. Can be one of the specified in the
+            \'local_index.possible_indexes\' variable, by default 'exact'
+        nlist : int, optional
+            The number of clusters of the 'ivf' index. If not specified, it depends on the size of the collection.
+        nprobe : int, optional
+            The number of clusters of the 'ivf' index compared with each query, by default 8
+        codec : str, optional
+            The compression of the copy of the embeddings kept in memory to search the collection, whose
+            best candidates are re-ranked with the stored embeddings. Can be one of the specified in the
+            \'quantization.possible_codecs\' variable, and only used with the 'exact' index. If not
+            specified, the stored embeddings are searched directly.
+        rerank : int, optional
+            Number of candidates re-ranked per result when a codec is used, by default 4
+        pq_subspaces : int, optional
+            The number of subspaces of the 'pq' codec. If not specified, one per 8 dimensions.
+
+        Raises
+        ------
+        ValueError
+            If an existing collection, which is not rewritten, has a different embedding size or type, or
+            a codec is used with an index other than 'exact'.
+        TypeError
+            If the specified index or codec is not implemented.
         """
-        
+        if index not in possible_indexes:
+            raise TypeError(f'TypeError: Index {index} not found among implemented. Please, use one of the following: {possible_indexes}.')
+        if codec is not None and codec not in possible_codecs:
+            raise TypeError(f'TypeError: Codec {codec} not found among implemented. Please, use one of the following: {possible_codecs}.')
+        if codec is not None and index != 'exact':
+            raise ValueError(f"ValueError: Codec {codec} can only be used with the 'exact' index")
+
         # Get encoder params
         self.encoder_name = encoder_params['model_name']
-        self.emb_size = encoder_params['embedding_size']
+        self.emb_size = int(np.prod(encoder_params['embedding_size']))
         self.emb_list = encoder_params['embedding_list']
-        
-        # Connect client
-        self.client = MilvusClient(uri=f'http://{host}:{port}', token=token)
+        self.distance = encoder_params.get('distance', 'COS')
+
+        self.save_path = save_path
+        self.dtype = np.dtype(dtype or encoder_params.get('dtype', 'float32'))
+        self.index = index
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.codec = codec
+        self.rerank = rerank
+        self.pq_subspaces = pq_subspaces
+        self._index = None
+        self._collection = None
 
         # Name the collection
-        collection_name = f'ucf{self.encoder_name}'
-
-        # Check if collection exists
-        if (not self.client.has_collection(collection_name=collection_name)) or rewrite:
-            
-            # Drop collection
-            self.client.drop_collection(collection_name=collection_name)
-            
-            # Create collection
-            self.client.create_collection(
-                collection_name=collection_name,
-                dimension=self.emb_size,
-                primary_field_name='id',
-                id_type='int',
-                vector_field_name='vector',
-                metric_type='COSINE',
-                auto_id=self.emb_list,
-                timeout=None,
-                schema=None,
-                index_params=None
-            )
-        
-        self.collection_name = collection_name
+        self.collection_name = f'ucf{self.encoder_name}'
+        self.collection_path = os.path.join(save_path, self.collection_name)
+        os.makedirs(self.collection_path, exist_ok=True)
 
-    def __enter__(self):
-        pass
+        vectors_path = os.path.join(self.collection_path, LOCAL_VECTORS_FILE)
+        header_path = os.path.join(self.collection_path, LOCAL_HEADER_FILE)
 
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        self.client.close()
+        # Several handlers (e.g. one per worker process) may write to the collection at the same time
+        with self._locked():
+
+            # Delete previous collection
+            if rewrite:
+                for file_name in (LOCAL_VECTORS_FILE, LOCAL_METADATA_FILE, LOCAL_HEADER_FILE, LOCAL_INDEX_FILE, LOCAL_CODES_FILE):
+                    if os.path.exists(os.path.join(self.collection_path, file_name)):
+                        os.remove(os.path.join(self.collection_path, file_name))
+
+            # Create collection
+            if not os.path.exists(header_path):
+                self.header = {
+                    'dtype': self.dtype.name,
+                    'dim': self.emb_size,
+                    'count': 0,
+                    'capacity': initial_capacity,
+                    'distance': self.distance,
+                }
+                with open(vectors_path, 'wb') as fp:
+                    fp.truncate(initial_capacity * self.emb_size * self.dtype.itemsize)
+                open(os.path.join(self.collection_path, LOCAL_METADATA_FILE), 'w').close()
+                self._write_header()
+            else:
+                with open(header_path, 'r') as fp:
+                    self.header = json.load(fp)
+                if dtype is None: # Existing collections keep their type, unless another one is requested
+                    self.dtype = np.dtype(self.header['dtype'])
+                if self.header['dim'] != self.emb_size or self.header['dtype'] != self.dtype.name:
+                    raise ValueError(f"ValueError: Collection '{self.collection_name}' stores {self.header['dim']}-d {self.header['dtype']} embeddings, "
+                                     f"but {self.emb_size}-d {self.dtype.name} were requested")
+
+            self._vectors = np.memmap(vectors_path, dtype=self.dtype, mode='r+',
+                                      shape=(self.header['capacity'], self.emb_size))
+
+        self._init_buffer(buffer_rows, buffer_bytes, buffer_delay)
+
+    @contextmanager
+    def _locked(self):
+        # Exclusive lock of the collection among the handlers of every process
+        with open(os.path.join(self.collection_path, LOCAL_LOCK_FILE), 'a') as fp:
+            fcntl.flock(fp, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fp, fcntl.LOCK_UN)
+
+    def _reload_header(self):
+        # Other handlers may have appended rows, and grown the matrix file, since this one last wrote
+        with open(os.path.join(self.collection_path, LOCAL_HEADER_FILE), 'r') as fp:
+            self.header = json.load(fp)
+        if self.header['capacity'] != len(self._vectors):
+            self._vectors.flush()
+            del self._vectors
+            self._vectors = np.memmap(os.path.join(self.collection_path, LOCAL_VECTORS_FILE), dtype=self.dtype, mode='r+',
+                                      shape=(self.header['capacity'], self.emb_size))
+
+    def _write_header(self):
+        # Replace the header atomically, so it always describes fully written rows
+        header_path = os.path.join(self.collection_path, LOCAL_HEADER_FILE)
+        with open(header_path + '.tmp', 'w') as fp:
+            json.dump(self.header, fp)
+        os.replace(header_path + '.tmp', header_path)
+
+    def _reserve(self, rows:int):
+        # Double the capacity of the matrix file until the new rows fit
+        capacity = self.header['capacity']
+        while capacity < self.header['count'] + rows:
+            capacity *= 2
+        if capacity == self.header['capacity']:
+            return
+
+        self._vectors.flush()
+        del self._vectors
+        vectors_path = os.path.join(self.collection_path, LOCAL_VECTORS_FILE)
+        with open(vectors_path, 'r+b') as fp:
+            fp.truncate(capacity * self.emb_size * self.dtype.itemsize)
+        self._vectors = np.memmap(vectors_path, dtype=self.dtype, mode='r+',
+                                  shape=(capacity, self.emb_size))
+        self.header['capacity'] = capacity
 
     def close(self):
-        self.client.close()
+        self.flush()
+        self._report()
+        self._vectors.flush()
 
-    def upload_embedding(self, id:int, emb:np.ndarray, metadata:dict):
-        """Upload the embedding to the database.
+    def _write(self, entries:list):
+        """Append the embeddings to the collection's matrix file and their metadata to its table.
 
         Parameters
         ----------
-        id : int
-            The id of the clip.
-        emb : np.ndarray
-            The embedding (or a list of embeddings).
-        metadata : dict
-            The metadata to store alongside the embedding.
+        entries : list
+            A list of (id, emb, metadata) tuples.
         """
-        if self.emb_list:
-            data = [{'vector':vector, **metadata} for vector in emb]
+        embs = [np.asarray(emb).reshape(-1, self.emb_size) for _, emb, _ in entries]
+        rows = sum(len(emb) for emb in embs)
+
+        # Append after the rows written by any handler of the collection
+        with self._locked():
+            self._reload_header()
+            self._reserve(rows)
+
+            offset = self.header['count']
+            records = []
+            for (id, _, metadata), emb in zip(entries, embs):
+                self._vectors[offset:offset+len(emb)] = emb
+                records.append(json.dumps({'id':id, 'offset':offset, 'rows':len(emb), **metadata},
+                                          default=lambda x: x.item()))
+                offset += len(emb)
+            self._vectors.flush()
+
+            with open(os.path.join(self.collection_path, LOCAL_METADATA_FILE), 'a') as fp:
+                fp.write('\n'.join(records) + '\n')
+
+            self.header['count'] = offset
+            self._write_header()
+        self._collection = None
+
+    def build_index(self):
+        """Builds the 'ivf' index or the compressed embeddings of the collection (if used) and saves them
+        alongside the collection. Rows written afterwards are still found, compared exhaustively, until
+        the index is built again.
+        """
+        self.flush()
+        if self.codec:
+            self._index = QuantizedIndex(self.codec, self.distance, rerank=self.rerank, subspaces=self.pq_subspaces)
+            index_path = os.path.join(self.collection_path, LOCAL_CODES_FILE)
+        elif self.index == 'ivf':
+            self._index = IVFIndex(self.distance, nlist=self.nlist, nprobe=self.nprobe)
+            index_path = os.path.join(self.collection_path, LOCAL_INDEX_FILE)
         else:
-            data = metadata
-            data['id'] = id
-            data['vector'] = emb
-
-        self.client.insert(collection_name=self.collection_name, data=data)
-
-class QDrantDatabase(DatabaseHandler):
+            return
+        vectors, _ = LocalDatabase.load_collection(self.collection_path)
+        self._index.build(vectors)
+        self._index.save(index_path)
+
+    def _get_index(self, count:int):
+        # Load the saved index, unless it indexes rows which are no longer in the collection
+        index_path = os.path.join(self.collection_path, LOCAL_CODES_FILE if self.codec else LOCAL_INDEX_FILE)
+        if self._index is None and os.path.exists(index_path):
+            if self.codec:
+                self._index = QuantizedIndex.load(index_path)
+                self._index.rerank = self.rerank
+            else:
+                self._index = IVFIndex.load(index_path)
+                self._index.nprobe = self.nprobe
+        if self._index is None or self._index.count > count or getattr(self._index, 'codec', self.codec) != self.codec:
+            self.build_index()
+        return self._index
+
+    def _load_collection(self) -> tuple:
+        # Load the collection once, and again only after rows are written by this or another handler
+        with open(os.path.join(self.collection_path, LOCAL_HEADER_FILE), 'r') as fp:
+            count = json.load(fp)['count']
+        if self._collection is not None and self._collection[0] == count:
+            return self._collection[1:]
+
+        vectors, metadata = LocalDatabase.load_collection(self.collection_path)
+
+        # Clip owning each row, ignoring rows of clips written again
+        rows = metadata['rows'].to_numpy(dtype=np.int64)
+        starts = np.repeat(metadata['offset'].to_numpy(dtype=np.int64) - np.cumsum(rows) + rows, rows)
+        owner = np.full(len(vectors), -1)
+        owner[starts + np.arange(rows.sum())] = np.repeat(np.arange(len(metadata)), rows)
+
+        ids, offsets = metadata['id'].tolist(), metadata['offset'].tolist()
+        records = metadata.drop(columns=['id', 'offset', 'rows'])
+        # Pandas returns no records at all for clips without metadata
+        records = records.to_dict('records') if len(records.columns) else [{} for _ in range(len(records))]
+        self._collection = (len(vectors), vectors, metadata, owner, ids, offsets, records)
+        return self._collection[1:]
+
+    def search(self, query_vectors:np.ndarray, k:int=10, filter:dict=None) -> list:
+        self.flush()
+        vectors, metadata, owner, ids, offsets, records = self._load_collection()
+
+        # Rows matching the filter
+        valid_clips = np.ones(len(metadata), dtype=bool)
+        for field, values in _filter_conditions(filter):
+            if field in metadata:
+                valid_clips &= metadata[field].isin(values).to_numpy()
+            else:
+                valid_clips[:] = False
+        valid_rows = owner >= 0
+        valid_rows[valid_rows] = valid_clips[owner[valid_rows]]
 
-    def __init__(self, encoder_params:dict, host:str=DATABASE_HOST,
-                 port:int=QDRANT_PORT,
-                 rewrite:bool=True):
-        """QDrant Database handler.
+        if self.index == 'ivf' or self.codec:
+            scores, rows = self._get_index(len(vectors)).search(vectors, _as_queries(query_vectors), k, valid_rows)
+        else:
+            scores, rows = exact_search(vectors, _as_queries(query_vectors), self.distance, k, valid_rows)
+
+        results = []
+        for query_scores, query_rows in zip(scores, rows):
+            hits = []
+            for score, row in zip(query_scores, query_rows):
+                if row < 0:
+                    break
+                clip, record = ids[owner[row]], records[owner[row]]
+                if self.emb_list:
+                    frame = int(row - offsets[owner[row]])
+                    hits.append({'id': stable_frame_id(clip, frame),
+                                 'score': float(score),
+                                 'metadata': {**record, 'clip_id': clip, 'frame': frame}})
+                else:
+                    hits.append({'id': clip, 'score': float(score), 'metadata': record})
+            results.append(hits)
+        return results
+
+    def load_collection(collection_path:str) -> tuple:
+        """Loads a collection written by a LocalDatabase. The embeddings are memory-mapped, not read.
 
         Parameters
         ----------
-        encoder_params : dict
-            The parameters defined by the encoder.
-        host : str, optional
-            _The host where the database is running, by default 'localhost'
-        port : int, optional
-            The port where the database is running, by default 6333
-        rewrite : bool, optional
-            Whether to delete any previous collection with the same name, by default True
-        """
-
-        # Get encoder params
-        self.encoder_name = encoder_params['model_name']
-        self.emb_size = encoder_params['embedding_size']
-        self.emb_list = encoder_params['embedding_list']
-        
-        # Connect to client
-        self.client = QdrantClient(host=host, port=port)
+        collection_path : str
+            The directory of the collection.
 
-        # Name the collection
-        collection_name = f'ucf{self.encoder_name}'
-
-        # Create collection
-        if (not self.client.collection_exists(collection_name=collection_name)):
-            
-            print("Collection do not exist")
-            self.client.create_collection(
-                collection_name=collection_name,
-                vectors_config=VectorParams(
-                    size=self.emb_size,
-                    distance=Distance.COSINE
-                ),
-            )
-        elif rewrite:
-            print(f"[DB_HAND]: Collection '{collection_name}' do exist but will be rewritten")
-            self.client.delete_collection(collection_name=collection_name)
-            self.client.create_collection(
-                collection_name=collection_name,
-                vectors_config=VectorParams(
-                    size=self.emb_size,
-                    distance=Distance.COSINE
-                ),
-            )
-
-        self.collection_name = collection_name
+        Returns
+        -------
+        tuple
+            A read-only NumPy memmap with one embedding per row, and a Pandas DataFrame with the id,
+            offset, number of rows and metadata of each clip.
+        """
+        with open(os.path.join(collection_path, LOCAL_HEADER_FILE), 'r') as fp:
+            header = json.load(fp)
 
-    def __enter__(self):
-        pass
+        if header['count'] > 0:
+            vectors = np.memmap(os.path.join(collection_path, LOCAL_VECTORS_FILE), dtype=header['dtype'], mode='r',
+                                shape=(header['count'], header['dim']))
+        else:
+            vectors = np.empty((0, header['dim']), dtype=header['dtype'])
 
-    def __exit__(self):
-        self.client.close()
+        records = []
+        with open(os.path.join(collection_path, LOCAL_METADATA_FILE), 'r') as fp:
+            for line in fp:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError: # Partially written line
+                    continue
+        metadata = pd.DataFrame(records, columns=None if records else ['id', 'offset', 'rows'])
 
-    def close(self):
-        self.client.close()
+        # Ignore records of rows not covered by the header, and keep the last copy of each clip
+        if len(metadata):
+            metadata = metadata[metadata['offset'] + metadata['rows'] <= header['count']]
+            metadata = metadata.drop_duplicates(subset='id', keep='last').reset_index(drop=True)
 
-    def upload_embedding(self, id:int, emb:np.ndarray, metadata:dict):
-        """Upload the embedding to the database.
+        return vectors, metadata
 
-        Parameters
-        ----------
-        id : int
-            The id of the clip.
-        emb : np.ndarray
-            The embedding (or a list of embeddings).
-        metadata : dict
-            The metadata to store alongside the embedding.
-        """
-        if self.emb_list:
-            points = [PointStruct(
-                id=id,
-                vector=vector.tolist(),
-                payload=metadata
-            ) for vector in emb]
-        else:
-            points = [
-                PointStruct(
-                    id=id,
-                    vector=emb.tolist(),
-                    payload=metadata)]
-            
-        self.client.upsert(
-            collection_name=self.collection_name,
-            points=points
-        )
 """
 class ChromaDatabase(DatabaseHandler):
 
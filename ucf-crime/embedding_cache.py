@@ -0,0 +1,206 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+class EmbeddingCache:
+
+    def __init__(self, cache_path:str, model_name:str, fingerprint:str, max_bytes:int=10*2**30,
+                 decode_params:dict=None):
+        """Persistent cache of the embeddings generated by an encoder, addressed by the video, the frame
+        range of the clip, the encoder's fingerprint and how the frames were decoded. When the cache exceeds
+        its maximum size, the least recently used embeddings are evicted. Several processes may share the
+        same cache.
+
+        Parameters
+        ----------
+        cache_path : str
+            The directory of the cache.
+        model_name : str
+            The name of the encoder.
+        fingerprint : str
+            The fingerprint of the encoder's weights and configuration. Embeddings generated by the same
+            encoder with any other fingerprint are deleted from the cache.
+        max_bytes : int, optional
+            The maximum size of the cached embeddings, by default 10 GiB
+        decode_params : dict, optional
+            The settings of the decoding of the frames (e.g. the decoder and the resolution), since frames
+            decoded otherwise lead to different embeddings. If not specified, the defaults.
+        """
+        self.cache_path = cache_path
+        self.model_name = model_name
+        self.fingerprint = fingerprint
+        self.max_bytes = max_bytes
+        self.decode_params = json.dumps(decode_params or {}, sort_keys=True)
+
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(cache_path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(cache_path, 'index.sqlite'),
+                                   timeout=60,
+                                   isolation_level=None,
+                                   check_same_thread=False)
+        self._db.execute('BEGIN IMMEDIATE')
+        self._db.execute('CREATE TABLE IF NOT EXISTS entries ('
+                         'key TEXT PRIMARY KEY, model_name TEXT, fingerprint TEXT, size INTEGER, last_access REAL, keyframes TEXT)')
+        if 'keyframes' not in [column for _, column, *_ in self._db.execute('PRAGMA table_info(entries)')]:
+            self._db.execute('ALTER TABLE entries ADD COLUMN keyframes TEXT') # Caches created before keyframes were recorded
+
+        # Total size of the entries, kept up to date by triggers so it is not summed on every insert
+        self._db.execute('CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY CHECK (id = 0), size INTEGER)')
+        self._db.execute('INSERT OR IGNORE INTO totals SELECT 0, COALESCE(SUM(size), 0) FROM entries')
+        self._db.execute('CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries '
+                         'BEGIN UPDATE totals SET size = size + NEW.size; END')
+        self._db.execute('CREATE TRIGGER IF NOT EXISTS entries_update AFTER UPDATE OF size ON entries '
+                         'BEGIN UPDATE totals SET size = size + NEW.size - OLD.size; END')
+        self._db.execute('CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries '
+                         'BEGIN UPDATE totals SET size = size - OLD.size; END')
+        self._db.execute('COMMIT')
+        self.invalidate()
+
+    def _key(self, video:str, start_frame:int, end_frame:int) -> str:
+        return hashlib.sha256(f'{self.fingerprint}|{self.decode_params}|{video}|{start_frame}|{end_frame}'.encode('utf-8')).hexdigest()
+
+    def _file(self, key:str) -> str:
+        return os.path.join(self.cache_path, key[:2], key + '.npy')
+
+    def _remove(self, keys:list):
+        for key in keys:
+            try:
+                os.remove(self._file(key))
+            except FileNotFoundError: # Already removed by another process
+                pass
+        self._db.executemany('DELETE FROM entries WHERE key = ?', [(key,) for key in keys])
+
+    def invalidate(self):
+        """Deletes the embeddings generated by this encoder with a different fingerprint.
+        """
+        with self._lock:
+            stale = self._db.execute('SELECT key FROM entries WHERE model_name = ? AND fingerprint != ?',
+                                     (self.model_name, self.fingerprint)).fetchall()
+            if stale:
+                print(f"[CACHE]: Deleting {len(stale)} embeddings of a previous version of '{self.model_name}'")
+                self._remove([key for key, in stale])
+
+    def get(self, video:str, start_frame:int, end_frame:int):
+        """Returns the cached embedding of the clip, if any.
+
+        Parameters
+        ----------
+        video : str
+            The name of the video.
+        start_frame : int
+            The first frame of the clip.
+        end_frame : int
+            The last frame of the clip.
+
+        Returns
+        -------
+        np.ndarray | dict
+            The embedding of the clip (or the embedding of each output of a multi-output encoder),
+            or None if it is not cached.
+        """
+        key = self._key(video, start_frame, end_frame)
+        try:
+            emb = np.load(self._file(key))
+            if isinstance(emb, np.lib.npyio.NpzFile):
+                with emb:
+                    emb = dict(emb)
+        except (FileNotFoundError, ValueError):
+            self.misses += 1
+            return None
+
+        with self._lock:
+            self._db.execute('UPDATE entries SET last_access = ? WHERE key = ?', (time.time(), key))
+        self.hits += 1
+        return emb
+
+    def get_keyframes(self, video:str, start_frame:int, end_frame:int) -> list:
+        """Returns the keyframe whose embedding each frame of the cached clip took, if its encoder
+        skipped near-duplicate frames.
+
+        Parameters
+        ----------
+        video : str
+            The name of the video.
+        start_frame : int
+            The first frame of the clip.
+        end_frame : int
+            The last frame of the clip.
+
+        Returns
+        -------
+        list
+            The index of the keyframe representing each frame, or None if every frame was encoded.
+        """
+        with self._lock:
+            row = self._db.execute('SELECT keyframes FROM entries WHERE key = ?',
+                                   (self._key(video, start_frame, end_frame),)).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    def put(self, video:str, start_frame:int, end_frame:int, emb:np.ndarray, keyframes:list=None):
+        """Stores the embedding of the clip, evicting the least recently used embeddings if needed.
+
+        Parameters
+        ----------
+        video : str
+            The name of the video.
+        start_frame : int
+            The first frame of the clip.
+        end_frame : int
+            The last frame of the clip.
+        emb : np.ndarray | dict
+            The embedding (or a list of embeddings) of the clip, or the embedding of each output
+            of a multi-output encoder.
+        keyframes : list, optional
+            The index of the keyframe representing each frame, if the encoder skipped near-duplicate frames.
+        """
+        key = self._key(video, start_frame, end_frame)
+        file = self._file(key)
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+
+        # Write to a temporary file first, so readers never see a partial embedding
+        with open(file + '.tmp', 'wb') as fp:
+            if isinstance(emb, dict):
+                np.savez(fp, **emb)
+            else:
+                np.save(fp, np.asarray(emb))
+        os.replace(file + '.tmp', file)
+
+        with self._lock:
+            self._db.execute('INSERT INTO entries (key, model_name, fingerprint, size, last_access, keyframes) '
+                             'VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(key) DO UPDATE SET '
+                             'model_name = excluded.model_name, fingerprint = excluded.fingerprint, '
+                             'size = excluded.size, last_access = excluded.last_access, keyframes = excluded.keyframes',
+                             (key, self.model_name, self.fingerprint, os.path.getsize(file), time.time(),
+                              json.dumps([int(keyframe) for keyframe in keyframes]) if keyframes is not None else None))
+            self._evict()
+
+    def size(self) -> int:
+        """Returns the total size of the cached embeddings, in bytes.
+        """
+        total, = self._db.execute('SELECT size FROM totals').fetchone()
+        return total
+
+    def _evict(self):
+        total = self.size()
+        if total <= self.max_bytes:
+            return
+
+        evicted = []
+        for key, size in self._db.execute('SELECT key, size FROM entries ORDER BY last_access ASC').fetchall():
+            if total <= self.max_bytes:
+                break
+            evicted.append(key)
+            total -= size
+        self._remove(evicted)
+
+    def close(self):
+        print(f"[CACHE]: {self.hits} hits, {self.misses} misses")
+        self._db.close()
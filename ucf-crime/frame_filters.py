@@ -0,0 +1,139 @@
+import numpy as np
+
+possible_frame_filters = [
+    'difference',
+    'hash',
+]
+
+def _thumbnail(frame, height:int, width:int) -> np.ndarray:
+    # Grayscale frame averaged over a (height, width) grid of blocks
+    frame = np.asarray(frame)
+    gray = frame.mean(axis=2, dtype=np.float32) if frame.ndim == 3 else frame.astype(np.float32)
+    rows = (np.arange(height) * gray.shape[0]) // height
+    columns = (np.arange(width) * gray.shape[1]) // width
+    sums = np.add.reduceat(np.add.reduceat(gray, rows, axis=0), columns, axis=1)
+    counts = np.outer(np.diff(np.append(rows, gray.shape[0])), np.diff(np.append(columns, gray.shape[1])))
+    return sums / np.maximum(counts, 1)
+
+class FrameFilter:
+
+    def __init__(self):
+        raise NotImplementedError
+
+    def _signature(self, frame) -> np.ndarray:
+        """Returns a cheap summary of the frame, compared with those of the keyframes.
+        """
+        raise NotImplementedError
+
+    def _is_duplicate(self, signature:np.ndarray, keyframe_signature:np.ndarray) -> bool:
+        """Returns whether a frame is close enough to the last keyframe to be represented by it.
+        """
+        raise NotImplementedError
+
+    def keyframes(self, frames:list) -> np.ndarray:
+        """Selects the keyframes of a clip. The first frame is always a keyframe, and every other frame is
+        a keyframe if it differs enough from the last keyframe, which represents it otherwise.
+
+        Parameters
+        ----------
+        frames : list
+            The frames of the clip.
+
+        Returns
+        -------
+        np.ndarray
+            The index of the keyframe representing each frame, which is the frame itself for keyframes.
+        """
+        representatives = np.zeros(len(frames), dtype=np.int64)
+        keyframe, keyframe_signature = 0, None
+        for i, frame in enumerate(frames):
+            signature = self._signature(frame)
+            if keyframe_signature is None or not self._is_duplicate(signature, keyframe_signature):
+                keyframe, keyframe_signature = i, signature
+            representatives[i] = keyframe
+        return representatives
+
+    def get_params(self) -> dict:
+        """Returns the params of the filter, which change the embeddings of the encoders using it.
+        """
+        raise NotImplementedError
+
+class FrameDifferenceFilter(FrameFilter):
+
+    def __init__(self, threshold:float=None, size:int=16):
+        """Skips the frames whose downscaled grayscale version barely differs from that of the last keyframe.
+
+        Parameters
+        ----------
+        threshold : float, optional
+            Minimum mean absolute difference with the last keyframe, as a fraction of the pixel range, for
+            a frame to be a keyframe. By default, 0.01.
+        size : int, optional
+            Side of the downscaled frames, by default 16
+        """
+        self.threshold = 0.01 if threshold is None else threshold
+        self.size = size
+
+    def _signature(self, frame) -> np.ndarray:
+        return _thumbnail(frame, self.size, self.size) / 255
+
+    def _is_duplicate(self, signature:np.ndarray, keyframe_signature:np.ndarray) -> bool:
+        return np.abs(signature - keyframe_signature).mean() < self.threshold
+
+    def get_params(self) -> dict:
+        return {'name': 'difference', 'threshold': self.threshold, 'size': self.size}
+
+class HashFilter(FrameFilter):
+
+    def __init__(self, threshold:float=None, hash_size:int=8):
+        """Skips the frames whose perceptual hash (difference hash: whether each block of the downscaled
+        grayscale frame is brighter than the next one in its row) is close to that of the last keyframe.
+
+        Parameters
+        ----------
+        threshold : float, optional
+            Minimum number of different bits with the hash of the last keyframe for a frame to be a
+            keyframe. By default, 4.
+        hash_size : int, optional
+            Side of the hash, which has hash_size**2 bits, by default 8
+        """
+        self.threshold = 4 if threshold is None else threshold
+        self.hash_size = hash_size
+
+    def _signature(self, frame) -> np.ndarray:
+        thumbnail = _thumbnail(frame, self.hash_size, self.hash_size + 1)
+        return thumbnail[:, 1:] > thumbnail[:, :-1]
+
+    def _is_duplicate(self, signature:np.ndarray, keyframe_signature:np.ndarray) -> bool:
+        return np.count_nonzero(signature != keyframe_signature) < self.threshold
+
+    def get_params(self) -> dict:
+        return {'name': 'hash', 'threshold': self.threshold, 'hash_size': self.hash_size}
+
+class FrameFilterBuilder:
+
+    def build(filter_name, *args, **kwargs) -> FrameFilter:
+        """Returns the frame filter's object corresponding to the specified name.
+
+        Parameters
+        ----------
+        filter_name : str
+            The name of the filter. Can be one of the specified in the \'frame_filters.possible_frame_filters\' variable.
+
+        Returns
+        -------
+        FrameFilter
+            The frame filter's object.
+
+        Raises
+        ------
+        TypeError
+            If the specified filter is not implemented.
+        """
+        match filter_name:
+            case 'difference':
+                return FrameDifferenceFilter(*args, **kwargs)
+            case 'hash':
+                return HashFilter(*args, **kwargs)
+            case _:
+                raise TypeError(f'TypeError: Frame filter {filter_name} not found among implemented. Please, use one of the following: {possible_frame_filters}.')
@@ -0,0 +1,318 @@
+# General
+import numpy as np
+import argparse
+import json
+import os
+import resource
+import subprocess
+import time
+import cv2
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+
+# My code
+from my_utils import UCA_JSON_FILES
+from video_readers import possible_decoders, sample_frame_indices, DecoderBuilder, sample_clips
+from vision_encoders import possible_models, possible_precisions, possible_compile_modes, EncoderBuilder, check_accuracy
+from frame_filters import possible_frame_filters
+from databases import possible_databases, LocalDatabase
+
+
+SYNTHETIC_CLASSES = ['Abuse', 'Burglary', 'Normal_Videos_']
+SYNTHETIC_PARAMS_FILE = 'synthetic.json'
+def make_synthetic_dataset(data_path:str, num_videos:int=6, duration_s:float=60., fps:int=30,
+                           width:int=320, height:int=240, clips_per_video:int=4, clip_s:float=14.,
+                           seed:int=0) -> dict:
+    """Generates a dataset laid out as the UCF Crime and UCA datasets: videos of moving noise inside
+    a folder per class, and the UCA JSON files with random annotations of them. If the dataset was
+    already generated with the same parameters, it is reused.
+
+    Parameters
+    ----------
+    data_path : str
+        Directory of the dataset. Videos are written to its 'videos' folder and annotations to its
+        'uca' folder.
+    num_videos : int, optional
+        Number of videos, spread among the classes and the train, val and test datasets, by default 6
+    duration_s : float, optional
+        Duration of each video in seconds, by default 60
+    fps : int, optional
+        Frames per second of the videos, by default 30
+    width : int, optional
+        Width of the videos, by default 320
+    height : int, optional
+        Height of the videos, by default 240
+    clips_per_video : int, optional
+        Number of annotations of each video, by default 4
+    clip_s : float, optional
+        Duration of each annotation in seconds, by default 14
+    seed : int, optional
+        Seed of the frames and the annotations, by default 0
+
+    Returns
+    -------
+    dict
+        The parameters of the dataset, the number of frames the ingestion reads from the videos
+        (decoded_frames) and the number of frames it samples from the clips (sampled_frames).
+    """
+    params = {'num_videos': num_videos, 'duration_s': duration_s, 'fps': fps, 'width': width, 'height': height,
+              'clips_per_video': clips_per_video, 'clip_s': clip_s, 'seed': seed}
+    params_path = os.path.join(data_path, SYNTHETIC_PARAMS_FILE)
+    if os.path.exists(params_path):
+        with open(params_path, 'r') as fp:
+            summary = json.load(fp)
+        if {key: summary[key] for key in params} == params:
+            return summary
+
+    rng = np.random.default_rng(seed)
+    video_frames = int(duration_s * fps)
+    base = rng.integers(0, 256, size=(height, width * 2, 3), dtype=np.uint8)
+
+    annotations = {dataset: {} for dataset in UCA_JSON_FILES}
+    decoded_frames = 0
+    sampled_frames = 0
+    for i in range(num_videos):
+        class_name = SYNTHETIC_CLASSES[i % len(SYNTHETIC_CLASSES)]
+        video = f'{class_name}{i:03d}_x264'
+        class_path = os.path.join(data_path, 'videos', class_name)
+        os.makedirs(class_path, exist_ok=True)
+
+        # Frames slide over a random image, so the codec has to encode motion
+        writer = cv2.VideoWriter(os.path.join(class_path, video + '.mp4'),
+                                 cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+        for frame_index in range(video_frames):
+            shift = frame_index % width
+            writer.write(base[:, shift:shift+width])
+        writer.release()
+
+        starts = np.sort(rng.uniform(0, max(duration_s - clip_s, 0), size=clips_per_video)).round(1)
+        timestamps = [[float(start), float(min(start + clip_s, duration_s))] for start in starts]
+        dataset = list(UCA_JSON_FILES)[i % len(UCA_JSON_FILES)]
+        annotations[dataset][video] = {
+            'duration': duration_s,
+            'timestamps': timestamps,
+            'sentences': [f'Synthetic event {j} of video {video}.' for j in range(clips_per_video)],
+        }
+
+        # Frames read until the end of the last clip, and frames sampled one per second of each clip
+        decoded_frames += min(video_frames, max(int(end * fps) for _, end in timestamps))
+        sampled_frames += sum(len(sample_frame_indices(int(start * fps), int(end * fps), fps))
+                              for start, end in timestamps)
+
+    uca_path = os.path.join(data_path, 'uca')
+    os.makedirs(uca_path, exist_ok=True)
+    for dataset, json_file in UCA_JSON_FILES.items():
+        with open(os.path.join(uca_path, json_file), 'w') as fp:
+            json.dump(annotations[dataset], fp)
+
+    summary = {**params,
+               'clips': num_videos * clips_per_video,
+               'decoded_frames': decoded_frames,
+               'sampled_frames': sampled_frames}
+    with open(params_path, 'w') as fp:
+        json.dump(summary, fp, indent=2)
+    return summary
+
+def git_revision() -> str:
+    """Returns the commit of the repository the benchmark is run from, marked as dirty if it has
+    uncommitted changes, or None if it is not a git repository.
+    """
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=cwd, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain'], cwd=cwd, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ('-dirty' if dirty else '')
+
+def _stored_rows(save_path:str) -> int:
+    # Rows of every collection of the local database
+    rows = 0
+    if not os.path.isdir(save_path):
+        return rows
+    for collection_name in os.listdir(save_path):
+        vectors, _ = LocalDatabase.load_collection(os.path.join(save_path, collection_name))
+        rows += len(vectors)
+    return rows
+
+def _synthetic_clips(data_path:str, size:int=None, num_clips:int=4, clip_s:int=8) -> list:
+    # Frames sampled once per second from the first seconds of the first synthetic video
+    class_path = os.path.join(data_path, 'videos', SYNTHETIC_CLASSES[0])
+    video_path = os.path.join(class_path, sorted(os.listdir(class_path))[0])
+    decoder = DecoderBuilder.build('opencv', video_path, size)
+    fps = int(decoder.fps)
+    frame_ranges = [(i * clip_s * fps, (i + 1) * clip_s * fps) for i in range(num_clips)]
+    clips = [clip_frames for _, clip_frames in sorted(sample_clips(decoder, frame_ranges, fps), key=lambda clip: clip[0])]
+    decoder.release()
+    return [clip_frames for clip_frames in clips if len(clip_frames)]
+
+def _run_ingestion(data_path:str, encoder:str, database:str, db_path:str, **pipeline_params) -> dict:
+    # Runs in its own process, so the peak RSS only accounts for this ingestion
+    from ucf_encoding import uca_encode
+    from model_manager import model_manager
+
+    start = time.perf_counter()
+    stats = uca_encode(os.path.join(data_path, 'videos'), os.path.join(data_path, 'uca'), None, encoder, database,
+                       progress=lambda *args: None,
+                       database_kwargs={'save_path': db_path} if database == 'local' else None,
+                       **pipeline_params)
+    wall_time = time.perf_counter() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    # Compare the embeddings of the optimized encoder with those of the default (fp32) one
+    accuracy = None
+    encoder_kwargs = pipeline_params.get('encoder_kwargs')
+    if encoder_kwargs:
+        model = model_manager.get(encoder, **encoder_kwargs)
+        clips = _synthetic_clips(data_path, model.get_input_size())
+        reference = EncoderBuilder.build(encoder, **{name: value for name, value in encoder_kwargs.items() if name == 'device'})
+        accuracy = check_accuracy(model, reference, clips)
+
+    return {
+        'wall_s': wall_time,
+        'stages': {name: {'count': stage_stats.count, 'busy_s': stage_stats.busy_time}
+                   for name, stage_stats in stats.items()},
+        'stored_rows': _stored_rows(db_path) if database == 'local' else None,
+        'peak_rss_mb': peak_rss,
+        'accuracy': accuracy,
+    }
+
+def benchmark_ingestion(data_path:str, synthetic:dict, encoder:str, database:str, db_path:str, **pipeline_params) -> dict:
+    """Ingests the synthetic dataset in a fresh process and reports the throughput of each stage.
+
+    Parameters
+    ----------
+    data_path : str
+        Directory of the synthetic dataset.
+    synthetic : dict
+        The summary of the synthetic dataset, as returned by make_synthetic_dataset.
+    encoder : str
+        The name of the encoder.
+    database : str
+        The name of the database.
+    db_path : str
+        Directory of the collections, if the database is local.
+
+    Returns
+    -------
+    dict
+        The configuration, the wall time, the decoded frames per second, the encoded frames per second,
+        the uploaded rows per second and the peak RSS of the ingestion.
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context('spawn')) as executor:
+        run = executor.submit(_run_ingestion, data_path, encoder, database, db_path, **pipeline_params).result()
+
+    stages = run['stages']
+    decode_s, encode_s, write_s = (stages[name]['busy_s'] for name in ('decode', 'encode', 'write'))
+    encoded_frames = synthetic['sampled_frames'] * stages['encode']['count'] / max(synthetic['clips'], 1)
+    # The handler's writes, including the final flush, rather than the upload stage, which only buffers the rows
+    uploaded_rows = stages['write']['count']
+    return {
+        'encoder': encoder,
+        'database': database,
+        **{key: value for key, value in pipeline_params.items()},
+        'wall_s': run['wall_s'],
+        'clips_per_s': synthetic['clips'] / run['wall_s'] if run['wall_s'] > 0 else 0.,
+        'decode_fps': synthetic['decoded_frames'] / decode_s if decode_s > 0 else 0.,
+        'encode_frames_per_s': encoded_frames / encode_s if encode_s > 0 else 0.,
+        'upload_rows_per_s': uploaded_rows / write_s if write_s > 0 else 0.,
+        'stored_rows': run['stored_rows'],
+        'peak_rss_mb': run['peak_rss_mb'],
+        'accuracy': run['accuracy'],
+        'stages': stages,
+    }
+
+def ingestion_benchmark(data_path, encoders, databases, synthetic_params=None, pipeline_params=None, output=None) -> dict:
+    """Generates (or reuses) the synthetic dataset and benchmarks its ingestion with each encoder
+    and database.
+
+    Returns
+    -------
+    dict
+        The commit, the synthetic dataset and the results of each encoder and database.
+    """
+    synthetic = make_synthetic_dataset(data_path, **(synthetic_params or {}))
+    print(f"[BENCH]: Synthetic dataset with {synthetic['num_videos']} videos and {synthetic['clips']} clips")
+
+    results = []
+    for encoder in encoders:
+        for database in databases:
+            db_path = os.path.join(data_path, 'collections', f'{encoder}-{database}')
+            try:
+                result = benchmark_ingestion(data_path, synthetic, encoder, database, db_path, **(pipeline_params or {}))
+            except Exception as e:
+                print(f'[BENCH]: Could not benchmark {encoder} on {database}. {e}')
+                continue
+            print(f"[BENCH]: {encoder} on {database}: {result['clips_per_s']:.2f} clips/s, "
+                  f"decode {result['decode_fps']:.2f} fps, encode {result['encode_frames_per_s']:.2f} frames/s, "
+                  f"upload {result['upload_rows_per_s']:.2f} rows/s, peak RSS {result['peak_rss_mb']:.1f} MiB")
+            results.append(result)
+
+    report = {
+        'git_commit': git_revision(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'synthetic': synthetic,
+        'results': results,
+    }
+    if output:
+        with open(output, 'w') as fp:
+            json.dump(report, fp, indent=2)
+    return report
+
+def get_args():
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--data-path', type=str, required=True, help='Directory where the synthetic dataset is generated')
+    parser.add_argument('--encoders', type=str, nargs='+', choices=possible_models, default=['default', 'random'], help='The encoders benchmarked')
+    parser.add_argument('--databases', type=str, nargs='+', choices=possible_databases, default=['local'], help='The databases benchmarked')
+    parser.add_argument('--num-videos', type=int, default=6, help='Number of synthetic videos')
+    parser.add_argument('--duration', type=float, default=60, help='Duration of each synthetic video in seconds')
+    parser.add_argument('--fps', type=int, default=30, help='Frames per second of the synthetic videos')
+    parser.add_argument('--width', type=int, default=320, help='Width of the synthetic videos')
+    parser.add_argument('--height', type=int, default=240, help='Height of the synthetic videos')
+    parser.add_argument('--clips-per-video', type=int, default=4, help='Number of annotations of each synthetic video')
+    parser.add_argument('--pipeline', action='store_true', help='Overlap decoding, encoding and uploading of the clips')
+    parser.add_argument('--decode-workers', type=int, default=2, help='Number of threads decoding videos in pipeline mode')
+    parser.add_argument('--encode-batch-size', type=int, default=1, help='Maximum number of clips encoded together in pipeline mode')
+    parser.add_argument('--decoder', type=str, choices=possible_decoders, default='opencv', help='The library used to decode the videos')
+    parser.add_argument('--model-resolution', action='store_true', help='Decode frames directly at the input resolution of the encoder')
+    parser.add_argument('--precision', type=str, choices=possible_precisions, help='Precision of the inference of a torch encoder (clip, vclip), checked against fp32')
+    parser.add_argument('--compile-mode', type=str, choices=possible_compile_modes, help='How the image encoder of a torch encoder (clip, vclip) is compiled')
+    parser.add_argument('--device', type=str, help='Device running a torch encoder (clip, vclip), e.g. cpu. If not specified, CUDA if available')
+    parser.add_argument('--frame-filter', type=str, choices=possible_frame_filters, help='Filter of a torch encoder (clip, vclip) skipping the frames that barely change, checked against encoding every frame')
+    parser.add_argument('--filter-threshold', type=float, help='Threshold of the frame filter. If not specified, the filter\'s default')
+    parser.add_argument('--threads', type=int, help='Number of intra-op threads of torch')
+    parser.add_argument('--output', type=str, help='JSON file where the results are saved')
+
+    return parser.parse_args()
+
+if __name__ == '__main__':
+
+    args = get_args()
+
+    synthetic_params = {
+        'num_videos': args.num_videos,
+        'duration_s': args.duration,
+        'fps': args.fps,
+        'width': args.width,
+        'height': args.height,
+        'clips_per_video': args.clips_per_video,
+    }
+    pipeline_params = {
+        'pipeline': args.pipeline,
+        'decode_workers': args.decode_workers,
+        'encode_batch_size': args.encode_batch_size,
+        'decoder': args.decoder,
+        'model_resolution': args.model_resolution,
+        'encoder_kwargs': {name: value for name, value in (('precision', args.precision),
+                                                           ('compile_mode', args.compile_mode),
+                                                           ('device', args.device),
+                                                           ('frame_filter', args.frame_filter),
+                                                           ('filter_threshold', args.filter_threshold)) if value is not None},
+        'num_threads': args.threads,
+    }
+    ingestion_benchmark(args.data_path, args.encoders, args.databases,
+                        synthetic_params=synthetic_params,
+                        pipeline_params=pipeline_params,
+                        output=args.output)
@@ -0,0 +1,218 @@
+import os
+
+import numpy as np
+
+from my_utils import distances
+
+possible_indexes = [
+    'exact',
+    'ivf',
+]
+
+def _check_distance(distance:str):
+    if distance not in distances:
+        raise TypeError(f'TypeError: Distance {distance} not supported. Please, use one of the following: {distances}.')
+
+def _prepare(vectors:np.ndarray, distance:str) -> np.ndarray:
+    # Cosine similarity is the dot product of the normalized vectors
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if distance == 'COS':
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+    return vectors
+
+def _merge_top_k(scores:np.ndarray, rows:np.ndarray, k:int) -> tuple:
+    # Keep the k highest scores of each query, sorted
+    if scores.shape[1] > k:
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(scores, top, axis=1)
+        rows = np.take_along_axis(rows, top, axis=1)
+    order = np.argsort(-scores, axis=1, kind='stable')
+    return np.take_along_axis(scores, order, axis=1), np.take_along_axis(rows, order, axis=1)
+
+def _pad(scores:np.ndarray, rows:np.ndarray, k:int) -> tuple:
+    missing = k - scores.shape[1]
+    if missing > 0:
+        scores = np.pad(scores, ((0, 0), (0, missing)), constant_values=-np.inf)
+        rows = np.pad(rows, ((0, 0), (0, missing)), constant_values=-1)
+    rows[scores == -np.inf] = -1
+    return scores, rows
+
+def exact_search(vectors:np.ndarray, queries:np.ndarray, distance:str='COS', k:int=10,
+                 valid_rows:np.ndarray=None, chunk_rows:int=65536) -> tuple:
+    """Returns the k rows of the matrix most similar to each query, comparing every query against
+    every row. The matrix is read in chunks, so it can be a memmap larger than the available memory.
+
+    Parameters
+    ----------
+    vectors : np.ndarray
+        The matrix with one embedding per row.
+    queries : np.ndarray
+        The query vectors, one per row.
+    distance : str, optional
+        The similarity used. Can be one of the specified in the \'my_utils.distances\' variable, by default 'COS'
+    k : int, optional
+        The number of results per query, by default 10
+    valid_rows : np.ndarray, optional
+        A boolean mask of the rows that can be returned. If not specified, every row can be returned.
+    chunk_rows : int, optional
+        Number of rows of the matrix compared at once, by default 65536
+
+    Returns
+    -------
+    tuple
+        Two (queries, k) arrays with the scores and the rows of the results, sorted from most to least
+        similar. Missing results have a score of -inf and a row of -1.
+    """
+    _check_distance(distance)
+    queries = _prepare(np.atleast_2d(queries), distance)
+    scores = np.empty((len(queries), 0), dtype=np.float32)
+    rows = np.empty((len(queries), 0), dtype=np.int64)
+
+    for start in range(0, len(vectors), chunk_rows):
+        chunk = _prepare(vectors[start:start+chunk_rows], distance)
+        chunk_scores = queries @ chunk.T
+        if valid_rows is not None:
+            chunk_scores[:, ~valid_rows[start:start+len(chunk)]] = -np.inf
+        chunk_rows_ids = np.broadcast_to(np.arange(start, start + len(chunk)), chunk_scores.shape)
+        scores, rows = _merge_top_k(np.concatenate([scores, chunk_scores], axis=1),
+                                    np.concatenate([rows, chunk_rows_ids], axis=1), k)
+
+    return _pad(scores, rows, k)
+
+class IVFIndex:
+
+    def __init__(self, distance:str='COS', nlist:int=None, nprobe:int=8, iterations:int=10,
+                 sample_rows:int=65536, seed:int=0):
+        """Approximate index that clusters the embeddings with k-means and, for each query, only
+        compares the rows of the nprobe clusters closest to it (inverted file index). Rows appended
+        to the matrix after the index was built are always compared, until the index is rebuilt.
+
+        Parameters
+        ----------
+        distance : str, optional
+            The similarity used. Can be one of the specified in the \'my_utils.distances\' variable, by default 'COS'
+        nlist : int, optional
+            The number of clusters. If not specified, four times the square root of the number of rows.
+        nprobe : int, optional
+            The number of clusters compared with each query, by default 8
+        iterations : int, optional
+            Number of k-means iterations, by default 10
+        sample_rows : int, optional
+            Maximum number of rows used to train the clusters, by default 65536
+        seed : int, optional
+            Seed of the sampling and initialization of the clusters, by default 0
+        """
+        _check_distance(distance)
+        self.distance = distance
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.iterations = iterations
+        self.sample_rows = sample_rows
+        self.seed = seed
+
+        self.count = 0
+        self.centroids = None
+        self.list_rows = None
+        self.list_offsets = None
+
+    def _assign(self, vectors:np.ndarray) -> np.ndarray:
+        return np.argmax(_prepare(vectors, 'COS') @ self.centroids.T, axis=1)
+
+    def build(self, vectors:np.ndarray, chunk_rows:int=65536):
+        """Clusters the rows of the matrix and builds the inverted lists.
+
+        Parameters
+        ----------
+        vectors : np.ndarray
+            The matrix with one embedding per row.
+        chunk_rows : int, optional
+            Number of rows of the matrix assigned to their cluster at once, by default 65536
+        """
+        self.count = len(vectors)
+        if self.count == 0:
+            self.centroids = np.empty((0, vectors.shape[1]), dtype=np.float32)
+            self.list_rows = np.empty(0, dtype=np.int64)
+            self.list_offsets = np.zeros(1, dtype=np.int64)
+            return
+
+        # Spherical k-means over a sample of the rows
+        rng = np.random.default_rng(self.seed)
+        sample = np.sort(rng.choice(self.count, size=min(self.sample_rows, self.count), replace=False))
+        sample = _prepare(vectors[sample], 'COS')
+        nlist = min(self.nlist or max(1, int(4 * np.sqrt(self.count))), len(sample))
+        self.centroids = sample[rng.choice(len(sample), size=nlist, replace=False)]
+        for _ in range(self.iterations):
+            assignment = self._assign(sample)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, assignment, sample)
+            empty = np.bincount(assignment, minlength=nlist) == 0
+            sums[empty] = self.centroids[empty]
+            self.centroids = _prepare(sums, 'COS')
+
+        # Inverted lists, stored as the rows sorted by cluster and the offset of each cluster
+        assignment = np.concatenate([self._assign(vectors[start:start+chunk_rows])
+                                     for start in range(0, self.count, chunk_rows)])
+        self.list_rows = np.argsort(assignment, kind='stable')
+        self.list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=nlist))])
+
+    def search(self, vectors:np.ndarray, queries:np.ndarray, k:int=10, valid_rows:np.ndarray=None) -> tuple:
+        """Returns the k rows of the matrix most similar to each query, among the rows of the clusters
+        closest to it.
+
+        Parameters
+        ----------
+        vectors : np.ndarray
+            The matrix with one embedding per row, whose first rows were used to build the index.
+        queries : np.ndarray
+            The query vectors, one per row.
+        k : int, optional
+            The number of results per query, by default 10
+        valid_rows : np.ndarray, optional
+            A boolean mask of the rows that can be returned. If not specified, every row can be returned.
+
+        Returns
+        -------
+        tuple
+            Two (queries, k) arrays with the scores and the rows of the results, sorted from most to least
+            similar. Missing results have a score of -inf and a row of -1.
+        """
+        queries = _prepare(np.atleast_2d(queries), self.distance)
+        new_rows = np.arange(self.count, len(vectors))
+        nprobe = min(self.nprobe, len(self.centroids))
+        probes = np.argsort(-(_prepare(queries, 'COS') @ self.centroids.T), axis=1)[:, :nprobe]
+
+        all_scores, all_rows = [], []
+        for query, query_probes in zip(queries, probes):
+            candidates = np.concatenate([self.list_rows[self.list_offsets[probe]:self.list_offsets[probe+1]]
+                                         for probe in query_probes] + [new_rows])
+            candidates.sort() # Sequential reads of the memmap
+            if valid_rows is not None:
+                candidates = candidates[valid_rows[candidates]]
+            scores = _prepare(vectors[candidates], self.distance) @ query
+            scores, rows = _merge_top_k(scores[None], candidates[None], k)
+            scores, rows = _pad(scores, rows, k)
+            all_scores.append(scores[0])
+            all_rows.append(rows[0])
+
+        return np.array(all_scores, dtype=np.float32).reshape(len(queries), k), \
+               np.array(all_rows, dtype=np.int64).reshape(len(queries), k)
+
+    def save(self, index_path:str):
+        """Saves the index to a .npz file, replacing any previous index atomically.
+        """
+        with open(index_path + '.tmp', 'wb') as fp:
+            np.savez(fp, distance=self.distance, nprobe=self.nprobe, count=self.count,
+                     centroids=self.centroids, list_rows=self.list_rows, list_offsets=self.list_offsets)
+        os.replace(index_path + '.tmp', index_path)
+
+    def load(index_path:str) -> 'IVFIndex':
+        """Loads an index saved with IVFIndex.save.
+        """
+        with np.load(index_path) as data:
+            index = IVFIndex(str(data['distance']), nprobe=int(data['nprobe']))
+            index.count = int(data['count'])
+            index.centroids = data['centroids']
+            index.list_rows = data['list_rows']
+            index.list_offsets = data['list_offsets']
+        index.nlist = len(index.centroids)
+        return index
@@ -0,0 +1,225 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds of the buckets of the histograms, in seconds, from 1 ms to 1 min
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10., 30., 60.)
+
+class Histogram:
+
+    def __init__(self, name:str, help:str='', buckets:tuple=DEFAULT_BUCKETS):
+        """Distribution of the observed values, counted in cumulative buckets as Prometheus does.
+
+        Parameters
+        ----------
+        name : str
+            The name of the metric.
+        help : str, optional
+            The description of the metric, by default ''
+        buckets : tuple, optional
+            The sorted upper bounds of the buckets, by default from 1 ms to 1 min
+        """
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.bucket_counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.
+        self._lock = threading.Lock()
+
+    def observe(self, value:float):
+        """Records a value.
+        """
+        with self._lock:
+            self.count += 1
+            self.sum += value
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.bucket_counts[i] += 1
+                    break
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {'count': self.count, 'sum': self.sum, 'buckets': dict(zip(self.buckets, self.bucket_counts))}
+
+    def to_prometheus(self) -> str:
+        with self._lock:
+            lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, self.bucket_counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+            lines.append(f'{self.name}_sum {self.sum}')
+            lines.append(f'{self.name}_count {self.count}')
+        return '\n'.join(lines)
+
+class Counter:
+
+    def __init__(self, name:str, help:str=''):
+        """Monotonically increasing count (e.g. of frames or rows).
+
+        Parameters
+        ----------
+        name : str
+            The name of the metric.
+        help : str, optional
+            The description of the metric, by default ''
+        """
+        self.name = name
+        self.help = help
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount:float=1):
+        """Increases the count.
+        """
+        with self._lock:
+            self.value += amount
+
+    def to_dict(self) -> dict:
+        return {'value': self.value}
+
+    def to_prometheus(self) -> str:
+        return '\n'.join([f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter', f'{self.name} {self.value}'])
+
+class MetricsRegistry:
+
+    def __init__(self, prefix:str='ucf_'):
+        """Collects the metrics of the process, which are created the first time they are requested.
+
+        Parameters
+        ----------
+        prefix : str, optional
+            Prefix of the name of every metric, by default 'ucf_'
+        """
+        self.prefix = prefix
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, metric_class, name:str, help:str, **kwargs):
+        name = self.prefix + name
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = metric_class(name, help, **kwargs)
+            return self._metrics[name]
+
+    def histogram(self, name:str, help:str='', buckets:tuple=DEFAULT_BUCKETS) -> Histogram:
+        """Returns the histogram with the given name, creating it if needed.
+        """
+        return self._get(Histogram, name, help, buckets=buckets)
+
+    def counter(self, name:str, help:str='') -> Counter:
+        """Returns the counter with the given name, creating it if needed.
+        """
+        return self._get(Counter, name, help)
+
+    @contextmanager
+    def timer(self, name:str, help:str=''):
+        """Observes the seconds spent inside the context in the histogram with the given name.
+        """
+        histogram = self.histogram(name, help)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            histogram.observe(time.perf_counter() - start)
+
+    def to_dict(self) -> dict:
+        """Returns a snapshot of every metric.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.to_dict() for metric in metrics}
+
+    def to_prometheus(self) -> str:
+        """Returns every metric in Prometheus' text exposition format.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(metric.to_prometheus() for metric in metrics) + '\n'
+
+# Metrics of the current process
+metrics = MetricsRegistry()
+
+def serve_metrics(port:int, registry:MetricsRegistry=metrics) -> ThreadingHTTPServer:
+    """Serves the metrics in Prometheus' text format at http://0.0.0.0:<port>/metrics, from a
+    background thread.
+
+    Parameters
+    ----------
+    port : int
+        The port of the endpoint.
+    registry : MetricsRegistry, optional
+        The served metrics, by default those of the current process
+
+    Returns
+    -------
+    ThreadingHTTPServer
+        The server, which can be stopped with its shutdown method.
+    """
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.to_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args): # Do not print every scrape
+            pass
+
+    server = ThreadingHTTPServer(('0.0.0.0', port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f'[METRICS]: Serving metrics at http://0.0.0.0:{port}/metrics')
+    return server
+
+class JsonMetricsLogger:
+
+    def __init__(self, log_path:str, interval:float=10., registry:MetricsRegistry=metrics):
+        """Appends a snapshot of the metrics to a JSON lines file periodically, from a background
+        thread, and once more when stopped.
+
+        Parameters
+        ----------
+        log_path : str
+            The path of the JSON lines file.
+        interval : float, optional
+            Seconds between two snapshots, by default 10
+        registry : MetricsRegistry, optional
+            The logged metrics, by default those of the current process
+        """
+        self.log_path = log_path
+        self.interval = interval
+        self.registry = registry
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _log(self):
+        with open(self.log_path, 'a') as fp:
+            fp.write(json.dumps({'time': time.time(), 'metrics': self.registry.to_dict()}) + '\n')
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._log()
+
+    def start(self) -> 'JsonMetricsLogger':
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._log()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
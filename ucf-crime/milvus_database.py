@@ -0,0 +1,205 @@
+import numpy as np
+import json
+import time
+
+# Utils
+from my_utils import stable_frame_id
+from databases import DatabaseHandler, _as_queries, _filter_conditions
+from env import *
+
+# Milvus
+from pymilvus import MilvusClient, DataType, Collection, connections
+
+class MilvusDatabase(DatabaseHandler):
+
+    def __init__(self, encoder_params:dict,
+                 host:str=DATABASE_HOST,
+                 port:int=MILVUS_PORT,
+                 rewrite:bool=True,
+                 token:str='root:Milvus',
+                 dtype:str=None,
+                 buffer_rows:int=1024,
+                 buffer_bytes:int=64*2**20,
+                 buffer_delay:float=5.,
+                 insert_batch_size:int=5000,
+                 index_type:str='AUTOINDEX'):
+        """Milvus Database handler.
+
+        Parameters
+        ----------
+        encoder_params : dict
+            The parameters defined by the encoder.
+        host : str, optional
+            The host where the database is running, by default 'localhost'
+        port : int, optional
+            The port where the database is running, by default 19530
+        rewrite : bool, optional
+            Whether to delete any previous collection with the same name, by default True
+        token : _type_, optional
+            Token to acces Milvus database, by default 'root:Milvus'
+        dtype : str, optional
+            The type of the stored embeddings, 'float32' or 'float16'. If not specified, the type of the
+            encoder's embeddings.
+        buffer_rows : int, optional
+            Maximum number of buffered rows before they are uploaded, by default 1024
+        buffer_bytes : int, optional
+            Maximum size of the buffered embeddings before they are uploaded, by default 64 MiB
+        buffer_delay : float, optional
+            Maximum seconds since the last upload before buffered rows are uploaded, by default 5
+        insert_batch_size : int, optional
+            Maximum number of rows sent in a single insert request, by default 5000
+        index_type : str, optional
+            The type of the index of the embeddings, by default 'AUTOINDEX'. Milvus Lite only supports 'FLAT'
+            for float16 embeddings.
+        """
+        
+        # Get encoder params
+        self.encoder_name = encoder_params['model_name']
+        self.emb_size = encoder_params['embedding_size']
+        self.emb_list = encoder_params['embedding_list']
+        self.dtype = np.dtype(dtype or encoder_params.get('dtype', 'float32'))
+        
+        # Connect client, and an ORM connection for the column-based inserts
+        self.client = MilvusClient(uri=f'http://{host}:{port}', token=token)
+        self.alias = f'ucf-{id(self)}'
+        connections.connect(alias=self.alias, uri=f'http://{host}:{port}', token=token)
+
+        # Name the collection
+        collection_name = f'ucf{self.encoder_name}'
+
+        # Check if collection exists
+        if (not self.client.has_collection(collection_name=collection_name)) or rewrite:
+            
+            # Drop collection
+            self.client.drop_collection(collection_name=collection_name)
+            
+            # Create collection, with the metadata of the clips in a JSON field so the rows can be inserted by
+            # columns (which fails on collections with dynamic fields)
+            schema = MilvusClient.create_schema(auto_id=False, enable_dynamic_field=False)
+            schema.add_field(field_name='id', datatype=DataType.INT64, is_primary=True)
+            schema.add_field(field_name='vector',
+                             datatype=DataType.FLOAT16_VECTOR if self.dtype == np.float16 else DataType.FLOAT_VECTOR,
+                             dim=self.emb_size)
+            if self.emb_list:
+                schema.add_field(field_name='clip_id', datatype=DataType.INT64)
+                schema.add_field(field_name='frame', datatype=DataType.INT64)
+            schema.add_field(field_name='metadata', datatype=DataType.JSON)
+            index_params = self.client.prepare_index_params()
+            index_params.add_index(field_name='vector', index_type=index_type, metric_type='COSINE')
+            self.client.create_collection(
+                collection_name=collection_name,
+                schema=schema,
+                index_params=index_params,
+                timeout=None
+            )
+
+        # Collections created before the metadata field keep it in dynamic fields, inserted by rows
+        fields = [field['name'] for field in self.client.describe_collection(collection_name=collection_name)['fields']]
+        self.columns = 'metadata' in fields
+        self.output_fields = [field for field in fields if field not in ('id', 'vector')] if self.columns else ['*']
+        
+        self.collection_name = collection_name
+        self.collection = Collection(collection_name, using=self.alias)
+        self.insert_batch_size = insert_batch_size
+
+        self._init_buffer(buffer_rows, buffer_bytes, buffer_delay)
+
+    def close(self):
+        self.flush()
+        self._report()
+        self.client.close()
+        connections.disconnect(self.alias)
+
+    def _write(self, entries:list):
+        """Upload the embeddings to the database.
+
+        Parameters
+        ----------
+        entries : list
+            A list of (id, emb, metadata) tuples.
+        """
+        if not self.columns:
+            self._write_rows(entries)
+            return
+
+        # Stable ids make uploads idempotent, so clips can be uploaded again when resuming
+        ids, vectors, clip_ids, frames, metadatas = [], [], [], [], []
+        for id, emb, metadata in entries:
+            if self.emb_list:
+                ids.extend(stable_frame_id(id, i) for i in range(len(emb)))
+                clip_ids.extend([id] * len(emb))
+                frames.extend(range(len(emb)))
+                metadatas.extend([metadata] * len(emb)) # The frames of a clip share its metadata dict
+                vectors.append(np.asarray(emb, dtype=self.dtype))
+            else:
+                ids.append(id)
+                metadatas.append(metadata)
+                vectors.append(np.asarray(emb, dtype=self.dtype)[None])
+        vectors = np.concatenate(vectors)
+
+        for start in range(0, len(ids), self.insert_batch_size):
+            end = start + self.insert_batch_size
+            # Float16 vectors are sent as the bytes of each row, float32 ones as a single matrix
+            batch_vectors = list(vectors[start:end]) if self.dtype == np.float16 else vectors[start:end]
+            columns = [ids[start:end], batch_vectors]
+            if self.emb_list:
+                columns += [clip_ids[start:end], frames[start:end]]
+            self.collection.upsert(columns + [metadatas[start:end]])
+
+    def _write_rows(self, entries:list):
+        data = []
+        for id, emb, metadata in entries:
+            emb = np.asarray(emb, dtype=self.dtype)
+            if self.emb_list:
+                data.extend({'id':stable_frame_id(id, i), 'vector':vector, **metadata, 'clip_id':id, 'frame':i}
+                            for i, vector in enumerate(emb))
+            else:
+                data.append({'id':id, 'vector':emb, **metadata})
+
+        for start in range(0, len(data), self.insert_batch_size):
+            self.client.upsert(collection_name=self.collection_name,
+                               data=data[start:start+self.insert_batch_size])
+
+    def build_index(self):
+        self.flush()
+
+        # Seal the inserted rows and wait until they are indexed
+        self.collection.flush()
+        for index_name in self.client.list_indexes(collection_name=self.collection_name):
+            while True:
+                index = self.client.describe_index(collection_name=self.collection_name, index_name=index_name)
+                if index.get('pending_index_rows', 0) == 0:
+                    break
+                time.sleep(0.5)
+        self.client.load_collection(collection_name=self.collection_name)
+
+    def _filter_expression(self, filter:dict) -> str:
+        # Milvus boolean expression, e.g. 'metadata["class_name"] in ["Abuse"] and metadata["anomaly"] in [true]'
+        return ' and '.join(f'{self._field(field)} in {json.dumps(values)}' for field, values in _filter_conditions(filter))
+
+    def _field(self, field:str) -> str:
+        if not self.columns or field in ('id', 'clip_id', 'frame'):
+            return field
+        return f'metadata[{json.dumps(field)}]'
+
+    def _metadata(self, entity:dict) -> dict:
+        # Flattens the metadata field, so the results are the same as with dynamic fields
+        metadata = {field: value for field, value in entity.items() if field not in ('id', 'vector', 'metadata')}
+        return {**entity.get('metadata', {}), **metadata}
+
+    def search(self, query_vectors:np.ndarray, k:int=10, filter:dict=None) -> list:
+        self.flush()
+
+        # Float16 collections are queried with float16 NumPy arrays
+        queries = _as_queries(query_vectors)
+        data = list(queries.astype(np.float16)) if self.dtype == np.float16 else queries.tolist()
+        results = self.client.search(collection_name=self.collection_name,
+                                     data=data,
+                                     limit=k,
+                                     filter=self._filter_expression(filter),
+                                     output_fields=self.output_fields)
+        return [[{'id': hit['id'],
+                  'score': hit['distance'],
+                  'metadata': self._metadata(hit['entity'])}
+                 for hit in hits]
+                for hits in results]
@@ -0,0 +1,67 @@
+import threading
+
+from vision_encoders import EmbeddingModel, EncoderBuilder
+
+class ModelManager:
+
+    def __init__(self):
+        """Keeps the encoders of the process warm, so encoders built again with the same arguments
+        (e.g. by consecutive ingestions) reuse the already loaded weights instead of loading them again.
+        """
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def _key(self, encoder_name:str, args:tuple, kwargs:dict) -> tuple:
+        return encoder_name, repr(args), repr(sorted(kwargs.items()))
+
+    def get(self, encoder_name:str, *args, **kwargs) -> EmbeddingModel:
+        """Returns the warm encoder built with the given arguments, building it if needed.
+
+        Parameters
+        ----------
+        encoder_name : str
+            The name of the encoder. Can be one of the specified in the \'vision_encoders.possible_models\' variable.
+
+        Returns
+        -------
+        EmbeddingModel
+            The encoder's object.
+        """
+        key = self._key(encoder_name, args, kwargs)
+        with self._lock:
+            if key not in self._models:
+                self._models[key] = EncoderBuilder.build(encoder_name, *args, **kwargs)
+            return self._models[key]
+
+    def is_loaded(self, encoder_name:str, *args, **kwargs) -> bool:
+        """Returns whether the encoder built with the given arguments is warm.
+        """
+        return self._key(encoder_name, args, kwargs) in self._models
+
+    def share_memory(self):
+        """Moves the weights of every warm encoder to shared memory, so worker processes forked
+        afterwards use them read-only instead of each one holding its own copy.
+        """
+        with self._lock:
+            for model in self._models.values():
+                model.share_memory()
+
+    def unload(self, encoder_name:str, *args, **kwargs):
+        """Frees the memory of the encoder built with the given arguments, if it is warm.
+        """
+        with self._lock:
+            model = self._models.pop(self._key(encoder_name, args, kwargs), None)
+        if model is not None:
+            model.unload()
+
+    def unload_all(self):
+        """Frees the memory of every warm encoder.
+        """
+        with self._lock:
+            models = list(self._models.values())
+            self._models = {}
+        for model in models:
+            model.unload()
+
+# Warm encoders of the current process
+model_manager = ModelManager()
@@ -1,6 +1,9 @@
 import json
+import hashlib
+import warnings
+import numpy as np
 import pandas as pd
-from os.path import join
+from os.path import join, exists, getmtime
 
 distances = ['DOT', 'COS']
 
@@ -9,65 +12,227 @@ def read_json(json_path:str, json_file:str) -> dict:
         data = json.load(fp)
     return data
 
-def read_uca_as_df(uca_path:str='/media/pablo/358690d7-e500-45fb-b8f8-bc48c6be13e3/Surveillance-Video-Understanding/UCF Annotation/json') -> pd.DataFrame:
+UCA_JSON_FILES = {
+    'train': 'UCFCrime_Train.json',
+    'val': 'UCFCrime_Val.json',
+    'test': 'UCFCrime_Test.json',
+}
+
+def _read_uca_cache(cache_path:str, uca_path:str) -> pd.DataFrame:
+    # Only use the cached table if it is newer than every JSON file
+    if not exists(cache_path):
+        return None
+    if any(getmtime(join(uca_path, json_file)) > getmtime(cache_path) for json_file in UCA_JSON_FILES.values()):
+        return None
+    try:
+        if cache_path.endswith('.feather'):
+            df = pd.read_feather(cache_path)
+        else:
+            df = pd.read_parquet(cache_path)
+    except (ImportError, OSError, ValueError) as e: # Parquet and Feather need pyarrow
+        warnings.warn(f'Could not read cached UCA dataset, parsing the JSON files again. {e}')
+        return None
+
+    # Timestamps are read back as arrays
+    df['timestamp'] = [timestamp.tolist() for timestamp in df['timestamp']]
+    return df
+
+def _write_uca_cache(df:pd.DataFrame, cache_path:str):
+    try:
+        if cache_path.endswith('.feather'):
+            df.to_feather(cache_path)
+        else:
+            df.to_parquet(cache_path)
+    except (ImportError, OSError, ValueError) as e: # Parquet and Feather need pyarrow
+        warnings.warn(f'Could not cache UCA dataset, following calls will parse the JSON files again. {e}')
+
+def read_uca_as_df(uca_path:str='/media/pablo/358690d7-e500-45fb-b8f8-bc48c6be13e3/Surveillance-Video-Understanding/UCF Annotation/json',
+                   cache_path:str=None) -> pd.DataFrame:
     """Get the UCA dataset as a Pandas DataFrame, properly pre-processed.
 
     Parameters
     ----------
     uca_path : str, optional
         Path to the JSON files of the UCA dataset, by default '/media/pablo/358690d7-e500-45fb-b8f8-bc48c6be13e3/Surveillance-Video-Understanding/UCF Annotation/json'
+    cache_path : str, optional
+        Path of a Parquet (or, if it ends with '.feather', Feather) file where the pre-processed dataset is
+        cached, so following calls skip parsing the JSON files. If not specified, the dataset is not cached.
 
     Returns
     -------
     pd.DataFrame
-        The UCA dataset as a Pandas DataFrame.
+        The UCA dataset as a Pandas DataFrame, with an entry per annotation. Besides the original columns,
+        it has the start and end second of each annotation (start_s, end_s) and its stable id (id).
     """
 
-    # Read three JSONs
-    train_set = read_json(uca_path, 'UCFCrime_Train.json')
-    val_set = read_json(uca_path, 'UCFCrime_Val.json')
-    test_set = read_json(uca_path, 'UCFCrime_Test.json')
-
-    # Transform each JSON into a Panda's Dataframe
-    train_df = pd.DataFrame(train_set).transpose()
-    train_df['video'] = train_df.index
-    train_df = train_df.reset_index(drop=True)
-    val_df = pd.DataFrame(val_set).transpose()
-    val_df['video'] = val_df.index
-    val_df = val_df.reset_index(drop=True)
-    test_df = pd.DataFrame(test_set).transpose()
-    test_df['video'] = test_df.index
-    test_df = test_df.reset_index(drop=True)
-
-    # Add a column specifying the dataset
-    train_df['dataset'] = 'train'
-    val_df['dataset'] = 'val'
-    test_df['dataset'] = 'test'
+    if cache_path:
+        df = _read_uca_cache(cache_path, uca_path)
+        if df is not None:
+            return df
+
+    # Read three JSONs and transform each one into a Panda's Dataframe
+    dfs = []
+    for dataset, json_file in UCA_JSON_FILES.items():
+        dataset_df = pd.DataFrame.from_dict(read_json(uca_path, json_file), orient='index')
+        dataset_df['video'] = dataset_df.index
+
+        # Add a column specifying the dataset
+        dataset_df['dataset'] = dataset
+        dfs.append(dataset_df.reset_index(drop=True))
 
     # Merge three dataframes together
-    df = pd.concat([train_df, val_df, test_df], ignore_index=True)
-    df = df.reset_index(drop=True)
+    df = pd.concat(dfs, ignore_index=True)
 
     # Make an entry per sentence
     df = df.explode(['sentences', 'timestamps']).reset_index(drop=True)
 
-    # Create clip duration column
-    df['clip_duration'] = df['timestamps'].apply(lambda x: x[1]-x[0])
-
     # Rename the columns
     df = df.rename(columns={'timestamps':'timestamp', 'sentences':'sentence', 'duration': 'video_duration'})
 
-    # Create class column
-    df['class_name'] = df['video'].apply(lambda x: x[:-8])
+    # Create start, end and clip duration columns
+    timestamps = np.array(df['timestamp'].tolist(), dtype=np.float64).reshape(-1, 2)
+    df['start_s'] = timestamps[:, 0]
+    df['end_s'] = timestamps[:, 1]
+    df['clip_duration'] = df['end_s'] - df['start_s']
+    df['video_duration'] = df['video_duration'].astype(np.float64)
 
-    # Rename one of the classes
-    df = df.replace('Normal_Videos_', 'Normal_Videos')
+    # Create class column, renaming one of the classes
+    df['class_name'] = df['video'].str[:-8].replace('Normal_Videos_', 'Normal_Videos')
 
     # Create anomaly column
-    df['anomaly'] = df['class_name'].apply(lambda x: False if x == 'Normal_Videos' else True)
+    df['anomaly'] = df['class_name'] != 'Normal_Videos'
 
     # Create sentence length column
-    df['sentence_length'] = df['sentence'].apply(lambda x: len(x))
+    df['sentence_length'] = df['sentence'].str.len()
+
+    # Create id column
+    df['id'] = [stable_clip_id(video, timestamp, sentence)
+                for video, timestamp, sentence in zip(df['video'], df['timestamp'], df['sentence'])]
+
+    # Use categories for repeated strings
+    df['class_name'] = df['class_name'].astype('category')
+    df['dataset'] = df['dataset'].astype('category')
+
+    if cache_path:
+        _write_uca_cache(df, cache_path)
 
     # Return dataframe
-    return df
\ No newline at end of file
+    return df
+
+def build_annotation_index(df:pd.DataFrame) -> dict:
+    """Groups the annotations of the UCA dataset by video.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        The UCA dataset, as returned by read_uca_as_df.
+
+    Returns
+    -------
+    dict
+        The annotations of each video, sorted by their start second.
+    """
+    df = df.sort_values(['video', 'start_s'], kind='stable')
+    return {video: sub_df for video, sub_df in df.groupby('video', sort=False)}
+
+def _stable_hash(key:str) -> int:
+    # Unlike hash(), it does not change between processes or machines
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big')
+
+def stable_clip_id(video:str, timestamp, sentence:str) -> int:
+    """Returns a globally unique id for an annotation of a video, which is the same regardless
+    of the process, machine or order in which the annotation is ingested.
+
+    Parameters
+    ----------
+    video : str
+        The name of the video, without extension.
+    timestamp : Any
+        The start and end seconds of the annotation.
+    sentence : str
+        The sentence of the annotation.
+
+    Returns
+    -------
+    int
+        A non-negative id that fits in a signed 64-bit integer.
+    """
+    return _stable_hash(f'{video}|{timestamp[0]}|{timestamp[1]}|{sentence}') & 0x7FFFFFFFFFFFFFFF
+
+def stable_frame_id(clip_id:int, frame:int) -> int:
+    """Returns a globally unique id for the embedding of a frame of a clip, which is the same
+    every time the clip is ingested.
+
+    Parameters
+    ----------
+    clip_id : int
+        The id of the clip.
+    frame : int
+        The index of the frame's embedding within the clip.
+
+    Returns
+    -------
+    int
+        A non-negative id that fits in a signed 64-bit integer.
+    """
+    return _stable_hash(f'{clip_id}|{frame}') & 0x7FFFFFFFFFFFFFFF
+
+def video_shard(video:str, num_shards:int) -> int:
+    """Returns the shard a video belongs to when the dataset is split in the given number of shards.
+
+    Parameters
+    ----------
+    video : str
+        The name of the video.
+    num_shards : int
+        The total number of shards.
+
+    Returns
+    -------
+    int
+        The index of the shard, between 0 and num_shards-1.
+    """
+    return _stable_hash(video) % num_shards
+
+def split_shard(shard:tuple, parts:int) -> list:
+    """Splits a shard into several sub-shards of a finer split of the dataset, such that every video of
+    a sub-shard belongs to the shard.
+
+    Parameters
+    ----------
+    shard : tuple
+        The index of the shard and the total number of shards.
+    parts : int
+        The number of sub-shards.
+
+    Returns
+    -------
+    list
+        The index and total number of shards of each sub-shard.
+    """
+    index, num_shards = shard
+    # hash % (num_shards*parts) == index + part*num_shards implies hash % num_shards == index
+    return [(index + part*num_shards, num_shards*parts) for part in range(parts)]
+
+def parse_shard(shard:str) -> tuple:
+    """Parses a shard given as 'i/N', being i the index of the shard and N the total number of shards.
+
+    Parameters
+    ----------
+    shard : str
+        The shard as 'i/N'.
+
+    Returns
+    -------
+    tuple
+        The index of the shard and the total number of shards.
+
+    Raises
+    ------
+    ValueError
+        If the shard is not properly formatted or the index is out of range.
+    """
+    index, num_shards = (int(i) for i in shard.split('/'))
+    if not 0 <= index < num_shards:
+        raise ValueError(f'ValueError: Shard index must be between 0 and {num_shards-1}, got {index}')
+    return index, num_shards
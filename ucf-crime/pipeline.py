@@ -0,0 +1,347 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from metrics import metrics
+
+# Marks the end of the items flowing through a queue
+_END = object()
+
+class StageStats:
+
+    def __init__(self, name:str, unit:str='clips'):
+        """Accumulates the number of items processed by a stage of the ingestion and the
+        time spent processing them.
+
+        Parameters
+        ----------
+        name : str
+            The name of the stage.
+        unit : str, optional
+            The unit of the processed items, by default 'clips'
+        """
+        self.name = name
+        self.unit = unit
+        self.count = 0
+        self.busy_time = 0.
+        self._lock = threading.Lock()
+
+        self._histogram = metrics.histogram(f'{name}_seconds', f'Time spent in each step of the {name} stage')
+        self._counter = metrics.counter(f'{name}_{unit}_total', f'{unit.capitalize()} processed by the {name} stage')
+
+    def add(self, count:int, elapsed:float, observe:bool=True):
+        """Records that the stage processed some items.
+
+        Parameters
+        ----------
+        count : int
+            The number of processed items.
+        elapsed : float
+            The time, in seconds, it took to process them.
+        observe : bool, optional
+            Whether to also record them in the metrics of the process, by default True. Stats merged
+            from other processes, which record their own metrics, must not be observed again.
+        """
+        with self._lock:
+            self.count += count
+            self.busy_time += elapsed
+        if observe:
+            self._histogram.observe(elapsed)
+            self._counter.inc(count)
+
+    def throughput(self) -> float:
+        """Returns the number of items processed per second of busy time.
+        """
+        return self.count / self.busy_time if self.busy_time > 0 else 0.
+
+    def __str__(self) -> str:
+        return f'{self.name}: {self.count} {self.unit} in {self.busy_time:.2f}s ({self.throughput():.2f} {self.unit}/s)'
+
+def new_stage_stats(write:bool=False) -> dict:
+    """Returns the stats of the decode, encode and upload stages of the ingestion.
+
+    Parameters
+    ----------
+    write : bool, optional
+        Whether to also return the stats of the writes to the database, by default False
+    """
+    stats = {
+        'decode': StageStats('decode'),
+        'encode': StageStats('encode'),
+        'upload': StageStats('upload'),
+    }
+    if write:
+        stats['write'] = StageStats('write', unit='rows')
+    return stats
+
+def database_write_stats(database_handler) -> StageStats:
+    """Returns the rows written by the database's handler and the time it spent writing them. Unlike
+    the upload stage, which only times the buffering of each clip, it accounts for the writes of the
+    buffered rows, including the last one when the handler is closed.
+
+    Parameters
+    ----------
+    database_handler : DatabaseHandler
+        The closed database's handler.
+
+    Returns
+    -------
+    StageStats
+        The stats of the writes to the database.
+    """
+    stats = StageStats('write', unit='rows')
+    # The handler already recorded its writes in the metrics of the process
+    stats.add(database_handler.written_rows, database_handler.write_time, observe=False)
+    return stats
+
+def save_embedding(save_path:str, metadata:dict, emb):
+    """Saves the embedding of a clip to a .npy file, or to a .npz file if it holds the embedding
+    of each output of a multi-output encoder.
+
+    Parameters
+    ----------
+    save_path : str
+        Directory where the embedding is saved.
+    metadata : dict
+        The metadata of the clip.
+    emb : np.ndarray | dict
+        The embedding of the clip.
+    """
+    np_file_name = metadata['video'] + '_' + str(metadata['start_frame']) + '-' + str(metadata['end_frame'])
+    if isinstance(emb, dict):
+        np.savez(os.path.join(save_path, np_file_name + '.npz'), **emb)
+    else:
+        np.save(os.path.join(save_path, np_file_name + '.npy'), emb)
+
+def encode_clips(model, clips:list, cache=None) -> tuple:
+    """Returns the embedding of each clip, only encoding those which were not found in the cache.
+
+    Parameters
+    ----------
+    model : EmbeddingModel
+        The encoder used to generate the embeddings of the clips.
+    clips : list
+        A list of (id, clip_frames, metadata, emb) tuples, emb being None unless it was cached.
+    cache : EmbeddingCache, optional
+        The cache where new embeddings are stored. If not specified, they are not cached.
+
+    Returns
+    -------
+    tuple
+        The embedding of each clip and the number of clips that were actually encoded. If the encoder
+        skipped near-duplicate frames of a clip, the keyframe representing each one of its frames is
+        recorded in its metadata as 'keyframes'.
+    """
+    embs = [emb for _, _, _, emb in clips]
+    missing = [i for i, emb in enumerate(embs) if emb is None]
+
+    if missing:
+        new_embs, new_keyframes = model.get_clips_embedding_and_keyframes([clips[i][1] for i in missing])
+    else:
+        new_embs, new_keyframes = [], []
+
+    for i, emb, keyframes in zip(missing, new_embs, new_keyframes):
+        embs[i] = emb
+        metadata = clips[i][2]
+        if keyframes is not None:
+            metadata['keyframes'] = [int(keyframe) for keyframe in keyframes]
+        if cache is not None:
+            cache.put(metadata['video'], metadata['start_frame'], metadata['end_frame'], emb, keyframes)
+
+    return embs, len(missing)
+
+class IngestionPipeline:
+
+    def __init__(self, model, database_handler,
+                 decode_workers:int=2,
+                 decode_queue_size:int=16,
+                 upload_queue_size:int=16,
+                 encode_batch_size:int=1,
+                 save_path:str=None,
+                 cache=None):
+        """Runs the ingestion as three overlapping stages connected by bounded queues: a pool of
+        decoder threads, a single encoder worker (the calling thread) and an uploader thread.
+        Whenever a queue is full, the stages feeding it block until there is room again.
+
+        Parameters
+        ----------
+        model : EmbeddingModel
+            The encoder used to generate the embeddings of the clips.
+        database_handler : DatabaseHandler
+            The handler of the database where embeddings are uploaded.
+        decode_workers : int, optional
+            Number of threads decoding videos, by default 2
+        decode_queue_size : int, optional
+            Maximum number of decoded clips waiting to be encoded, by default 16
+        upload_queue_size : int, optional
+            Maximum number of embeddings waiting to be uploaded, by default 16
+        encode_batch_size : int, optional
+            Maximum number of clips encoded together, by default 1
+        save_path : str, optional
+            Directory where embeddings are also saved as .npy files. If not specified, they are not saved.
+        cache : EmbeddingCache, optional
+            The cache where new embeddings are stored. If not specified, they are not cached.
+        """
+        self.model = model
+        self.database_handler = database_handler
+        self.decode_workers = decode_workers
+        self.encode_batch_size = encode_batch_size
+        self.save_path = save_path
+        self.cache = cache
+
+        self.decode_queue = queue.Queue(maxsize=decode_queue_size)
+        self.upload_queue = queue.Queue(maxsize=upload_queue_size)
+        self.stats = new_stage_stats()
+
+        self._abort = threading.Event()
+        self._error = None
+
+        # Jobs whose decoding failed, with their error
+        self.failed_jobs = []
+
+    def _put(self, q:queue.Queue, item):
+        # Block while the queue is full, unless the pipeline is being aborted
+        while not self._abort.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, q:queue.Queue):
+        # Block while the queue is empty, unless the pipeline is being aborted
+        while not self._abort.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _decode(self, job, decode_fn):
+        clips = iter(decode_fn(job))
+        while not self._abort.is_set():
+            start_decode = time.perf_counter()
+            clip = next(clips, _END)
+            end_decode = time.perf_counter()
+            if clip is _END:
+                break
+            self.stats['decode'].add(1, end_decode - start_decode)
+            self._put(self.decode_queue, clip)
+
+    def _feed(self, jobs, decode_fn):
+        with ThreadPoolExecutor(max_workers=self.decode_workers) as executor:
+            futures = [(job, executor.submit(self._decode, job, decode_fn)) for job in jobs]
+            for job, future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    # Its remaining clips are never written, so the journal does not mark them as completed
+                    metrics.counter('decode_failures_total', 'Jobs whose decoding failed').inc()
+                    self.failed_jobs.append((job[0], repr(e)))
+        self._put(self.decode_queue, _END)
+
+    def _encode(self):
+        finished = False
+        while not finished:
+
+            # Wait for one clip and take any other already decoded, up to the batch size
+            clip = self._get(self.decode_queue)
+            if clip is _END:
+                break
+            batch = [clip]
+            while len(batch) < self.encode_batch_size:
+                try:
+                    clip = self.decode_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if clip is _END:
+                    finished = True
+                    break
+                batch.append(clip)
+
+            # Get embeddings of the clips
+            start_emb = time.perf_counter()
+            embs, encoded = encode_clips(self.model, batch, self.cache)
+            end_emb = time.perf_counter()
+            emb_time = end_emb - start_emb
+            self.stats['encode'].add(encoded, emb_time)
+
+            for (id, _, metadata, _), emb in zip(batch, embs):
+                self._put(self.upload_queue, (id, emb, metadata))
+
+    def _upload(self, on_clip_done):
+        try:
+            while True:
+                item = self._get(self.upload_queue)
+                if item is _END:
+                    break
+                id, emb, metadata = item
+
+                # Save embedding to file (if specified)
+                if self.save_path:
+                    save_embedding(self.save_path, metadata, emb)
+
+                # Upload embedding to database
+                start_upload = time.perf_counter()
+                self.database_handler.add(id, emb, metadata=metadata)
+                end_upload = time.perf_counter()
+                upload_time = end_upload - start_upload
+                self.stats['upload'].add(1, upload_time)
+
+                if on_clip_done is not None:
+                    on_clip_done()
+        except BaseException as e:
+            self._error = e
+            self._abort.set()
+
+    def run(self, jobs:list, decode_fn, on_clip_done=None) -> dict:
+        """Runs the pipeline until every job has been decoded, encoded and uploaded.
+
+        Parameters
+        ----------
+        jobs : list
+            The decoding jobs. The first element of each job must identify it (e.g. the video path).
+        decode_fn : Callable
+            Function that receives a job and yields (id, clip_frames, metadata, emb) tuples, emb
+            being None unless it was cached.
+        on_clip_done : Callable, optional
+            Function called without arguments after each clip is uploaded.
+
+        Returns
+        -------
+        dict
+            The StageStats of the decode, encode and upload stages.
+
+        Raises
+        ------
+        Exception
+            Any exception raised while encoding or uploading. Jobs whose decoding fails are skipped
+            instead, and listed in failed_jobs.
+        """
+        self._abort.clear()
+        self._error = None
+        self.failed_jobs = []
+
+        feeder = threading.Thread(target=self._feed, args=(jobs, decode_fn), daemon=True)
+        uploader = threading.Thread(target=self._upload, args=(on_clip_done,), daemon=True)
+        feeder.start()
+        uploader.start()
+
+        try:
+            self._encode()
+        except BaseException:
+            self._abort.set()
+            raise
+        finally:
+            self._put(self.upload_queue, _END)
+            uploader.join()
+            feeder.join()
+
+        if self._error is not None:
+            raise self._error
+
+        return self.stats
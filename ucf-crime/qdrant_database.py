@@ -0,0 +1,156 @@
+import numpy as np
+import time
+
+# Utils
+from my_utils import stable_frame_id
+from databases import DatabaseHandler, _as_queries, _filter_conditions
+from env import *
+
+# QDrant
+from qdrant_client import QdrantClient
+from qdrant_client.models import Distance, VectorParams, Datatype, Filter, FieldCondition, MatchValue, MatchAny, SearchRequest, CollectionStatus
+
+class QDrantDatabase(DatabaseHandler):
+
+    def __init__(self, encoder_params:dict, host:str=DATABASE_HOST,
+                 port:int=QDRANT_PORT,
+                 rewrite:bool=True,
+                 dtype:str=None,
+                 buffer_rows:int=1024,
+                 buffer_bytes:int=64*2**20,
+                 buffer_delay:float=5.,
+                 upload_batch_size:int=256,
+                 upload_parallel:int=1):
+        """QDrant Database handler.
+
+        Parameters
+        ----------
+        encoder_params : dict
+            The parameters defined by the encoder.
+        host : str, optional
+            _The host where the database is running, by default 'localhost'
+        port : int, optional
+            The port where the database is running, by default 6333
+        rewrite : bool, optional
+            Whether to delete any previous collection with the same name, by default True
+        dtype : str, optional
+            The type of the stored embeddings, 'float32' or 'float16'. If not specified, the type of the
+            encoder's embeddings.
+        buffer_rows : int, optional
+            Maximum number of buffered rows before they are uploaded, by default 1024
+        buffer_bytes : int, optional
+            Maximum size of the buffered embeddings before they are uploaded, by default 64 MiB
+        buffer_delay : float, optional
+            Maximum seconds since the last upload before buffered rows are uploaded, by default 5
+        upload_batch_size : int, optional
+            Number of points sent in each request by upload_collection, by default 256
+        upload_parallel : int, optional
+            Number of parallel processes used by upload_collection, by default 1
+        """
+
+        # Get encoder params
+        self.encoder_name = encoder_params['model_name']
+        self.emb_size = encoder_params['embedding_size']
+        self.emb_list = encoder_params['embedding_list']
+        self.dtype = np.dtype(dtype or encoder_params.get('dtype', 'float32'))
+        
+        # Connect to client
+        self.client = QdrantClient(host=host, port=port)
+
+        # Name the collection
+        collection_name = f'ucf{self.encoder_name}'
+        vectors_config = VectorParams(
+            size=self.emb_size,
+            distance=Distance.COSINE,
+            datatype=Datatype.FLOAT16 if self.dtype == np.float16 else Datatype.FLOAT32
+        )
+
+        # Create collection
+        if (not self.client.collection_exists(collection_name=collection_name)):
+            
+            print("Collection do not exist")
+            self.client.create_collection(
+                collection_name=collection_name,
+                vectors_config=vectors_config,
+            )
+        elif rewrite:
+            print(f"[DB_HAND]: Collection '{collection_name}' do exist but will be rewritten")
+            self.client.delete_collection(collection_name=collection_name)
+            self.client.create_collection(
+                collection_name=collection_name,
+                vectors_config=vectors_config,
+            )
+
+        self.collection_name = collection_name
+        self.upload_batch_size = upload_batch_size
+        self.upload_parallel = upload_parallel
+
+        self._init_buffer(buffer_rows, buffer_bytes, buffer_delay)
+
+    def close(self):
+        self.flush()
+        self._report()
+        self.client.close()
+
+    def _write(self, entries:list):
+        """Upload the embeddings to the database.
+
+        Parameters
+        ----------
+        entries : list
+            A list of (id, emb, metadata) tuples.
+        """
+        # One contiguous matrix with every vector, uploaded in batches without building a point per vector
+        ids, vectors, payloads = [], [], []
+        for id, emb, metadata in entries:
+            if self.emb_list:
+                ids.extend(stable_frame_id(id, i) for i in range(len(emb)))
+                payloads.extend({**metadata, 'clip_id':id, 'frame':i} for i in range(len(emb)))
+                vectors.append(np.asarray(emb, dtype=np.float32))
+            else:
+                ids.append(id)
+                payloads.append(metadata)
+                vectors.append(np.asarray(emb, dtype=np.float32)[None])
+
+        self.client.upload_collection(
+            collection_name=self.collection_name,
+            vectors=np.concatenate(vectors),
+            payload=payloads,
+            ids=ids,
+            batch_size=self.upload_batch_size,
+            parallel=self.upload_parallel,
+            wait=True
+        )
+
+    def build_index(self):
+        self.flush()
+
+        # Qdrant indexes the points in the background, the collection is green once it is done
+        while self.client.get_collection(collection_name=self.collection_name).status != CollectionStatus.GREEN:
+            time.sleep(0.5)
+
+    def _filter(self, filter:dict) -> Filter:
+        conditions = []
+        for field, values in _filter_conditions(filter):
+            if len(values) == 1:
+                conditions.append(FieldCondition(key=field, match=MatchValue(value=values[0])))
+            elif all(isinstance(value, (int, str)) and not isinstance(value, bool) for value in values):
+                conditions.append(FieldCondition(key=field, match=MatchAny(any=values)))
+            else:
+                # MatchAny only accepts ints and strings, so other values (e.g. bools) must match any of the conditions
+                conditions.append(Filter(should=[FieldCondition(key=field, match=MatchValue(value=value)) for value in values]))
+        return Filter(must=conditions) if conditions else None
+
+    def search(self, query_vectors:np.ndarray, k:int=10, filter:dict=None) -> list:
+        self.flush()
+        query_filter = self._filter(filter)
+        results = self.client.search_batch(
+            collection_name=self.collection_name,
+            requests=[SearchRequest(vector=query.tolist(),
+                                    limit=k,
+                                    filter=query_filter,
+                                    with_payload=True)
+                      for query in _as_queries(query_vectors)]
+        )
+        return [[{'id': hit.id, 'score': hit.score, 'metadata': hit.payload} for hit in hits]
+                for hits in results]
@@ -0,0 +1,261 @@
+import os
+
+import numpy as np
+
+from local_index import _check_distance, _prepare, _merge_top_k, _pad, exact_search
+
+possible_codecs = [
+    'sq8',
+    'pq',
+]
+
+class ScalarQuantizer:
+
+    def __init__(self):
+        """Compresses each dimension of the embeddings to one byte, linearly between the minimum and
+        maximum values it takes (4x smaller than float32).
+        """
+        self.low = None
+        self.scale = None
+
+    def train(self, sample:np.ndarray):
+        self.low = sample.min(axis=0)
+        self.scale = np.maximum(sample.max(axis=0) - self.low, 1e-12) / 255
+
+    def encode(self, vectors:np.ndarray) -> np.ndarray:
+        return np.clip(np.rint((vectors - self.low) / self.scale), 0, 255).astype(np.uint8)
+
+    def scores(self, codes:np.ndarray, queries:np.ndarray) -> np.ndarray:
+        # <q, low + scale*c> = <q, low> + <q*scale, c>, without decoding the codes
+        return (queries @ self.low)[:, None] + (queries * self.scale) @ codes.T.astype(np.float32)
+
+    def state(self) -> dict:
+        return {'low': self.low, 'scale': self.scale}
+
+    def load_state(self, state:dict):
+        self.low = state['low']
+        self.scale = state['scale']
+
+class ProductQuantizer:
+
+    def __init__(self, subspaces:int=None, iterations:int=10, seed:int=0):
+        """Splits the embeddings into subspaces and replaces each sub-vector by the closest of 256
+        centroids learnt with k-means, so each embedding is compressed to one byte per subspace.
+
+        Parameters
+        ----------
+        subspaces : int, optional
+            The number of subspaces, which must divide the size of the embeddings. If not specified,
+            one per 8 dimensions (16x smaller than float32).
+        iterations : int, optional
+            Number of k-means iterations, by default 10
+        seed : int, optional
+            Seed of the initialization of the centroids, by default 0
+        """
+        self.subspaces = subspaces
+        self.iterations = iterations
+        self.seed = seed
+        self.centroids = None
+
+    def _split(self, vectors:np.ndarray) -> np.ndarray:
+        # (subspaces, rows, sub-dimensions) view of the vectors
+        return vectors.reshape(len(vectors), self.subspaces, -1).transpose(1, 0, 2)
+
+    def train(self, sample:np.ndarray):
+        self.subspaces = self.subspaces or max(1, sample.shape[1] // 8)
+        if sample.shape[1] % self.subspaces:
+            raise ValueError(f'ValueError: {self.subspaces} subspaces do not divide {sample.shape[1]}-d embeddings')
+
+        rng = np.random.default_rng(self.seed)
+        centroids = []
+        for sub_sample in self._split(sample):
+            sub_centroids = sub_sample[rng.choice(len(sub_sample), size=min(256, len(sub_sample)), replace=False)]
+            for _ in range(self.iterations):
+                # Sum of the sub-vectors assigned to each centroid, one dimension at a time
+                assignment = self._assign(sub_sample, sub_centroids)
+                sums = np.stack([np.bincount(assignment, weights=column, minlength=len(sub_centroids))
+                                 for column in sub_sample.T], axis=1)
+                counts = np.bincount(assignment, minlength=len(sub_centroids))
+                filled = counts > 0
+                sub_centroids[filled] = sums[filled] / counts[filled, None]
+            centroids.append(sub_centroids)
+        self.centroids = np.stack(centroids)
+
+    def _assign(self, sub_vectors:np.ndarray, sub_centroids:np.ndarray) -> np.ndarray:
+        # Closest centroid, as the argmin of |c|^2 - 2<x, c>
+        return np.argmin((sub_centroids ** 2).sum(axis=1) - 2 * sub_vectors @ sub_centroids.T, axis=1)
+
+    def encode(self, vectors:np.ndarray) -> np.ndarray:
+        return np.stack([self._assign(sub_vectors, sub_centroids)
+                         for sub_vectors, sub_centroids in zip(self._split(vectors), self.centroids)], axis=1).astype(np.uint8)
+
+    def scores(self, codes:np.ndarray, queries:np.ndarray) -> np.ndarray:
+        # Table with the inner product of each sub-query with each centroid, summed over the codes' entries
+        tables = np.einsum('sqd,scd->qsc', self._split(queries), self.centroids)
+        scores = np.zeros((len(queries), len(codes)), dtype=np.float32)
+        for subspace in range(self.subspaces):
+            scores += tables[:, subspace, codes[:, subspace]]
+        return scores
+
+    def state(self) -> dict:
+        return {'centroids': self.centroids}
+
+    def load_state(self, state:dict):
+        self.centroids = state['centroids']
+        self.subspaces = len(self.centroids)
+
+class QuantizedIndex:
+
+    def __init__(self, codec:str='sq8', distance:str='COS', rerank:int=4, subspaces:int=None,
+                 sample_rows:int=16384, seed:int=0):
+        """Index that keeps a compressed copy of the embeddings in memory. Every query is compared with
+        all the compressed embeddings, and the best candidates are re-ranked with their original
+        embeddings, which are only read for those rows. Rows appended to the matrix after the index was
+        built are compared with their original embeddings, until the index is rebuilt.
+
+        Parameters
+        ----------
+        codec : str, optional
+            The compression of the embeddings. Can be one of the specified in the
+            \'quantization.possible_codecs\' variable, by default 'sq8'
+        distance : str, optional
+            The similarity used. Can be one of the specified in the \'my_utils.distances\' variable, by default 'COS'
+        rerank : int, optional
+            Number of candidates re-ranked per result, by default 4. With 1, results are not re-ranked.
+        subspaces : int, optional
+            The number of subspaces of the 'pq' codec. If not specified, one per 8 dimensions.
+        sample_rows : int, optional
+            Maximum number of rows used to train the codec, by default 16384
+        seed : int, optional
+            Seed of the sampling of the training rows, by default 0
+
+        Raises
+        ------
+        TypeError
+            If the specified codec is not implemented.
+        """
+        _check_distance(distance)
+        match codec:
+            case 'sq8':
+                self.quantizer = ScalarQuantizer()
+            case 'pq':
+                self.quantizer = ProductQuantizer(subspaces, seed=seed)
+            case _:
+                raise TypeError(f'TypeError: Codec {codec} not found among implemented. Please, use one of the following: {possible_codecs}.')
+        self.codec = codec
+        self.distance = distance
+        self.rerank = rerank
+        self.sample_rows = sample_rows
+        self.seed = seed
+
+        self.count = 0
+        self.codes = None
+
+    def build(self, vectors:np.ndarray, chunk_rows:int=65536):
+        """Trains the codec over a sample of the rows of the matrix and compresses all of them.
+
+        Parameters
+        ----------
+        vectors : np.ndarray
+            The matrix with one embedding per row.
+        chunk_rows : int, optional
+            Number of rows of the matrix compressed at once, by default 65536
+        """
+        self.count = len(vectors)
+        if self.count == 0:
+            self.codes = None
+            return
+
+        rng = np.random.default_rng(self.seed)
+        sample = np.sort(rng.choice(self.count, size=min(self.sample_rows, self.count), replace=False))
+        self.quantizer.train(_prepare(vectors[sample], self.distance))
+        self.codes = np.concatenate([self.quantizer.encode(_prepare(vectors[start:start+chunk_rows], self.distance))
+                                     for start in range(0, self.count, chunk_rows)])
+
+    def search(self, vectors:np.ndarray, queries:np.ndarray, k:int=10, valid_rows:np.ndarray=None,
+               chunk_rows:int=65536) -> tuple:
+        """Returns the k rows of the matrix most similar to each query, re-ranking the best candidates
+        found among the compressed embeddings.
+
+        Parameters
+        ----------
+        vectors : np.ndarray
+            The matrix with one embedding per row, whose first rows were used to build the index.
+        queries : np.ndarray
+            The query vectors, one per row.
+        k : int, optional
+            The number of results per query, by default 10
+        valid_rows : np.ndarray, optional
+            A boolean mask of the rows that can be returned. If not specified, every row can be returned.
+        chunk_rows : int, optional
+            Number of compressed rows compared at once, by default 65536
+
+        Returns
+        -------
+        tuple
+            Two (queries, k) arrays with the scores and the rows of the results, sorted from most to least
+            similar. Missing results have a score of -inf and a row of -1.
+        """
+        queries = _prepare(np.atleast_2d(queries), self.distance)
+        candidates_k = k * max(1, self.rerank)
+
+        # Approximate scores of the compressed rows
+        scores = np.empty((len(queries), 0), dtype=np.float32)
+        rows = np.empty((len(queries), 0), dtype=np.int64)
+        for start in range(0, self.count, chunk_rows):
+            codes = self.codes[start:start+chunk_rows]
+            chunk_scores = self.quantizer.scores(codes, queries).astype(np.float32)
+            if valid_rows is not None:
+                chunk_scores[:, ~valid_rows[start:start+len(codes)]] = -np.inf
+            chunk_rows_ids = np.broadcast_to(np.arange(start, start + len(codes)), chunk_scores.shape)
+            scores, rows = _merge_top_k(np.concatenate([scores, chunk_scores], axis=1),
+                                        np.concatenate([rows, chunk_rows_ids], axis=1), candidates_k)
+        scores, rows = _pad(scores, rows, candidates_k)
+
+        # Exact scores of the rows appended afterwards
+        if len(vectors) > self.count:
+            new_scores, new_rows = exact_search(vectors[self.count:], queries, self.distance, candidates_k,
+                                                valid_rows[self.count:] if valid_rows is not None else None)
+            new_rows[new_rows >= 0] += self.count
+            scores, rows = _merge_top_k(np.concatenate([scores, new_scores], axis=1),
+                                        np.concatenate([rows, new_rows], axis=1), candidates_k)
+
+        if self.rerank <= 1:
+            scores, rows = _merge_top_k(scores, rows, k)
+            return _pad(scores, rows, k)
+
+        # Re-rank the candidates with their original embeddings, read in a single sorted pass
+        found = rows >= 0
+        if found.any():
+            unique_rows = np.unique(rows[found])
+            exact = queries @ _prepare(vectors[unique_rows], self.distance).T
+            positions = np.searchsorted(unique_rows, np.where(found, rows, unique_rows[0]))
+            scores = np.where(found, np.take_along_axis(exact, positions, axis=1), scores)
+        scores, rows = _merge_top_k(scores, rows, k)
+        return _pad(scores, rows, k)
+
+    def memory_bytes(self) -> int:
+        """Returns the size of the compressed embeddings kept in memory.
+        """
+        return self.codes.nbytes if self.codes is not None else 0
+
+    def save(self, index_path:str):
+        """Saves the index to a .npz file, replacing any previous index atomically.
+        """
+        state = {f'quantizer_{name}': value for name, value in self.quantizer.state().items()}
+        with open(index_path + '.tmp', 'wb') as fp:
+            np.savez(fp, codec=self.codec, distance=self.distance, rerank=self.rerank, count=self.count,
+                     codes=self.codes if self.codes is not None else np.empty((0, 0), dtype=np.uint8), **state)
+        os.replace(index_path + '.tmp', index_path)
+
+    def load(index_path:str) -> 'QuantizedIndex':
+        """Loads an index saved with QuantizedIndex.save.
+        """
+        with np.load(index_path) as data:
+            index = QuantizedIndex(str(data['codec']), str(data['distance']), rerank=int(data['rerank']))
+            index.count = int(data['count'])
+            index.codes = data['codes'] if index.count else None
+            if index.count:
+                index.quantizer.load_state({name[len('quantizer_'):]: data[name] for name in data.files
+                                            if name.startswith('quantizer_')})
+        return index
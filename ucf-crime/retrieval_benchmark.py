@@ -0,0 +1,229 @@
+# General
+import numpy as np
+import argparse
+import json
+import time
+
+# My code
+from my_utils import read_uca_as_df
+from vision_encoders import possible_models, EncoderBuilder
+from databases import possible_databases, DatabaseBuilder
+from local_index import possible_indexes
+from quantization import possible_codecs
+
+
+def rank_clips(hits:list, k:int) -> list:
+    """Returns the ids of the clips of the results of a query, from most to least similar. Results of
+    per-frame collections are ranked by the best scored frame of each clip.
+
+    Parameters
+    ----------
+    hits : list
+        The results of the query, as returned by DatabaseHandler.search.
+    k : int
+        Maximum number of clips returned.
+
+    Returns
+    -------
+    list
+        The ids of the ranked clips.
+    """
+    ranked = dict.fromkeys(hit['metadata'].get('clip_id', hit['id']) for hit in hits)
+    return list(ranked)[:k]
+
+def retrieval_metrics(rankings:list, relevants:list, ks:list) -> dict:
+    """Returns the Recall@K of each K, the mean average precision and the mean reciprocal rank
+    of the rankings.
+
+    Parameters
+    ----------
+    rankings : list
+        The ids of the clips retrieved by each query, from most to least similar.
+    relevants : list
+        The set of ids of the clips relevant to each query.
+    ks : list
+        The values of K of the Recall@K.
+
+    Returns
+    -------
+    dict
+        The metrics, averaged over every query.
+    """
+    recalls = {k: [] for k in ks}
+    average_precisions = []
+    reciprocal_ranks = []
+    for ranking, relevant in zip(rankings, relevants):
+        ranks = [rank for rank, id in enumerate(ranking, start=1) if id in relevant]
+        for k in ks:
+            recalls[k].append(sum(rank <= k for rank in ranks) / len(relevant))
+        average_precisions.append(sum(i / rank for i, rank in enumerate(ranks, start=1)) / len(relevant))
+        reciprocal_ranks.append(1 / ranks[0] if ranks else 0.)
+
+    metrics = {f'recall@{k}': float(np.mean(recalls[k])) for k in ks}
+    metrics['map'] = float(np.mean(average_precisions))
+    metrics['mrr'] = float(np.mean(reciprocal_ranks))
+    return metrics
+
+def benchmark_retrieval(model, database_handler, sentences:list, relevants:list,
+                        ks:list=(1, 5, 10), query_batch_size:int=64, frame_oversampling:int=10,
+                        latency_queries:int=None) -> dict:
+    """Queries the collection with the embedding of each sentence and measures the quality and
+    speed of the retrieval.
+
+    Parameters
+    ----------
+    model : EmbeddingModel
+        The encoder of the collection, used to encode the sentences.
+    database_handler : DatabaseHandler
+        The handler of the collection.
+    sentences : list
+        The sentences used as queries.
+    relevants : list
+        The set of ids of the clips relevant to each sentence.
+    ks : list, optional
+        The values of K of the Recall@K, by default (1, 5, 10)
+    query_batch_size : int, optional
+        Number of queries sent in each search used to measure the quality and queries per second,
+        by default 64
+    frame_oversampling : int, optional
+        In per-frame collections, number of frames retrieved per clip, since several frames of the
+        same clip may be retrieved. By default, 10
+    latency_queries : int, optional
+        Number of queries searched one at a time to measure the latency of a single query. If not
+        specified, every query.
+
+    Returns
+    -------
+    dict
+        The retrieval metrics, the index build time, the text encoding time, the queries per second
+        and the percentiles of the latency of a single query.
+    """
+    k = max(ks)
+    search_k = k * frame_oversampling if model.get_encoder_params()['embedding_list'] else k
+
+    start_index = time.perf_counter()
+    database_handler.build_index()
+    index_time = time.perf_counter() - start_index
+
+    start_text = time.perf_counter()
+    queries = model.get_text_embedding(sentences)
+    text_time = time.perf_counter() - start_text
+
+    rankings = []
+    search_time = 0.
+    for start in range(0, len(queries), query_batch_size):
+        start_search = time.perf_counter()
+        results = database_handler.search(queries[start:start+query_batch_size], k=search_k)
+        search_time += time.perf_counter() - start_search
+        rankings += [rank_clips(hits, k) for hits in results]
+
+    # The time of a batched search is that of its whole batch, so latency is measured with single-query searches
+    latencies = []
+    for query in queries[:latency_queries]:
+        start_search = time.perf_counter()
+        database_handler.search(query[None], k=search_k)
+        latencies.append(time.perf_counter() - start_search)
+
+    return {
+        **retrieval_metrics(rankings, relevants, ks),
+        'queries': len(sentences),
+        'index_build_s': index_time,
+        'text_encoding_s': text_time,
+        'search_s': search_time,
+        'queries_per_s': len(sentences) / search_time if search_time > 0 else 0.,
+        'latency_p50_ms': float(np.percentile(latencies, 50) * 1000) if latencies else 0.,
+        'latency_p99_ms': float(np.percentile(latencies, 99) * 1000) if latencies else 0.,
+        'query_batch_size': query_batch_size,
+    }
+
+def uca_queries(uca_path:str, datasets:list, uca_cache:str=None) -> tuple:
+    """Returns the distinct sentences of the UCA annotations of the given datasets, and the ids of
+    the clips annotated with each one of them.
+    """
+    uca_df = read_uca_as_df(uca_path=uca_path, cache_path=uca_cache)
+    uca_df = uca_df[uca_df['dataset'].isin(datasets)]
+    grouped = uca_df.groupby('sentence', sort=False)['id'].apply(set)
+    return list(grouped.index), list(grouped.values)
+
+def retrieval_benchmark(uca_path, encoders, databases, datasets=('test',), uca_cache=None,
+                        ks=(1, 5, 10), query_batch_size=64, latency_queries=None, save_path=None, index='exact',
+                        codec=None, rerank=4, output=None) -> list:
+    """Benchmarks the retrieval of the UCA sentences over the collection of each encoder, stored in
+    each database. Collections must have been ingested beforehand with ucf_encoding.py.
+
+    Returns
+    -------
+    list
+        The results of each encoder and database.
+    """
+    sentences, relevants = uca_queries(uca_path, datasets, uca_cache)
+    print(f"[BENCH]: {len(sentences)} queries from the {', '.join(datasets)} dataset(s)")
+
+    results = []
+    for encoder in encoders:
+        try:
+            model = EncoderBuilder.build(encoder_name=encoder)
+        except Exception as e:
+            print(f'[BENCH]: Could not load encoder {encoder}. {e}')
+            continue
+
+        for database in databases:
+            database_kwargs = {'save_path': save_path, 'index': index, 'codec': codec, 'rerank': rerank} if database == 'local' and save_path else {}
+            try:
+                with DatabaseBuilder.build(database_name=database,
+                                           encoder_params=model.get_encoder_params(),
+                                           rewrite=False,
+                                           **database_kwargs) as database_handler:
+                    result = benchmark_retrieval(model, database_handler, sentences, relevants,
+                                                 ks=ks, query_batch_size=query_batch_size,
+                                                 latency_queries=latency_queries)
+            except Exception as e:
+                print(f'[BENCH]: Could not benchmark {encoder} on {database}. {e}')
+                continue
+
+            result = {'encoder': encoder, 'database': database, **result}
+            print(f"[BENCH]: {encoder} on {database}: " +
+                  ', '.join(f'{metric}={value:.4f}' for metric, value in result.items() if isinstance(value, float)))
+            results.append(result)
+
+    if output:
+        with open(output, 'w') as fp:
+            json.dump(results, fp, indent=2)
+
+    return results
+
+def get_args():
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--uca-path', type=str, default='/media/pablo/358690d7-e500-45fb-b8f8-bc48c6be13e3/Surveillance-Video-Understanding/UCF Annotation/json', help='Directory of the UCA dataset\' JSON file')
+    parser.add_argument('--uca-cache', type=str, help='Parquet (or .feather) file where the pre-processed UCA dataset is cached. If not specified, it is not cached')
+    parser.add_argument('--encoders', type=str, nargs='+', choices=possible_models, default=possible_models, help='The encoders whose collections are benchmarked')
+    parser.add_argument('--databases', type=str, nargs='+', choices=possible_databases, default=possible_databases, help='The databases whose collections are benchmarked')
+    parser.add_argument('--datasets', type=str, nargs='+', choices=['train', 'val', 'test'], default=['test'], help='The UCA datasets whose sentences are used as queries')
+    parser.add_argument('--ks', type=int, nargs='+', default=[1, 5, 10], help='The values of K of the Recall@K')
+    parser.add_argument('--query-batch-size', type=int, default=64, help='Number of queries sent in each search used to measure the quality and queries per second')
+    parser.add_argument('--latency-queries', type=int, help='Number of queries searched one at a time to measure the latency of a single query. If not specified, every query')
+    parser.add_argument('--save-path', type=str, help='Directory of the collections of the local database')
+    parser.add_argument('--index', type=str, choices=possible_indexes, default='exact', help='The index used to search the collections of the local database')
+    parser.add_argument('--codec', type=str, choices=possible_codecs, help='Compression of the embeddings kept in memory to search the collections of the local database, whose best candidates are re-ranked. If not specified, they are not compressed')
+    parser.add_argument('--rerank', type=int, default=4, help='Number of candidates re-ranked per result when a codec is used')
+    parser.add_argument('--output', type=str, help='JSON file where the results are saved')
+
+    return parser.parse_args()
+
+if __name__ == '__main__':
+
+    args = get_args()
+
+    retrieval_benchmark(args.uca_path, args.encoders, args.databases,
+                        datasets=args.datasets,
+                        uca_cache=args.uca_cache,
+                        ks=args.ks,
+                        query_batch_size=args.query_batch_size,
+                        latency_queries=args.latency_queries,
+                        save_path=args.save_path,
+                        index=args.index,
+                        codec=args.codec,
+                        rerank=args.rerank,
+                        output=args.output)
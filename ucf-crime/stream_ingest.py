@@ -0,0 +1,385 @@
+# General
+import numpy as np
+import argparse
+import os
+import threading
+import time
+from collections import deque
+
+# My code
+from video_readers import possible_decoders, DecoderBuilder, RawStreamDecoder, sliding_windows
+from my_utils import stable_clip_id
+from vision_encoders import possible_models, possible_poolings, possible_precisions, possible_compile_modes, possible_dtypes, set_torch_threads
+from frame_filters import possible_frame_filters
+from databases import possible_databases
+from pipeline import IngestionPipeline
+from metrics import metrics, serve_metrics, JsonMetricsLogger
+from ucf_encoding import CLIP_DURATION_S, build_encoder_and_database
+
+# Upper bounds of the buckets of the latency histogram, in seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1., 2., 5., 10., 15., 30., 60., 120., 300.)
+
+class LiveStream:
+
+    def __init__(self, decoder):
+        """Wraps the decoder of a live stream to know when each of its frames was captured. Frames are
+        produced in real time, so frame i was captured i/fps seconds after the first one was received.
+        Frames read later than that (e.g. because the ingestion falls behind) count as latency.
+
+        Parameters
+        ----------
+        decoder : VideoDecoder
+            The decoder of the stream.
+        """
+        self.decoder = decoder
+        self.fps = decoder.fps
+        self.start_time = None
+
+    def is_opened(self) -> bool:
+        return self.decoder.is_opened()
+
+    def read_frames(self, indices:list):
+        for index, frame in self.decoder.read_frames(indices):
+            if self.start_time is None:
+                self.start_time = time.time() - index / self.fps
+            yield index, frame
+
+    def capture_time(self, index:int) -> float:
+        """Returns the time at which the given frame was captured, in seconds since the epoch.
+        """
+        return self.start_time + index / self.fps
+
+    def release(self):
+        self.decoder.release()
+
+def open_stream(source:str, raw_size:tuple=None, fps:float=None, size:int=None, decoder:str='opencv',
+                idle_timeout:float=10.) -> LiveStream:
+    """Opens a live stream.
+
+    Parameters
+    ----------
+    source : str
+        A pipe or growing file of raw RGB frames, or anything the decoder can open (e.g. an RTSP URL).
+    raw_size : tuple, optional
+        The width and height of the frames of a raw stream. If not specified, the source is opened
+        with the decoder.
+    fps : float, optional
+        The frames per second of a raw stream.
+    size : int, optional
+        The side of the square RGB frames to decode. If not specified, frames keep their resolution.
+    decoder : str, optional
+        The name of the decoder of non raw streams, by default 'opencv'
+    idle_timeout : float, optional
+        Seconds without new frames after which a growing file is considered finished, by default 10
+
+    Returns
+    -------
+    LiveStream
+        The stream.
+    """
+    if raw_size:
+        if not fps:
+            raise ValueError('ValueError: The fps of a raw stream must be specified')
+        width, height = raw_size
+        return LiveStream(RawStreamDecoder(source, width, height, fps, size, idle_timeout=idle_timeout))
+    return LiveStream(DecoderBuilder.build(decoder, source, size))
+
+def write_synthetic_stream(stream_path:str, width:int=320, height:int=240, fps:float=30., duration_s:float=60.,
+                           stop_event:threading.Event=None):
+    """Writes a synthetic stream of raw RGB frames in real time, a square moving over a changing background,
+    to a pipe or a file. Used as a local stand-in for a camera.
+
+    Parameters
+    ----------
+    stream_path : str
+        The path of the pipe or file.
+    width : int, optional
+        The width of the frames, by default 320
+    height : int, optional
+        The height of the frames, by default 240
+    fps : float, optional
+        The frames per second of the stream, by default 30
+    duration_s : float, optional
+        The duration of the stream, in seconds, by default 60
+    stop_event : threading.Event, optional
+        Event that stops the stream before its end.
+    """
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    side = min(width, height) // 4
+    start = time.monotonic()
+    with open(stream_path, 'ab', buffering=0) as fp:
+        for index in range(int(duration_s * fps)):
+            if stop_event is not None and stop_event.is_set():
+                break
+
+            frame[:] = (index // int(fps)) * 7 % 256
+            x = index * 4 % (width - side)
+            y = index * 2 % (height - side)
+            frame[y:y+side, x:x+side] = 255
+            fp.write(frame.tobytes())
+
+            # Keep the pace of a real camera
+            delay = start + (index + 1) / fps - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+def stream_windows(stream:LiveStream, stream_name:str, window_s:float=CLIP_DURATION_S, stride_s:float=None,
+                   sample_rate:float=1.):
+    """Splits a live stream into consecutive windows.
+
+    Parameters
+    ----------
+    stream : LiveStream
+        The stream.
+    stream_name : str
+        The name of the stream, stored as the video of the windows.
+    window_s : float, optional
+        The duration of each window, in seconds, by default CLIP_DURATION_S
+    stride_s : float, optional
+        The seconds between the start of two consecutive windows. If not specified, windows do not overlap.
+    sample_rate : float, optional
+        The number of frames sampled per second, by default 1
+
+    Yields
+    ------
+    tuple
+        The id, the sampled frames, the metadata and None (no cached embedding) of each window, as soon as
+        its last sampled frame is captured. The metadata includes the capture time of that frame, the
+        time at which the window starts and the time at which the stream started.
+    """
+    window = int(window_s * stream.fps)
+    stride = int((stride_s or window_s) * stream.fps)
+    step = max(1, round(stream.fps / sample_rate))
+
+    for start_frame, end_frame, window_frames in sliding_windows(stream, window, stride, step):
+        metadata = {'video':stream_name,
+                    'start_frame':start_frame,
+                    'end_frame':end_frame,
+                    'start_time':stream.capture_time(start_frame),
+                    'capture_time':stream.capture_time((end_frame - 1) // step * step),
+                    'session_start':stream.start_time}
+        metrics.counter('stream_windows_total', 'Windows of the stream').inc()
+
+        # Frame indices restart with the stream, so the window is identified by when it was captured,
+        # not to overwrite the windows of a previous session or of another stream with the same name
+        timestamp = (metadata['start_time'], stream.capture_time(end_frame))
+        yield stable_clip_id(stream_name, timestamp, ''), window_frames, metadata, None
+
+class LatencyTracker:
+
+    def __init__(self, history:int=10000):
+        """Measures the latency from the capture of the last frame of each window until its embedding is
+        written to the database, and therefore searchable.
+
+        Parameters
+        ----------
+        history : int, optional
+            Number of latest latencies kept to report their percentiles, by default 10000
+        """
+        self._capture_times = {}
+        self._lock = threading.Lock()
+        self.latencies = deque(maxlen=history)
+        self.histogram = metrics.histogram('stream_latency_seconds', 'Seconds from the capture of the last frame of a window until its embedding is searchable', buckets=LATENCY_BUCKETS)
+
+    def captured(self, id:int, capture_time:float):
+        with self._lock:
+            self._capture_times[id] = capture_time
+
+    def written(self, ids:list):
+        # Called by the database handler once the embeddings are written
+        now = time.time()
+        with self._lock:
+            for id in ids:
+                capture_time = self._capture_times.pop(id, None)
+                if capture_time is not None:
+                    self.latencies.append(now - capture_time)
+                    self.histogram.observe(now - capture_time)
+
+    def __str__(self):
+        if not self.latencies:
+            return 'latency: no windows written'
+        return (f'latency: {len(self.latencies)} windows, p50 {np.percentile(self.latencies, 50):.2f}s, '
+                f'p99 {np.percentile(self.latencies, 99):.2f}s, max {max(self.latencies):.2f}s')
+
+def stream_encode(source, encoder, database,
+                  stream_name=None,
+                  raw_size=None,
+                  fps=None,
+                  window_s=CLIP_DURATION_S,
+                  stride_s=None,
+                  sample_rate=1.,
+                  encode_batch_size=8,
+                  max_write_delay=0.,
+                  decoder='opencv',
+                  model_resolution=False,
+                  idle_timeout=10.,
+                  outputs=None,
+                  save_path=None,
+                  database_kwargs=None,
+                  metrics_port=None,
+                  metrics_log=None,
+                  metrics_interval=10,
+                  encoder_kwargs=None,
+                  num_threads=None,
+                  num_interop_threads=None):
+    """Encodes a live stream continuously, as consecutive windows which are upserted to the database as
+    soon as they are encoded, until the stream finishes or the ingestion is interrupted. Existing
+    collections are kept.
+
+    The latency of a window is bounded by the time to encode it plus the maximum write delay, as long as
+    the encoder keeps the pace of the stream.
+
+    Returns
+    -------
+    tuple
+        The StageStats of the decode, encode and upload stages, and the LatencyTracker.
+    """
+    # Export the metrics of the ingestion (if specified)
+    metrics_server = serve_metrics(metrics_port) if metrics_port else None
+    metrics_logger = JsonMetricsLogger(metrics_log, metrics_interval).start() if metrics_log else None
+
+    # Limit the threads of the encoder (if specified)
+    if num_threads or num_interop_threads:
+        set_torch_threads(num_threads, num_interop_threads)
+
+    # Load model and connect to database, writing embeddings as soon as the maximum delay passes
+    model, database_handler = build_encoder_and_database(encoder, database, outputs,
+                                                         encoder_kwargs=encoder_kwargs,
+                                                         rewrite=False,
+                                                         buffer_delay=max_write_delay,
+                                                         **(database_kwargs or {}))
+    tracker = LatencyTracker()
+    database_handler.on_write.append(tracker.written)
+
+    stream = open_stream(source, raw_size, fps,
+                         size=model.get_input_size() if model_resolution else None,
+                         decoder=decoder,
+                         idle_timeout=idle_timeout)
+    if not stream.is_opened():
+        raise ValueError(f'ValueError: Stream {source} could not be opened')
+    stream_name = stream_name or os.path.basename(source).split('.')[0]
+
+    def decode_fn(job):
+        for id, window_frames, metadata, emb in stream_windows(stream, stream_name, window_s, stride_s, sample_rate):
+            tracker.captured(id, metadata['capture_time'])
+            yield id, window_frames, metadata, emb
+
+    print(f'[STREAM]: Encoding stream {source}')
+    with database_handler:
+        ingestion = IngestionPipeline(model, database_handler,
+                                      decode_workers=1,
+                                      decode_queue_size=encode_batch_size,
+                                      upload_queue_size=encode_batch_size,
+                                      encode_batch_size=encode_batch_size,
+                                      save_path=save_path)
+        try:
+            stats = ingestion.run([(source,)], decode_fn)
+        except KeyboardInterrupt:
+            print('[STREAM]: Ingestion interrupted')
+            stats = ingestion.stats
+    stream.release()
+    for _, error in ingestion.failed_jobs:
+        print(f'[STREAM]: Decoding of the stream failed: {error}')
+
+    if metrics_logger:
+        metrics_logger.stop()
+    if metrics_server:
+        metrics_server.shutdown()
+
+    for stage_stats in stats.values():
+        print(f'[STREAM]: {stage_stats}')
+    print(f'[STREAM]: {tracker}')
+
+    return stats, tracker
+
+def parse_size(size:str) -> tuple:
+    """Parses a frame size given as 'WxH'.
+    """
+    try:
+        width, height = (int(side) for side in size.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'Size must be given as WxH, not {size}')
+    return width, height
+
+def get_args():
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--source', type=str, required=True, help='Pipe or growing file of raw RGB frames (with --raw-size), or a stream the decoder can open (e.g. an RTSP URL)')
+    parser.add_argument('--stream-name', type=str, help='Name stored as the video of the windows. If not specified, the name of the source')
+    parser.add_argument('--raw-size', type=parse_size, help='Size of the frames of a raw stream, given as WxH')
+    parser.add_argument('--fps', type=float, help='Frames per second of a raw stream')
+    parser.add_argument('--synthetic', type=float, help='Write a synthetic raw stream of this many seconds to the source while it is ingested, as a local stand-in for a camera')
+    parser.add_argument('--encoder', type=str, choices=possible_models, required=True, help='The encoder used to generate the embeddings of the windows')
+    parser.add_argument('--database', type=str, choices=possible_databases, required=True, help='The database where the embeddings of the windows are upserted')
+    parser.add_argument('--save-path', type=str, help='Directory where embeddings of the windows will be saved. If not specified, embeddings will not be stored locally')
+    parser.add_argument('--window', type=float, default=CLIP_DURATION_S, help='Duration of each window in seconds')
+    parser.add_argument('--stride', type=float, help='Seconds between the start of two consecutive windows. If not specified, windows do not overlap')
+    parser.add_argument('--sample-rate', type=float, default=1., help='Frames sampled per second of each window')
+    parser.add_argument('--encode-batch-size', type=int, default=8, help='Maximum number of pending windows encoded together')
+    parser.add_argument('--max-write-delay', type=float, default=0., help='Maximum seconds embeddings are buffered before they are written to the database')
+    parser.add_argument('--idle-timeout', type=float, default=10., help='Seconds without new frames after which a growing file is considered finished')
+    parser.add_argument('--outputs', type=str, nargs='+', choices=possible_poolings, help='Poolings of a per-frame encoder (clip, vclip) generated in a single pass, each one stored in its own collection')
+    parser.add_argument('--decoder', type=str, choices=possible_decoders, default='opencv', help='The library used to decode non raw streams')
+    parser.add_argument('--model-resolution', action='store_true', help='Decode frames directly at the input resolution of the encoder')
+    parser.add_argument('--precision', type=str, choices=possible_precisions, help='Precision of the inference of a torch encoder (clip, vclip)')
+    parser.add_argument('--compile-mode', type=str, choices=possible_compile_modes, help='How the image encoder of a torch encoder (clip, vclip) is compiled')
+    parser.add_argument('--device', type=str, help='Device running a torch encoder (clip, vclip), e.g. cpu. If not specified, CUDA if available')
+    parser.add_argument('--dtype', type=str, choices=possible_dtypes, help='Type of the generated and stored embeddings. float16 halves their size')
+    parser.add_argument('--frame-filter', type=str, choices=possible_frame_filters, help='Filter of a torch encoder (clip, vclip) skipping the frames that barely change, which take the embedding of the previous keyframe. If not specified, every frame is encoded')
+    parser.add_argument('--filter-threshold', type=float, help='Threshold of the frame filter: mean absolute difference (0-1) for difference, different bits for hash. If not specified, the filter\'s default')
+    parser.add_argument('--threads', type=int, help='Number of intra-op threads of torch')
+    parser.add_argument('--interop-threads', type=int, help='Number of inter-op threads of torch')
+    parser.add_argument('--metrics-port', type=int, help='Port where the metrics of the ingestion are served in Prometheus\' format. If not specified, they are not served')
+    parser.add_argument('--metrics-log', type=str, help='JSON lines file where the metrics of the ingestion are periodically logged. If not specified, they are not logged')
+    parser.add_argument('--metrics-interval', type=float, default=10, help='Seconds between two logs of the metrics')
+
+    return parser.parse_args()
+
+if __name__ == '__main__':
+
+    args = get_args()
+
+    # Options of torch encoders, given only if specified
+    encoder_kwargs = {name: value for name, value in (('precision', args.precision),
+                                                      ('compile_mode', args.compile_mode),
+                                                      ('device', args.device),
+                                                      ('dtype', args.dtype),
+                                                      ('frame_filter', args.frame_filter),
+                                                      ('filter_threshold', args.filter_threshold)) if value is not None}
+
+    # Start the synthetic stream (if specified)
+    stop_event = threading.Event()
+    if args.synthetic:
+        if not args.raw_size or not args.fps:
+            raise ValueError('ValueError: --synthetic requires the --raw-size and --fps of the stream')
+        width, height = args.raw_size
+        if not os.path.exists(args.source):
+            open(args.source, 'ab').close()
+        threading.Thread(target=write_synthetic_stream,
+                         args=(args.source, width, height, args.fps, args.synthetic, stop_event),
+                         daemon=True).start()
+
+    try:
+        stream_encode(args.source, args.encoder, args.database,
+                      stream_name=args.stream_name,
+                      raw_size=args.raw_size,
+                      fps=args.fps,
+                      window_s=args.window,
+                      stride_s=args.stride,
+                      sample_rate=args.sample_rate,
+                      encode_batch_size=args.encode_batch_size,
+                      max_write_delay=args.max_write_delay,
+                      decoder=args.decoder,
+                      model_resolution=args.model_resolution,
+                      idle_timeout=args.idle_timeout,
+                      outputs=args.outputs,
+                      save_path=args.save_path,
+                      metrics_port=args.metrics_port,
+                      metrics_log=args.metrics_log,
+                      metrics_interval=args.metrics_interval,
+                      encoder_kwargs=encoder_kwargs,
+                      num_threads=args.threads,
+                      num_interop_threads=args.interop_threads)
+    finally:
+        stop_event.set()
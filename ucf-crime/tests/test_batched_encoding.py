@@ -0,0 +1,46 @@
+import numpy as np
+
+from vision_encoders import _batched_encode, _split_clips, _encode_clips
+
+rng = np.random.default_rng(0)
+PROJECTION = rng.standard_normal((8*8*3, 16)).astype(np.float32)
+
+def encode_frames(frames:list) -> np.ndarray:
+    # Deterministic stand-in for a forward pass, one embedding per frame
+    return np.stack([frame.reshape(-1).astype(np.float32) @ PROJECTION for frame in frames])
+
+def random_frames(count:int) -> list:
+    return [rng.integers(0, 256, size=(8, 8, 3), dtype=np.uint8) for _ in range(count)]
+
+def test_batched_encode_matches_per_frame_encoding():
+    frames = random_frames(11)
+    per_frame = np.concatenate([encode_frames([frame]) for frame in frames])
+    for batch_size in (1, 4, 11, 32):
+        np.testing.assert_allclose(_batched_encode(encode_frames, frames, 16, batch_size), per_frame, rtol=1e-5)
+
+def test_batched_encode_calls_once_per_batch():
+    calls = []
+    def counting_encode(frames):
+        calls.append(len(frames))
+        return encode_frames(frames)
+    _batched_encode(counting_encode, random_frames(10), 16, 4)
+    assert calls == [4, 4, 2]
+
+def test_batched_encode_casts_to_dtype():
+    frames = random_frames(3)
+    embs_array = _batched_encode(encode_frames, frames, 16, 2, 'float16')
+    assert embs_array.dtype == np.float16
+    np.testing.assert_allclose(embs_array, encode_frames(frames), rtol=1e-2)
+
+def test_batched_encode_without_frames():
+    assert _batched_encode(encode_frames, [], 16, 4).shape == (0, 16)
+
+def test_clips_batched_together_are_split_back():
+    clips = [random_frames(3), random_frames(1), random_frames(5)]
+    embs = _encode_clips(encode_frames, clips, 16, 4)
+    assert [len(emb) for emb in embs] == [3, 1, 5]
+    for clip_array, emb in zip(clips, embs):
+        np.testing.assert_allclose(emb, encode_frames(clip_array), rtol=1e-5)
+
+def test_split_clips_without_clips():
+    assert _split_clips(np.empty((0, 16)), []) == []
@@ -0,0 +1,53 @@
+import numpy as np
+
+from databases import DatabaseHandler
+
+class RecordingHandler(DatabaseHandler):
+
+    def __init__(self, embedding_list:bool=False, buffer_rows:int=1024, buffer_bytes:int=64*2**20, buffer_delay:float=60.):
+        self.emb_list = embedding_list
+        self.batches = []
+        self._init_buffer(buffer_rows, buffer_bytes, buffer_delay)
+
+    def _write(self, entries:list):
+        self.batches.append([id for id, _, _ in entries])
+
+    def close(self):
+        self.flush()
+
+def test_rows_are_written_in_batches():
+    handler = RecordingHandler(buffer_rows=3)
+    for id in range(7):
+        handler.add(id, np.zeros(4, dtype=np.float32), {})
+    assert handler.batches == [[0, 1, 2], [3, 4, 5]]
+    handler.close()
+    assert handler.batches[-1] == [6]
+    assert handler.written_rows == 7
+
+def test_frames_count_as_rows():
+    handler = RecordingHandler(embedding_list=True, buffer_rows=5)
+    handler.add(1, np.zeros((3, 4), dtype=np.float32), {})
+    assert handler.batches == []
+    handler.add(2, np.zeros((3, 4), dtype=np.float32), {})
+    assert handler.batches == [[1, 2]] and handler.written_rows == 6
+
+def test_buffer_is_written_once_it_reaches_its_size():
+    handler = RecordingHandler(buffer_bytes=40)
+    handler.add(1, np.zeros(4, dtype=np.float32), {})
+    handler.add(2, np.zeros(8, dtype=np.float32), {})
+    assert handler.batches == [[1, 2]]
+
+def test_buffer_is_written_once_its_delay_passes():
+    handler = RecordingHandler(buffer_delay=0.)
+    handler.add(1, np.zeros(4, dtype=np.float32), {})
+    assert handler.batches == [[1]]
+
+def test_unbuffered_uploads_and_write_callbacks():
+    written = []
+    with RecordingHandler() as handler:
+        handler.on_write.append(written.extend)
+        handler.add(1, np.zeros(4, dtype=np.float32), {})
+        handler.upload_embedding(2, np.zeros(4, dtype=np.float32), {})
+        assert written == [2]
+    assert written == [2, 1]
+    assert handler.batches == [[2], [1]]
@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from vision_encoders import (DefaultEncoder, _autocast, _check_dtype, _compile_forward,
+                             _quantize, check_accuracy, set_torch_threads)
+
+CPU = torch.device('cpu')
+
+def small_model() -> 'torch.nn.Module':
+    torch.manual_seed(0)
+    return torch.nn.Sequential(torch.nn.Linear(32, 64), torch.nn.ReLU(), torch.nn.Linear(64, 16))
+
+def cosine(a, b) -> np.ndarray:
+    a, b = np.asarray(a, dtype=np.float32), np.asarray(b, dtype=np.float32)
+    return np.sum(a * b, axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+
+def test_int8_quantizes_linear_layers_and_stays_close():
+    model = small_model()
+    inputs = torch.randn(8, 32)
+    with torch.no_grad():
+        reference = model(inputs).numpy()
+        quantized = _quantize(small_model(), 'int8', CPU)
+        outputs = quantized(inputs).numpy()
+    assert not any(type(module) is torch.nn.Linear for module in quantized.modules())
+    assert cosine(outputs, reference).min() > 0.99
+
+def test_fp32_keeps_the_model():
+    model = small_model()
+    assert _quantize(model, 'fp32', CPU) is model
+    assert not model.training
+
+def test_int8_only_runs_on_cpu():
+    with pytest.raises(ValueError):
+        _quantize(small_model(), 'int8', torch.device('meta'))
+
+def test_unknown_precision():
+    with pytest.raises(ValueError):
+        _quantize(small_model(), 'fp8', CPU)
+
+def test_bf16_autocast_stays_close():
+    model = small_model().eval()
+    inputs = torch.randn(8, 32)
+    with torch.no_grad():
+        reference = model(inputs).numpy()
+        with _autocast(CPU, 'bf16'):
+            outputs = model(inputs)
+    assert outputs.dtype == torch.bfloat16
+    assert cosine(outputs.float().numpy(), reference).min() > 0.99
+
+def test_fp32_does_not_autocast():
+    model = small_model().eval()
+    with torch.no_grad(), _autocast(CPU, 'fp32'):
+        assert model(torch.randn(2, 32)).dtype == torch.float32
+
+def test_torchscript_matches_eager():
+    model = small_model().eval()
+    forward = _compile_forward(model, 'torchscript', model)
+    with torch.no_grad():
+        for batch_size in (4, 4, 7):
+            inputs = torch.randn(batch_size, 32)
+            torch.testing.assert_close(forward(inputs), model(inputs))
+    # One graph per input shape
+    assert len(forward.traced) == 2
+
+def test_eager_keeps_the_forward():
+    model = small_model()
+    assert _compile_forward(model, 'eager', model) is model
+
+def test_unknown_compile_mode():
+    with pytest.raises(ValueError):
+        _compile_forward(small_model(), 'jit', None)
+
+def test_set_torch_threads():
+    previous = torch.get_num_threads()
+    try:
+        set_torch_threads(1)
+        assert torch.get_num_threads() == 1
+        # Unspecified settings are not changed
+        set_torch_threads()
+        assert torch.get_num_threads() == 1
+    finally:
+        torch.set_num_threads(previous)
+
+def test_unknown_dtype():
+    with pytest.raises(ValueError):
+        _check_dtype('float64')
+
+def test_check_accuracy():
+    clips = [[np.zeros((8, 8, 3), dtype=np.uint8)] * 3] * 2
+    same = check_accuracy(DefaultEncoder((1, 2, 3, 4)), DefaultEncoder((1, 2, 3, 4)), clips)
+    assert same['min_cosine'] == pytest.approx(1.)
+    assert same['mean_cosine'] == pytest.approx(1.)
+    opposite = check_accuracy(DefaultEncoder((1, 2, 3, 4)), DefaultEncoder((-1, -2, -3, -4)), clips)
+    assert opposite['min_cosine'] == pytest.approx(-1.)
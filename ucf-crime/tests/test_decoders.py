@@ -0,0 +1,66 @@
+from itertools import count
+
+import numpy as np
+import pytest
+
+from video_readers import possible_decoders, DecoderBuilder, _scaled_size, _center_crop
+
+MODULES = {'opencv': 'cv2', 'pyav': 'av', 'decord': 'decord'}
+COLORS = [(255, 0, 0), (0, 255, 0), (0, 0, 255)]
+
+@pytest.fixture(scope='module')
+def video_path(tmp_path_factory) -> str:
+    # 12 frames of 64x48, the first four red, then green, then blue
+    cv2 = pytest.importorskip('cv2')
+    path = str(tmp_path_factory.mktemp('videos') / 'video.mp4')
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), 10, (64, 48))
+    for color in COLORS:
+        for _ in range(4):
+            writer.write(np.full((48, 64, 3), color[::-1], dtype=np.uint8))
+    writer.release()
+    return path
+
+def build(decoder_name:str, video_path:str, size:int=None):
+    pytest.importorskip(MODULES[decoder_name])
+    return DecoderBuilder.build(decoder_name, video_path, size)
+
+def test_frames_are_resized_by_their_shortest_side():
+    assert _scaled_size(64, 48, 24) == (32, 24)
+    assert _scaled_size(48, 64, 24) == (24, 32)
+    frame = np.arange(32 * 24).reshape(24, 32)
+    np.testing.assert_array_equal(_center_crop(frame, 24), frame[:, 4:28])
+
+@pytest.mark.parametrize('decoder_name', possible_decoders)
+def test_frames_are_rgb(video_path, decoder_name):
+    decoder = build(decoder_name, video_path)
+    assert decoder.is_opened() and decoder.fps == pytest.approx(10)
+    frames = {index: frame.mean(axis=(0, 1)) for index, frame in decoder.read_frames([0, 5, 10])}
+    decoder.release()
+    for index, color in zip((0, 5, 10), COLORS):
+        assert np.argmax(frames[index]) == np.argmax(color)
+        assert frames[index].shape == (3,)
+
+@pytest.mark.parametrize('decoder_name', possible_decoders)
+def test_frames_are_decoded_at_the_encoder_resolution(video_path, decoder_name):
+    decoder = build(decoder_name, video_path, size=24)
+    frames = [(index, frame.copy()) for index, frame in decoder.read_frames([1, 6])]
+    decoder.release()
+    assert [index for index, _ in frames] == [1, 6]
+    assert all(frame.shape == (24, 24, 3) for _, frame in frames)
+    assert np.argmax(frames[1][1].mean(axis=(0, 1))) == 1
+
+@pytest.mark.parametrize('decoder_name', possible_decoders)
+def test_unbounded_indices_are_read_until_the_end(video_path, decoder_name):
+    decoder = build(decoder_name, video_path)
+    assert [index for index, _ in decoder.read_frames(count(0, 5))] == [0, 5, 10]
+    decoder.release()
+
+@pytest.mark.parametrize('decoder_name', possible_decoders)
+def test_missing_videos_are_not_opened(tmp_path, decoder_name):
+    decoder = build(decoder_name, str(tmp_path / 'missing.mp4'))
+    assert not decoder.is_opened()
+    decoder.release()
+
+def test_unknown_decoders_are_rejected(video_path):
+    with pytest.raises(TypeError):
+        DecoderBuilder.build('gstreamer', video_path)
@@ -0,0 +1,85 @@
+import sqlite3
+
+import numpy as np
+
+from embedding_cache import EmbeddingCache
+
+def open_cache(path, fingerprint='v1', **kwargs) -> EmbeddingCache:
+    return EmbeddingCache(str(path), model_name='model', fingerprint=fingerprint, **kwargs)
+
+def test_put_and_get(tmp_path):
+    cache = open_cache(tmp_path)
+    emb = np.arange(8, dtype=np.float32)
+    assert cache.get('video', 0, 15) is None
+    cache.put('video', 0, 15, emb)
+    np.testing.assert_array_equal(cache.get('video', 0, 15), emb)
+    assert cache.get('video', 16, 31) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+def test_multi_output_embeddings(tmp_path):
+    cache = open_cache(tmp_path)
+    emb = {'a': np.ones(4, dtype=np.float32), 'b': np.zeros(2, dtype=np.float32)}
+    cache.put('video', 0, 15, emb)
+    cached = cache.get('video', 0, 15)
+    assert set(cached) == {'a', 'b'}
+    np.testing.assert_array_equal(cached['a'], emb['a'])
+
+def test_new_fingerprint_invalidates(tmp_path):
+    cache = open_cache(tmp_path)
+    cache.put('video', 0, 15, np.ones(4))
+    cache.close()
+    cache = open_cache(tmp_path, fingerprint='v2')
+    assert cache.get('video', 0, 15) is None
+    assert cache.size() == 0
+
+def test_decode_params_are_part_of_the_key(tmp_path):
+    cache = open_cache(tmp_path, decode_params={'decoder': 'cv2', 'size': None})
+    cache.put('video', 0, 15, np.ones(4))
+    other = open_cache(tmp_path, decode_params={'decoder': 'cv2', 'size': (224, 224)})
+    assert other.get('video', 0, 15) is None
+    same = open_cache(tmp_path, decode_params={'size': None, 'decoder': 'cv2'})
+    assert same.get('video', 0, 15) is not None
+
+def test_running_total_matches_entries(tmp_path):
+    cache = open_cache(tmp_path)
+    cache.put('video', 0, 15, np.ones(4))
+    cache.put('video', 16, 31, np.ones(8))
+    # Overwriting an entry replaces its size instead of adding to it
+    cache.put('video', 0, 15, np.ones(16))
+    total, = cache._db.execute('SELECT SUM(size) FROM entries').fetchone()
+    assert cache.size() == total
+    cache.close()
+    assert open_cache(tmp_path).size() == total
+
+def test_least_recently_used_are_evicted(tmp_path):
+    emb = np.ones(64, dtype=np.float32)
+    cache = open_cache(tmp_path)
+    cache.put('video', 0, 15, emb)
+    entry_size = cache.size()
+    cache.close()
+
+    cache = open_cache(tmp_path, max_bytes=2*entry_size)
+    cache.put('video', 16, 31, emb)
+    cache.get('video', 0, 15)
+    cache.put('video', 32, 47, emb)
+    assert cache.get('video', 16, 31) is None
+    assert cache.get('video', 0, 15) is not None
+    assert cache.get('video', 32, 47) is not None
+    assert cache.size() == 2*entry_size
+
+def test_keyframes(tmp_path):
+    cache = open_cache(tmp_path)
+    cache.put('video', 0, 15, np.ones((3, 4)), keyframes=np.array([0, 0, 2]))
+    cache.put('video', 16, 31, np.ones((3, 4)))
+    assert cache.get_keyframes('video', 0, 15) == [0, 0, 2]
+    assert cache.get_keyframes('video', 16, 31) is None
+    assert cache.get_keyframes('video', 32, 47) is None
+
+def test_caches_without_keyframes_are_upgraded(tmp_path):
+    db = sqlite3.connect(str(tmp_path / 'index.sqlite'))
+    db.execute('CREATE TABLE entries (key TEXT PRIMARY KEY, model_name TEXT, fingerprint TEXT, size INTEGER, last_access REAL)')
+    db.commit()
+    db.close()
+    cache = open_cache(tmp_path)
+    cache.put('video', 0, 15, np.ones((2, 4)), keyframes=[0, 0])
+    assert cache.get_keyframes('video', 0, 15) == [0, 0]
@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+from frame_filters import FrameFilterBuilder, FrameDifferenceFilter, HashFilter
+from pipeline import encode_clips
+from vision_encoders import EmbeddingModel, _encode_clips
+from test_batched_encoding import encode_frames
+
+rng = np.random.default_rng(0)
+
+def scene(count:int, seed:int, noise:int=0) -> list:
+    # Frames of a static scene, with a little sensor noise
+    scene_rng = np.random.default_rng(seed)
+    base = scene_rng.integers(0, 256, size=(8, 8, 3)).astype(np.int16)
+    return [np.clip(base + rng.integers(-noise, noise + 1, size=base.shape), 0, 255).astype(np.uint8)
+            for _ in range(count)]
+
+@pytest.mark.parametrize('filter_name', ['difference', 'hash'])
+def test_each_scene_is_represented_by_its_first_frame(filter_name):
+    frame_filter = FrameFilterBuilder.build(filter_name, size=8) if filter_name == 'difference' \
+        else FrameFilterBuilder.build(filter_name, hash_size=4, threshold=2)
+    frames = scene(3, seed=1, noise=1) + scene(4, seed=2, noise=1) + scene(2, seed=3, noise=1)
+    assert list(frame_filter.keyframes(frames)) == [0, 0, 0, 3, 3, 3, 3, 7, 7]
+
+def test_every_changing_frame_is_a_keyframe():
+    frames = [rng.integers(0, 256, size=(8, 8, 3), dtype=np.uint8) for _ in range(5)]
+    assert list(FrameDifferenceFilter(size=8).keyframes(frames)) == [0, 1, 2, 3, 4]
+
+def test_frames_are_compared_with_the_keyframe_not_the_previous_frame():
+    # A slow fade, where consecutive frames barely differ but drift away from the keyframe
+    frames = [np.full((8, 8, 3), value, dtype=np.uint8) for value in range(0, 40, 2)]
+    representatives = FrameDifferenceFilter(threshold=0.05, size=8).keyframes(frames)
+    assert len(np.unique(representatives)) > 1
+    assert all(abs(int(frames[i][0, 0, 0]) - int(frames[r][0, 0, 0])) < 0.05 * 255 for i, r in enumerate(representatives))
+
+def test_duplicates_take_the_embedding_of_their_keyframe():
+    clips = [scene(3, seed=1) + scene(2, seed=2), scene(2, seed=3)]
+    calls = []
+    def counting_encode(frames):
+        calls.append(len(frames))
+        return encode_frames(frames)
+    embs = _encode_clips(counting_encode, clips, 16, 32, frame_filter=HashFilter())
+    assert calls == [3]
+    assert [len(emb) for emb in embs] == [5, 2]
+    for clip_array, emb in zip(clips, embs):
+        np.testing.assert_allclose(emb, encode_frames(clip_array), rtol=1e-5)
+
+def test_keyframes_of_each_frame_are_returned():
+    clips = [scene(3, seed=1) + scene(2, seed=2), scene(2, seed=3)]
+    embs, keyframes = _encode_clips(encode_frames, clips, 16, 32, frame_filter=HashFilter(), return_keyframes=True)
+    assert [list(clip_keyframes) for clip_keyframes in keyframes] == [[0, 0, 0, 3, 3], [0, 0]]
+    _, keyframes = _encode_clips(encode_frames, clips, 16, 32, return_keyframes=True)
+    assert keyframes == [None, None]
+
+class FilteredEncoder(EmbeddingModel):
+
+    def __init__(self):
+        self.frame_filter = HashFilter()
+
+    def get_clips_embedding(self, clips:list) -> list:
+        return _encode_clips(encode_frames, clips, 16, 32, frame_filter=self.frame_filter)
+
+    def get_clips_embedding_and_keyframes(self, clips:list) -> tuple:
+        return _encode_clips(encode_frames, clips, 16, 32, frame_filter=self.frame_filter, return_keyframes=True)
+
+def test_keyframes_are_recorded_in_the_metadata(tmp_path):
+    from embedding_cache import EmbeddingCache
+    cache = EmbeddingCache(str(tmp_path), model_name='filtered', fingerprint='v1')
+    clips = [(1, scene(2, seed=1) + scene(2, seed=2), {'video': 'v', 'start_frame': 0, 'end_frame': 4}, None),
+             (2, scene(1, seed=3), {'video': 'v', 'start_frame': 4, 'end_frame': 5}, None)]
+    embs, encoded = encode_clips(FilteredEncoder(), clips, cache)
+    assert encoded == 2 and [len(emb) for emb in embs] == [4, 1]
+    assert clips[0][2]['keyframes'] == [0, 0, 2, 2] and clips[1][2]['keyframes'] == [0]
+    # Cached clips keep the keyframes they were encoded with
+    assert cache.get_keyframes('v', 0, 4) == [0, 0, 2, 2]
+
+def test_keyframes_are_not_recorded_without_a_filter():
+    clips = [(1, scene(2, seed=1), {'video': 'v', 'start_frame': 0, 'end_frame': 2}, None)]
+    class Encoder(EmbeddingModel):
+        def __init__(self):
+            pass
+        def get_clip_embedding(self, clip_array:list) -> np.ndarray:
+            return encode_frames(clip_array)
+    encode_clips(Encoder(), clips)
+    assert 'keyframes' not in clips[0][2]
+
+def test_filters_are_part_of_the_encoder_params():
+    assert FrameDifferenceFilter().get_params() != FrameDifferenceFilter(threshold=0.05).get_params()
+    assert HashFilter().get_params()['name'] == 'hash'
+
+def test_unknown_filters_are_rejected():
+    with pytest.raises(TypeError):
+        FrameFilterBuilder.build('optical-flow')
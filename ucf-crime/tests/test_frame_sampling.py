@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+
+from video_readers import possible_decoders, DecoderBuilder, sample_clips, sliding_windows
+
+class FakeDecoder:
+
+    def __init__(self, frames:int):
+        self.frames = frames
+        self.fps = 10.
+        self.decoded = []
+        # Like real decoders, the yielded frame is a reusable buffer
+        self._buffer = np.empty((2, 2, 3), dtype=np.uint8)
+
+    def read_frames(self, indices):
+        for index in indices:
+            if index >= self.frames:
+                return
+            self.decoded.append(index)
+            self._buffer[:] = index
+            yield index, self._buffer
+
+def frame_values(frames) -> list:
+    return [int(frame[0, 0, 0]) for frame in frames]
+
+def test_clips_get_their_sampled_frames():
+    decoder = FakeDecoder(100)
+    clips = dict(sample_clips(decoder, [(0, 10), (20, 30), (5, 15)], step=2))
+    assert frame_values(clips[0]) == [0, 2, 4, 6, 8]
+    assert frame_values(clips[1]) == [20, 22, 24, 26, 28]
+    assert frame_values(clips[2]) == [5, 7, 9, 11, 13]
+
+def test_frames_of_overlapping_clips_are_decoded_once():
+    decoder = FakeDecoder(100)
+    list(sample_clips(decoder, [(0, 20), (10, 30), (10, 30)], step=5))
+    assert decoder.decoded == [0, 5, 10, 15, 20, 25]
+
+def test_clips_are_yielded_once_their_last_frame_is_decoded():
+    decoder = FakeDecoder(100)
+    order = []
+    for i, _ in sample_clips(decoder, [(40, 50), (0, 10), (0, 50)], step=10):
+        order.append((i, decoder.decoded[-1]))
+    assert order == [(1, 0), (0, 40), (2, 40)]
+
+def test_clips_beyond_the_end_of_the_video_keep_the_read_frames():
+    decoder = FakeDecoder(25)
+    clips = dict(sample_clips(decoder, [(20, 40), (30, 40), (0, 10)], step=2))
+    assert frame_values(clips[0]) == [20, 22, 24]
+    assert len(clips[1]) == 0
+    assert frame_values(clips[2]) == [0, 2, 4, 6, 8]
+
+def test_empty_clips_are_yielded_first():
+    decoder = FakeDecoder(25)
+    assert next(sample_clips(decoder, [(0, 10), (5, 5)], step=1)) == (1, [])
+
+@pytest.fixture(scope='module')
+def video_path(tmp_path_factory) -> str:
+    cv2 = pytest.importorskip('cv2')
+    path = str(tmp_path_factory.mktemp('videos') / 'video.mp4')
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), 10, (32, 24))
+    rng = np.random.default_rng(0)
+    for _ in range(30):
+        writer.write(rng.integers(0, 256, size=(24, 32, 3), dtype=np.uint8))
+    writer.release()
+    return path
+
+@pytest.mark.parametrize('decoder_name', possible_decoders)
+def test_sampled_frames_match_a_full_decode(video_path, decoder_name):
+    pytest.importorskip({'opencv': 'cv2', 'pyav': 'av', 'decord': 'decord'}[decoder_name])
+    decoder = DecoderBuilder.build(decoder_name, video_path)
+    frames = [frame.copy() for _, frame in decoder.read_frames(range(30))]
+    decoder.release()
+
+    clips = [(0, 16), (8, 24), (20, 40)]
+    decoder = DecoderBuilder.build(decoder_name, video_path)
+    sampled = dict(sample_clips(decoder, clips, step=4))
+    decoder.release()
+    for i, (start_frame, end_frame) in enumerate(clips):
+        expected = frames[start_frame:min(end_frame, 30):4]
+        assert len(sampled[i]) == len(expected)
+        for frame, expected_frame in zip(sampled[i], expected):
+            np.testing.assert_array_equal(frame, expected_frame)
+
+def windows(frames:int, window:int, stride:int, step:int) -> list:
+    return [(start, end, frame_values(window_frames))
+            for start, end, window_frames in sliding_windows(FakeDecoder(frames), window, stride, step)]
+
+def test_consecutive_windows():
+    assert windows(30, 10, 10, 5) == [(0, 10, [0, 5]), (10, 20, [10, 15]), (20, 30, [20, 25])]
+
+def test_overlapping_windows_share_their_frames():
+    decoder = FakeDecoder(20)
+    result = [(start, end, frame_values(frames)) for start, end, frames in sliding_windows(decoder, 10, 5, 5)]
+    assert result == [(0, 10, [0, 5]), (5, 15, [5, 10]), (10, 20, [10, 15])]
+    assert decoder.decoded == [0, 5, 10, 15]
+
+def test_windows_whose_sampled_frames_were_read_are_complete():
+    # Frames after the last sampled one are not needed
+    assert windows(27, 10, 10, 5) == [(0, 10, [0, 5]), (10, 20, [10, 15]), (20, 30, [20, 25])]
+
+def test_partial_tail_keeps_the_read_frames():
+    assert windows(23, 10, 10, 5) == [(0, 10, [0, 5]), (10, 20, [10, 15]), (20, 21, [20])]
+
+def test_tail_without_new_frames_is_not_yielded():
+    # The last sampled frame (20) belongs to the previous window
+    assert windows(22, 10, 5, 5) == [(0, 10, [0, 5]), (5, 15, [5, 10]), (10, 20, [10, 15]), (15, 25, [15, 20])]
+
+def test_video_shorter_than_a_window():
+    assert windows(7, 10, 10, 2) == [(0, 7, [0, 2, 4, 6])]
+    assert windows(0, 10, 10, 2) == []
@@ -0,0 +1,36 @@
+import os
+
+import pytest
+
+from ingestion_benchmark import make_synthetic_dataset, benchmark_ingestion
+from my_utils import read_uca_as_df
+from ucf_encoding import list_ucf_videos
+
+SYNTHETIC = {'num_videos': 3, 'duration_s': 2, 'fps': 10, 'width': 32, 'height': 24, 'clips_per_video': 2, 'clip_s': 1}
+
+@pytest.fixture(scope='module')
+def dataset(tmp_path_factory) -> tuple:
+    data_path = str(tmp_path_factory.mktemp('synthetic'))
+    return data_path, make_synthetic_dataset(data_path, **SYNTHETIC)
+
+def test_synthetic_dataset_layout(dataset):
+    data_path, summary = dataset
+    assert len(list_ucf_videos(os.path.join(data_path, 'videos'))) == 3
+    uca_df = read_uca_as_df(os.path.join(data_path, 'uca'))
+    assert len(uca_df) == summary['clips'] == 6
+    assert (uca_df['end_s'] <= 2).all()
+    assert summary['sampled_frames'] == 6
+
+def test_synthetic_dataset_is_reused(dataset):
+    data_path, summary = dataset
+    mtime = os.path.getmtime(os.path.join(data_path, 'uca'))
+    assert make_synthetic_dataset(data_path, **SYNTHETIC) == summary
+    assert os.path.getmtime(os.path.join(data_path, 'uca')) == mtime
+
+def test_ingestion_throughput(dataset, tmp_path):
+    data_path, summary = dataset
+    result = benchmark_ingestion(data_path, summary, 'random', 'local', str(tmp_path / 'collections'))
+    assert result['stages']['encode']['count'] == 6
+    # Upload rows/s is measured from the handler's writes, which store every clip
+    assert result['stages']['write']['count'] == result['stored_rows'] == 6
+    assert result['upload_rows_per_s'] > 0 and result['clips_per_s'] > 0 and result['peak_rss_mb'] > 0
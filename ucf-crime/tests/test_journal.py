@@ -0,0 +1,78 @@
+import os
+
+import pytest
+
+from checkpoint import IngestionJournal
+from databases import LocalDatabase
+from ingestion_benchmark import make_synthetic_dataset
+from ucf_encoding import uca_encode
+
+def test_completed_clips_are_read_back(tmp_path):
+    journal = IngestionJournal(str(tmp_path))
+    journal.record([1, 2])
+    journal.record([3])
+    reopened = IngestionJournal(str(tmp_path))
+    assert all(reopened.is_completed(id) for id in (1, 2, 3)) and not reopened.is_completed(4)
+    assert reopened.last_id == 3
+
+def test_clips_of_every_process_are_completed(tmp_path):
+    IngestionJournal(str(tmp_path), name='shard0').record([1])
+    IngestionJournal(str(tmp_path), name='shard1').record([2])
+    journal = IngestionJournal(str(tmp_path), name='shard0')
+    assert journal.is_completed(1) and journal.is_completed(2)
+    assert journal.last_id == 1
+
+def test_partially_written_lines_are_ignored(tmp_path):
+    journal = IngestionJournal(str(tmp_path))
+    journal.record([1])
+    with open(journal.file, 'a') as fp:
+        fp.write('{"ids": [2')
+    assert IngestionJournal(str(tmp_path)).completed == {1}
+
+def test_clear_forgets_every_clip(tmp_path):
+    IngestionJournal(str(tmp_path), name='shard1').record([2])
+    journal = IngestionJournal(str(tmp_path))
+    journal.record([1])
+    journal.clear()
+    assert journal.completed == set()
+    assert IngestionJournal(str(tmp_path)).completed == set()
+
+@pytest.fixture(scope='module')
+def dataset(tmp_path_factory) -> str:
+    data_path = str(tmp_path_factory.mktemp('dataset'))
+    make_synthetic_dataset(data_path, num_videos=3, duration_s=2, fps=10, width=32, height=24, clips_per_video=2, clip_s=1)
+    return data_path
+
+def encode(data_path:str, save_path:str, journal_path:str, resume:bool) -> dict:
+    return uca_encode(os.path.join(data_path, 'videos'), os.path.join(data_path, 'uca'), None, 'random', 'local',
+                      progress=lambda *args: None,
+                      buffer_rows=1,
+                      database_kwargs={'save_path': save_path},
+                      journal_path=journal_path,
+                      resume=resume)
+
+def test_resumed_ingestion_skips_completed_clips(dataset, tmp_path):
+    save_path, journal_path = str(tmp_path / 'collections'), str(tmp_path / 'journal')
+    stats = encode(dataset, save_path, journal_path, resume=False)
+    assert stats['encode'].count == 6
+
+    # Nothing is left to encode
+    stats = encode(dataset, save_path, journal_path, resume=True)
+    assert stats['encode'].count == 0
+
+    # Interrupted after writing two clips, the rest are encoded again
+    journal_file = IngestionJournal(journal_path, name='shard0of1').file
+    with open(journal_file, 'r') as fp:
+        lines = fp.readlines()
+    with open(journal_file, 'w') as fp:
+        fp.writelines(lines[:2])
+    stats = encode(dataset, save_path, journal_path, resume=True)
+    assert stats['encode'].count == 4
+    _, metadata = LocalDatabase.load_collection(os.path.join(save_path, 'ucfrandom'))
+    assert len(metadata) == 6 and len(IngestionJournal(journal_path).completed) == 6
+
+def test_new_ingestion_clears_the_journal(dataset, tmp_path):
+    save_path, journal_path = str(tmp_path / 'collections'), str(tmp_path / 'journal')
+    encode(dataset, save_path, journal_path, resume=False)
+    stats = encode(dataset, save_path, journal_path, resume=False)
+    assert stats['encode'].count == 6
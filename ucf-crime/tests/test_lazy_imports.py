@@ -0,0 +1,42 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import databases
+import vision_encoders
+
+HEAVY_MODULES = ['torch', 'transformers', 'pymilvus', 'qdrant_client', 'clip_encoders', 'vclip_encoders',
+                 'milvus_database', 'qdrant_database']
+
+@pytest.mark.parametrize('module_name', ['vision_encoders', 'databases', 'ucf_encoding', 'stream_ingest', 'retrieval_benchmark'])
+def test_backends_are_not_imported_at_startup(module_name):
+    # A fresh interpreter, since this one may have imported them already
+    code = f'import sys, {module_name}; print(",".join(name for name in {HEAVY_MODULES!r} if name in sys.modules))'
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert output.stdout.strip() == ''
+
+def test_lightweight_encoders_and_databases_are_built(tmp_path):
+    model = vision_encoders.EncoderBuilder.build('random', embedding_size=(4,))
+    handler = databases.DatabaseBuilder.build('local', model.get_encoder_params(), save_path=str(tmp_path))
+    handler.close()
+    assert isinstance(handler, databases.LocalDatabase)
+
+def test_registered_backends_are_imported_when_built():
+    vision_encoders.register_encoder('test-default', 'vision_encoders', 'DefaultEncoder')
+    try:
+        assert 'test-default' in vision_encoders.possible_models
+        assert isinstance(vision_encoders.EncoderBuilder.build('test-default'), vision_encoders.DefaultEncoder)
+    finally:
+        del vision_encoders.encoder_registry['test-default']
+        vision_encoders.possible_models.remove('test-default')
+
+def test_unknown_backends_are_rejected():
+    with pytest.raises(TypeError):
+        vision_encoders.EncoderBuilder.build('resnet')
+    with pytest.raises(TypeError):
+        databases.DatabaseBuilder.build('chroma', {})
+    with pytest.raises(AttributeError):
+        databases.NotAHandler
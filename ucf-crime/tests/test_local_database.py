@@ -0,0 +1,122 @@
+import multiprocessing as mp
+
+import numpy as np
+import pytest
+
+from databases import LocalDatabase
+
+def encoder_params(embedding_list:bool=False, dim:int=4, name:str='test') -> dict:
+    return {'model_name': name, 'embedding_size': dim, 'embedding_list': embedding_list, 'dtype': 'float32'}
+
+def clip_embedding(id:int, rows:int=None, dim:int=4) -> np.ndarray:
+    # Every value of the embedding is the id, so rows can be traced back to their clip
+    return np.full((rows, dim) if rows else dim, id, dtype=np.float32)
+
+def check_rows(collection_path:str, ids:list, rows:int=1):
+    vectors, metadata = LocalDatabase.load_collection(collection_path)
+    assert sorted(metadata['id']) == sorted(ids)
+    assert len(vectors) == rows * len(ids)
+    for id, offset, count in zip(metadata['id'], metadata['offset'], metadata['rows']):
+        assert (vectors[offset:offset+count] == id).all()
+
+def test_rows_are_loaded_back(tmp_path):
+    with LocalDatabase(encoder_params(embedding_list=True), save_path=str(tmp_path), initial_capacity=2, buffer_rows=3) as db:
+        for id in range(1, 6):
+            db.add(id, clip_embedding(id, rows=2), {'video': f'v{id}'})
+    check_rows(db.collection_path, list(range(1, 6)), rows=2)
+    _, metadata = LocalDatabase.load_collection(db.collection_path)
+    assert list(metadata['video']) == [f'v{id}' for id in range(1, 6)]
+
+def test_clips_written_again_keep_the_last_copy(tmp_path):
+    with LocalDatabase(encoder_params(), save_path=str(tmp_path)) as db:
+        db.upload_embedding(1, clip_embedding(1), {'version': 1})
+        db.upload_embedding(2, clip_embedding(2), {'version': 1})
+        db.upload_embedding(1, clip_embedding(1), {'version': 2})
+    _, metadata = LocalDatabase.load_collection(db.collection_path)
+    assert sorted(zip(metadata['id'], metadata['version'])) == [(1, 2), (2, 1)]
+
+def test_existing_collections_are_kept_unless_rewritten(tmp_path):
+    with LocalDatabase(encoder_params(), save_path=str(tmp_path)) as db:
+        db.upload_embedding(1, clip_embedding(1), {})
+    with LocalDatabase(encoder_params(), save_path=str(tmp_path), rewrite=False) as db:
+        db.upload_embedding(2, clip_embedding(2), {})
+    check_rows(db.collection_path, [1, 2])
+    with LocalDatabase(encoder_params(), save_path=str(tmp_path), rewrite=True) as db:
+        pass
+    check_rows(db.collection_path, [])
+
+def test_existing_collections_of_another_size_are_rejected(tmp_path):
+    LocalDatabase(encoder_params(dim=4), save_path=str(tmp_path)).close()
+    with pytest.raises(ValueError):
+        LocalDatabase(encoder_params(dim=8), save_path=str(tmp_path), rewrite=False)
+
+def test_two_handlers_write_to_the_same_collection(tmp_path):
+    first = LocalDatabase(encoder_params(), save_path=str(tmp_path), initial_capacity=2, buffer_rows=1)
+    second = LocalDatabase(encoder_params(), save_path=str(tmp_path), initial_capacity=2, buffer_rows=1, rewrite=False)
+    for id in range(1, 11):
+        (first if id % 2 else second).add(id, clip_embedding(id), {})
+    first.close()
+    second.close()
+    check_rows(first.collection_path, list(range(1, 11)))
+
+def _write_clips(save_path:str, ids:list):
+    with LocalDatabase(encoder_params(), save_path=save_path, initial_capacity=2, buffer_rows=1, rewrite=False) as db:
+        for id in ids:
+            db.add(id, clip_embedding(id), {})
+
+def test_processes_write_to_the_same_collection(tmp_path):
+    LocalDatabase(encoder_params(), save_path=str(tmp_path), initial_capacity=2).close()
+    context = mp.get_context('spawn')
+    processes = [context.Process(target=_write_clips, args=(str(tmp_path), list(range(start, 200, 4))))
+                 for start in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+    check_rows(str(tmp_path / 'ucftest'), list(range(200)))
+
+def one_hot(index:int, rows:int=None, dim:int=8) -> np.ndarray:
+    emb = np.zeros(dim, dtype=np.float32)
+    emb[index] = 1
+    return np.tile(emb, (rows, 1)) if rows else emb
+
+def test_search_finds_the_closest_clip(tmp_path):
+    with LocalDatabase(encoder_params(dim=8), save_path=str(tmp_path)) as db:
+        for id in range(8):
+            db.add(id, one_hot(id), {'label': 'normal' if id % 2 else 'anomaly'})
+        results = db.search(np.stack([one_hot(3), one_hot(6)]), k=2)
+        assert [hits[0]['id'] for hits in results] == [3, 6]
+        assert results[0][0]['metadata'] == {'label': 'normal'}
+        assert results[0][0]['score'] == pytest.approx(1)
+
+def test_search_filters_metadata(tmp_path):
+    with LocalDatabase(encoder_params(dim=8), save_path=str(tmp_path)) as db:
+        for id in range(8):
+            db.add(id, one_hot(id), {'label': 'normal' if id % 2 else 'anomaly'})
+        hits, = db.search(one_hot(3), k=8, filter={'label': 'anomaly'})
+        assert sorted(hit['id'] for hit in hits) == [0, 2, 4, 6]
+        assert db.search(one_hot(3), k=8, filter={'camera': 1}) == [[]]
+
+def test_search_ignores_the_rows_of_clips_written_again(tmp_path):
+    with LocalDatabase(encoder_params(embedding_list=True, dim=8), save_path=str(tmp_path)) as db:
+        db.add(1, one_hot(1, rows=3), {'version': 1})
+        db.add(2, one_hot(2, rows=2), {'version': 1})
+        db.add(1, one_hot(5, rows=2), {'version': 2})
+        hits, = db.search(one_hot(1), k=10)
+        assert all(hit['metadata']['clip_id'] != 1 or hit['metadata']['version'] == 2 for hit in hits)
+        assert len(hits) == 4
+        hit, = db.search(one_hot(5), k=1)[0]
+        assert (hit['metadata']['clip_id'], hit['metadata']['frame']) == (1, 0)
+
+def test_search_sees_rows_written_after_the_last_search(tmp_path):
+    with LocalDatabase(encoder_params(dim=8), save_path=str(tmp_path), buffer_rows=1) as db:
+        other = LocalDatabase(encoder_params(dim=8), save_path=str(tmp_path), buffer_rows=1, rewrite=False)
+        db.add(1, one_hot(1), {})
+        assert db.search(one_hot(4), k=1)[0][0]['id'] == 1
+        db.add(2, one_hot(2), {})
+        assert db.search(one_hot(2), k=1)[0][0]['id'] == 2
+        # Rows written by another handler are found too
+        other.add(4, one_hot(4), {})
+        other.close()
+        assert db.search(one_hot(4), k=1)[0][0]['id'] == 4
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from local_index import exact_search, IVFIndex
+
+def clustered(rows:int, dim:int=16, clusters:int=20, seed:int=0) -> np.ndarray:
+    # Embeddings grouped around a few directions, like those of similar clips
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim))
+    return (centers[rng.integers(clusters, size=rows)] + 0.3 * rng.standard_normal((rows, dim))).astype(np.float32)
+
+def brute_force(vectors:np.ndarray, queries:np.ndarray, distance:str, k:int) -> np.ndarray:
+    if distance == 'COS':
+        vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    return np.argsort(-(queries @ vectors.T), axis=1, kind='stable')[:, :k]
+
+def recall(rows:np.ndarray, expected:np.ndarray) -> float:
+    return np.mean([len(set(found) & set(wanted)) / len(wanted) for found, wanted in zip(rows, expected)])
+
+@pytest.mark.parametrize('distance', ['COS', 'DOT'])
+def test_exact_search_matches_brute_force(distance):
+    vectors, queries = clustered(500), clustered(10, seed=1)
+    scores, rows = exact_search(vectors, queries, distance, k=5, chunk_rows=64)
+    np.testing.assert_array_equal(rows, brute_force(vectors, queries, distance, 5))
+    assert (np.diff(scores, axis=1) <= 0).all()
+
+def test_exact_search_respects_the_valid_rows():
+    vectors = clustered(100)
+    valid_rows = np.zeros(100, dtype=bool)
+    valid_rows[[3, 50, 97]] = True
+    scores, rows = exact_search(vectors, vectors[:2], k=5, valid_rows=valid_rows, chunk_rows=16)
+    assert set(rows[0, :3]) == {3, 50, 97}
+    assert (rows[:, 3:] == -1).all() and (scores[:, 3:] == -np.inf).all()
+
+def test_ivf_probing_every_cluster_is_exact():
+    vectors, queries = clustered(1000), clustered(20, seed=1)
+    index = IVFIndex(nlist=16, nprobe=16)
+    index.build(vectors)
+    _, rows = index.search(vectors, queries, k=10)
+    _, exact_rows = exact_search(vectors, queries, k=10)
+    np.testing.assert_array_equal(rows, exact_rows)
+
+def test_ivf_recall_against_exact_search():
+    vectors, queries = clustered(5000), clustered(50, seed=1)
+    _, exact_rows = exact_search(vectors, queries, k=10)
+    recalls = []
+    for nprobe in (1, 4, 16):
+        index = IVFIndex(nlist=64, nprobe=nprobe)
+        index.build(vectors)
+        recalls.append(recall(index.search(vectors, queries, k=10)[1], exact_rows))
+    assert recalls == sorted(recalls)
+    assert recalls[-1] >= 0.9
+
+def test_ivf_finds_rows_appended_after_building():
+    vectors = clustered(500)
+    index = IVFIndex(nlist=16, nprobe=1)
+    index.build(vectors[:400])
+    _, rows = index.search(vectors, vectors[450:460], k=1)
+    assert list(rows[:, 0]) == list(range(450, 460))
+
+def test_ivf_of_an_empty_collection():
+    vectors = clustered(10)
+    index = IVFIndex()
+    index.build(vectors[:0])
+    _, rows = index.search(vectors, vectors[:1], k=3)
+    assert rows[0, 0] == 0
+
+def test_ivf_is_saved_and_loaded(tmp_path):
+    vectors, queries = clustered(1000), clustered(10, seed=1)
+    index = IVFIndex(nlist=16, nprobe=4)
+    index.build(vectors)
+    index.save(str(tmp_path / 'index.npz'))
+    loaded = IVFIndex.load(str(tmp_path / 'index.npz'))
+    for expected, result in zip(index.search(vectors, queries, k=5), loaded.search(vectors, queries, k=5)):
+        np.testing.assert_array_equal(expected, result)
+
+def test_local_database_ivf_search(tmp_path):
+    from databases import LocalDatabase
+    params = {'model_name': 'test', 'embedding_size': 16, 'embedding_list': False, 'dtype': 'float32'}
+    vectors = clustered(300)
+    with LocalDatabase(params, save_path=str(tmp_path), index='ivf', nlist=8, nprobe=8) as db:
+        for id, emb in enumerate(vectors):
+            db.add(id, emb, {'video': f'v{id}'})
+        db.build_index()
+        assert [hits[0]['id'] for hits in db.search(vectors[:5], k=1)] == [0, 1, 2, 3, 4]
+        # Rows written after the index was built are found too
+        db.add(1000, -vectors[0], {'video': 'v1000'})
+        assert db.search(-vectors[0], k=1)[0][0]['id'] == 1000
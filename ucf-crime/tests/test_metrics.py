@@ -0,0 +1,56 @@
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+from metrics import MetricsRegistry, serve_metrics, JsonMetricsLogger
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    histogram = registry.histogram('step_seconds', 'Time of a step', buckets=(0.1, 1.))
+    for value in (0.05, 0.5, 0.7, 5.):
+        histogram.observe(value)
+    assert histogram.to_dict() == {'count': 4, 'sum': pytest.approx(6.25), 'buckets': {0.1: 1, 1.: 2}}
+    exposition = registry.to_prometheus()
+    assert 'ucf_step_seconds_bucket{le="0.1"} 1' in exposition
+    assert 'ucf_step_seconds_bucket{le="1.0"} 3' in exposition
+    assert 'ucf_step_seconds_bucket{le="+Inf"} 4' in exposition
+    assert '# TYPE ucf_step_seconds histogram' in exposition
+
+def test_metrics_are_created_once():
+    registry = MetricsRegistry()
+    registry.counter('frames_total').inc(3)
+    registry.counter('frames_total').inc()
+    assert registry.to_dict()['ucf_frames_total'] == {'value': 4}
+    assert 'ucf_frames_total 4' in registry.to_prometheus()
+
+def test_timer_observes_the_time_inside_the_context():
+    registry = MetricsRegistry()
+    with pytest.raises(ValueError):
+        with registry.timer('failing_seconds'):
+            raise ValueError
+    assert registry.histogram('failing_seconds').count == 1
+
+def test_metrics_are_served_to_prometheus():
+    registry = MetricsRegistry()
+    registry.counter('rows_total').inc(7)
+    server = serve_metrics(0, registry)
+    port = server.server_address[1]
+    try:
+        with urllib.request.urlopen(f'http://localhost:{port}/metrics') as response:
+            assert 'ucf_rows_total 7' in response.read().decode('utf-8')
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f'http://localhost:{port}/other')
+    finally:
+        server.shutdown()
+
+def test_logger_writes_a_last_snapshot_when_stopped(tmp_path):
+    registry = MetricsRegistry()
+    log_path = str(tmp_path / 'metrics.jsonl')
+    with JsonMetricsLogger(log_path, interval=60, registry=registry):
+        registry.counter('clips_total').inc(2)
+    with open(log_path, 'r') as fp:
+        snapshots = [json.loads(line) for line in fp]
+    assert len(snapshots) == 1
+    assert snapshots[0]['metrics']['ucf_clips_total'] == {'value': 2}
@@ -0,0 +1,70 @@
+import socket
+import time
+
+import numpy as np
+import pytest
+
+pytest.importorskip('pymilvus')
+pytest.importorskip('env')
+server = pytest.importorskip('milvus_lite.server')
+
+from milvus_database import MilvusDatabase
+from my_utils import stable_frame_id
+
+@pytest.fixture(scope='module')
+def milvus_port(tmp_path_factory):
+    # A Milvus Lite server, which runs the same requests as a standalone one
+    with socket.socket() as sock:
+        sock.bind(('localhost', 0))
+        port = sock.getsockname()[1]
+    lite = server.Server(str(tmp_path_factory.mktemp('milvus') / 'milvus.db'), f'localhost:{port}')
+    if not lite.init() or not lite.start():
+        pytest.skip('Milvus Lite could not be started')
+    time.sleep(2)
+    yield port
+    lite.stop()
+
+def one_hot(index:int, rows:int=None, dim:int=8) -> np.ndarray:
+    emb = np.zeros(dim, dtype=np.float32)
+    emb[index] = 1
+    return np.tile(emb, (rows, 1)) if rows else emb
+
+def open_database(port:int, embedding_list:bool, dtype:str) -> MilvusDatabase:
+    params = {'model_name': f'test{int(embedding_list)}{dtype}', 'embedding_size': 8,
+              'embedding_list': embedding_list, 'dtype': dtype}
+    # Milvus Lite only indexes float16 embeddings with FLAT
+    return MilvusDatabase(params, host='localhost', port=port, buffer_rows=2, index_type='FLAT')
+
+def metadata(id:int) -> dict:
+    return {'video': f'v{id}', 'class_name': 'Abuse' if id % 2 else 'Normal', 'start_frame': id}
+
+@pytest.mark.parametrize('dtype', ['float32', 'float16'])
+def test_clip_embeddings_are_searched(milvus_port, dtype):
+    db = open_database(milvus_port, False, dtype)
+    try:
+        for id in range(1, 6):
+            db.add(id, one_hot(id).astype(dtype), metadata(id))
+        db.build_index()
+        hits, = db.search(one_hot(3), k=2)
+        assert hits[0]['id'] == 3
+        assert hits[0]['metadata'] == metadata(3)
+        hits, = db.search(one_hot(2), k=5, filter={'class_name': 'Abuse'})
+        assert sorted(hit['id'] for hit in hits) == [1, 3, 5]
+    finally:
+        db.close()
+
+@pytest.mark.parametrize('dtype', ['float32', 'float16'])
+def test_frame_embeddings_are_searched(milvus_port, dtype):
+    db = open_database(milvus_port, True, dtype)
+    try:
+        for id in range(1, 4):
+            db.add(id, one_hot(id, rows=3).astype(dtype), metadata(id))
+        db.build_index()
+        hits, = db.search(one_hot(2), k=3)
+        assert sorted(hit['id'] for hit in hits) == sorted(stable_frame_id(2, frame) for frame in range(3))
+        assert sorted(hit['metadata']['frame'] for hit in hits) == [0, 1, 2]
+        assert all(hit['metadata'] == {**metadata(2), 'clip_id': 2, 'frame': hit['metadata']['frame']} for hit in hits)
+        hits, = db.search(one_hot(2), k=10, filter={'video': 'v3'})
+        assert {hit['metadata']['clip_id'] for hit in hits} == {3} and len(hits) == 3
+    finally:
+        db.close()
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from databases import DatabaseBuilder, LocalDatabase
+from vision_encoders import EmbeddingModel, MultiOutputEncoder, DefaultEncoder
+from test_batched_encoding import encode_frames, random_frames
+
+class FrameEncoder(EmbeddingModel):
+
+    def __init__(self):
+        self.calls = 0
+
+    def get_clip_embedding(self, clip_array:list) -> np.ndarray:
+        self.calls += 1
+        return encode_frames(clip_array)
+
+    def get_encoder_params(self) -> dict:
+        return {'model_name': 'frames', 'embedding_size': 16, 'embedding_list': True, 'dtype': 'float32'}
+
+def test_frames_are_encoded_once_for_every_output():
+    encoder = FrameEncoder()
+    model = MultiOutputEncoder(encoder, ['frames', 'centroid', 'max'])
+    clip_array = random_frames(4)
+    embs = model.get_clip_embedding(clip_array)
+    assert encoder.calls == 1
+    frames = encode_frames(clip_array)
+    np.testing.assert_allclose(embs['frames'], frames, rtol=1e-5)
+    np.testing.assert_allclose(embs['centroid'], frames.mean(axis=0), rtol=1e-5)
+    np.testing.assert_allclose(embs['max'], frames.max(axis=0), rtol=1e-5)
+
+def test_outputs_get_their_own_collection():
+    params = MultiOutputEncoder(FrameEncoder(), ['frames', 'centroid']).get_outputs_params()
+    assert params['frames']['embedding_list'] and params['frames']['model_name'] == 'frames'
+    assert not params['centroid']['embedding_list'] and params['centroid']['model_name'] == 'framescentroid'
+
+def test_encoders_without_frame_embeddings_or_unknown_poolings_are_rejected():
+    with pytest.raises(ValueError):
+        MultiOutputEncoder(DefaultEncoder())
+    with pytest.raises(ValueError):
+        MultiOutputEncoder(FrameEncoder(), ['median'])
+
+def test_clips_are_written_once_every_output_is_written(tmp_path):
+    model = MultiOutputEncoder(FrameEncoder(), ['frames', 'centroid'])
+    handler = DatabaseBuilder.build_multi('local', model.get_outputs_params(), save_path=str(tmp_path), buffer_rows=100)
+    written = []
+    handler.on_write.append(written.extend)
+    with handler:
+        for id in range(3):
+            handler.add(id, model.get_clip_embedding(random_frames(2)), {'video': f'v{id}'})
+        handler.handlers['centroid'].flush()
+        assert written == []
+    assert sorted(written) == [0, 1, 2]
+
+    frames, frames_metadata = LocalDatabase.load_collection(handler.handlers['frames'].collection_path)
+    centroids, _ = LocalDatabase.load_collection(handler.handlers['centroid'].collection_path)
+    assert frames.shape == (6, 16) and centroids.shape == (3, 16)
+    assert list(frames_metadata['rows']) == [2, 2, 2]
+    assert handler.written_rows == 9
@@ -0,0 +1,61 @@
+import numpy as np
+
+from pipeline import IngestionPipeline, database_write_stats
+from databases import LocalDatabase
+from metrics import metrics
+from vision_encoders import DefaultEncoder
+
+class MemoryHandler:
+
+    def __init__(self):
+        self.rows = {}
+
+    def add(self, id:int, emb:np.ndarray, metadata:dict):
+        self.rows[id] = (emb, metadata)
+
+def decode_fn(job):
+    video, clips, fail_after = job
+    for i in range(clips):
+        if i == fail_after:
+            raise IOError(f'{video} is corrupted')
+        yield (hash((video, i)) % 2**31, [np.zeros((4, 4, 3), dtype=np.uint8)], {'video': video, 'clip': i}, None)
+
+def run(jobs:list, **kwargs) -> tuple:
+    handler = MemoryHandler()
+    ingestion = IngestionPipeline(DefaultEncoder(), handler, **kwargs)
+    stats = ingestion.run(jobs, decode_fn)
+    return ingestion, handler, stats
+
+def test_every_clip_is_uploaded():
+    _, handler, stats = run([('a', 3, None), ('b', 5, None)], decode_workers=2, encode_batch_size=4)
+    assert sorted((metadata['video'], metadata['clip']) for _, metadata in handler.rows.values()) == \
+        [('a', 0), ('a', 1), ('a', 2)] + [('b', i) for i in range(5)]
+    assert stats['decode'].count == 8 and stats['upload'].count == 8
+
+def test_decode_failures_are_reported_and_their_clips_not_uploaded():
+    failures = metrics.counter('decode_failures_total', 'Jobs whose decoding failed')
+    before = failures.value
+    ingestion, handler, _ = run([('a', 3, None), ('b', 5, 2)])
+    assert [job for job, _ in ingestion.failed_jobs] == ['b']
+    assert 'corrupted' in ingestion.failed_jobs[0][1]
+    assert failures.value == before + 1
+    assert sorted((metadata['video'], metadata['clip']) for _, metadata in handler.rows.values()) == \
+        [('a', 0), ('a', 1), ('a', 2), ('b', 0), ('b', 1)]
+
+def test_failed_jobs_are_reset_between_runs():
+    handler = MemoryHandler()
+    ingestion = IngestionPipeline(DefaultEncoder(), handler)
+    ingestion.run([('a', 2, 0)], decode_fn)
+    ingestion.run([('a', 2, None)], decode_fn)
+    assert ingestion.failed_jobs == []
+
+def test_write_stats_account_for_the_final_flush(tmp_path):
+    params = {'model_name': 'test', 'embedding_size': 4, 'embedding_list': True, 'dtype': 'float32'}
+    with LocalDatabase(params, save_path=str(tmp_path), buffer_rows=100, buffer_delay=60) as handler:
+        for id in range(5):
+            handler.add(id, np.ones((2, 4), dtype=np.float32), {})
+        # Every row is still buffered
+        assert database_write_stats(handler).count == 0
+    stats = database_write_stats(handler)
+    assert (stats.count, stats.unit) == (10, 'rows')
+    assert stats.busy_time > 0
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('env')
+qdrant_client = pytest.importorskip('qdrant_client')
+
+import qdrant_database
+from qdrant_database import QDrantDatabase
+
+@pytest.fixture
+def database(monkeypatch):
+    # Qdrant's local mode, which evaluates the same filters as a server
+    monkeypatch.setattr(qdrant_database, 'QdrantClient', lambda host, port: qdrant_client.QdrantClient(':memory:'))
+    params = {'model_name': 'test', 'embedding_size': 8, 'embedding_list': False, 'dtype': 'float32'}
+    with QDrantDatabase(params, buffer_rows=100) as db:
+        for id in range(6):
+            emb = np.zeros(8, dtype=np.float32)
+            emb[id] = 1
+            db.add(id, emb + 0.1, {'video': f'v{id}', 'class_name': ['Abuse', 'Arson', 'Normal'][id % 3],
+                                   'anomaly': id % 3 != 2})
+        yield db
+
+def found(db, filter:dict) -> list:
+    hits, = db.search(np.ones(8, dtype=np.float32), k=10, filter=filter)
+    return sorted(hit['id'] for hit in hits)
+
+def test_search_without_filter(database):
+    assert found(database, None) == [0, 1, 2, 3, 4, 5]
+    hits, = database.search(np.eye(8, dtype=np.float32)[3], k=1)
+    assert hits[0]['id'] == 3 and hits[0]['metadata']['video'] == 'v3'
+
+def test_filter_on_a_single_value(database):
+    assert found(database, {'anomaly': False}) == [2, 5]
+    assert found(database, {'class_name': 'Abuse'}) == [0, 3]
+
+def test_filter_on_several_strings(database):
+    assert found(database, {'class_name': ['Abuse', 'Normal']}) == [0, 2, 3, 5]
+
+def test_filter_on_several_bools(database):
+    assert found(database, {'anomaly': [True, False]}) == [0, 1, 2, 3, 4, 5]
+    assert found(database, {'anomaly': [True, False], 'class_name': ['Arson', 'Normal']}) == [1, 2, 4, 5]
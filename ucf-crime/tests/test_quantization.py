@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from local_index import exact_search
+from quantization import ScalarQuantizer, ProductQuantizer, QuantizedIndex
+from test_local_index import clustered, recall
+
+def test_scalar_quantizer_scores_approximate_inner_products():
+    vectors, queries = clustered(1000), clustered(5, seed=1)
+    quantizer = ScalarQuantizer()
+    quantizer.train(vectors)
+    codes = quantizer.encode(vectors)
+    assert codes.dtype == np.uint8 and codes.shape == vectors.shape
+    exact = queries @ vectors.T
+    np.testing.assert_allclose(quantizer.scores(codes, queries), exact, atol=0.02 * np.abs(exact).max())
+
+def test_product_quantizer_compresses_each_subspace_to_a_byte():
+    vectors = clustered(2000, dim=32)
+    quantizer = ProductQuantizer()
+    quantizer.train(vectors)
+    codes = quantizer.encode(vectors)
+    assert quantizer.subspaces == 4 and codes.shape == (2000, 4) and codes.dtype == np.uint8
+
+def test_product_quantizer_rejects_subspaces_not_dividing_the_embeddings():
+    with pytest.raises(ValueError):
+        ProductQuantizer(subspaces=5).train(clustered(100, dim=16))
+
+@pytest.mark.parametrize('codec', ['sq8', 'pq'])
+def test_reranking_recovers_the_recall(codec):
+    vectors, queries = clustered(5000), clustered(50, seed=1)
+    exact_scores, exact_rows = exact_search(vectors, queries, k=10)
+    recalls = []
+    for rerank in (1, 4):
+        index = QuantizedIndex(codec, rerank=rerank, subspaces=8)
+        index.build(vectors)
+        scores, rows = index.search(vectors, queries, k=10)
+        recalls.append(recall(rows, exact_rows))
+    assert recalls[0] <= recalls[1] and recalls[1] >= 0.95
+    # Re-ranked scores are the exact ones
+    np.testing.assert_allclose(scores[:, 0], exact_scores[:, 0], rtol=1e-5)
+
+def test_compressed_copy_is_smaller():
+    vectors = clustered(1000)
+    for codec, row_bytes in (('sq8', 16), ('pq', 2)):
+        index = QuantizedIndex(codec)
+        index.build(vectors)
+        assert index.memory_bytes() == len(vectors) * row_bytes
+
+def test_valid_rows_and_appended_rows():
+    vectors = clustered(600)
+    index = QuantizedIndex('sq8')
+    index.build(vectors[:500])
+    valid_rows = np.ones(600, dtype=bool)
+    valid_rows[0] = False
+    _, rows = index.search(vectors, vectors[[0, 550]], k=1, valid_rows=valid_rows)
+    assert rows[0, 0] != 0 and rows[1, 0] == 550
+
+def test_quantized_index_is_saved_and_loaded(tmp_path):
+    vectors, queries = clustered(1000), clustered(10, seed=1)
+    index = QuantizedIndex('pq', subspaces=4)
+    index.build(vectors)
+    index.save(str(tmp_path / 'codes.npz'))
+    loaded = QuantizedIndex.load(str(tmp_path / 'codes.npz'))
+    for expected, result in zip(index.search(vectors, queries, k=5), loaded.search(vectors, queries, k=5)):
+        np.testing.assert_array_equal(expected, result)
+
+def test_local_database_stores_float16_and_searches_compressed_embeddings(tmp_path):
+    from databases import LocalDatabase
+    params = {'model_name': 'test', 'embedding_size': 16, 'embedding_list': False, 'dtype': 'float32'}
+    vectors = clustered(300)
+    with LocalDatabase(params, save_path=str(tmp_path), dtype='float16', codec='pq', pq_subspaces=4) as db:
+        for id, emb in enumerate(vectors):
+            db.add(id, emb, {'video': f'v{id}'})
+        db.build_index()
+        assert [hits[0]['id'] for hits in db.search(vectors[:5], k=1)] == [0, 1, 2, 3, 4]
+    stored, _ = LocalDatabase.load_collection(db.collection_path)
+    assert stored.dtype == np.float16
+    np.testing.assert_allclose(stored, vectors, rtol=1e-3, atol=1e-3)
+
+def test_codecs_are_only_used_with_exact_search(tmp_path):
+    from databases import LocalDatabase
+    params = {'model_name': 'test', 'embedding_size': 16, 'embedding_list': False}
+    with pytest.raises(ValueError):
+        LocalDatabase(params, save_path=str(tmp_path), index='ivf', codec='sq8')
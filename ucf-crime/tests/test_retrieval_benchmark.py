@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from databases import LocalDatabase
+from retrieval_benchmark import rank_clips, retrieval_metrics, benchmark_retrieval, uca_queries
+from test_uca import write_uca
+
+SENTENCES = ['first', 'second', 'third', 'fourth']
+
+class OneHotEncoder:
+
+    def __init__(self, embedding_list:bool):
+        self.embedding_list = embedding_list
+
+    def get_encoder_params(self) -> dict:
+        return {'model_name': 'onehot', 'embedding_size': 8, 'embedding_list': self.embedding_list, 'dtype': 'float32'}
+
+    def get_text_embedding(self, sentences:list) -> np.ndarray:
+        return np.eye(8, dtype=np.float32)[[SENTENCES.index(sentence) for sentence in sentences]]
+
+def test_metrics_of_known_rankings():
+    metrics = retrieval_metrics([[1, 2, 3], [4, 5, 6]], [{2}, {4, 9}], ks=(1, 2))
+    assert metrics == pytest.approx({'recall@1': 0.25, 'recall@2': 0.75, 'map': 0.5, 'mrr': 0.75})
+
+def test_frames_of_the_same_clip_are_ranked_once():
+    hits = [{'id': 10, 'metadata': {'clip_id': 1}}, {'id': 11, 'metadata': {'clip_id': 1}},
+            {'id': 20, 'metadata': {'clip_id': 2}}, {'id': 30, 'metadata': {'clip_id': 3}}]
+    assert rank_clips(hits, k=2) == [1, 2]
+    assert rank_clips([{'id': 5, 'metadata': {}}], k=2) == [5]
+
+@pytest.mark.parametrize('embedding_list', [False, True])
+def test_benchmark_of_a_perfect_collection(tmp_path, embedding_list):
+    model = OneHotEncoder(embedding_list)
+    with LocalDatabase(model.get_encoder_params(), save_path=str(tmp_path)) as db:
+        for id in range(4):
+            emb = np.eye(8, dtype=np.float32)[id]
+            db.add(100 + id, np.stack([emb, emb + 0.1]) if embedding_list else emb, {'video': f'v{id}'})
+        result = benchmark_retrieval(model, db, SENTENCES, [{100}, {101}, {102}, {103}], ks=(1, 5), query_batch_size=3)
+    assert result['recall@1'] == result['map'] == result['mrr'] == 1.
+    assert result['queries'] == 4 and result['latency_p50_ms'] > 0
+
+def test_latency_is_measured_per_query(tmp_path):
+    model = OneHotEncoder(False)
+    searched = []
+    with LocalDatabase(model.get_encoder_params(), save_path=str(tmp_path)) as db:
+        for id in range(4):
+            db.add(100 + id, np.eye(8, dtype=np.float32)[id], {'video': f'v{id}'})
+        search = db.search
+        def counting_search(query_vectors, k):
+            searched.append(len(query_vectors))
+            return search(query_vectors, k)
+        db.search = counting_search
+        result = benchmark_retrieval(model, db, SENTENCES, [{100}, {101}, {102}, {103}], ks=(1,), query_batch_size=3)
+        assert searched == [3, 1, 1, 1, 1, 1]
+        searched.clear()
+        benchmark_retrieval(model, db, SENTENCES, [{100}, {101}, {102}, {103}], ks=(1,), query_batch_size=3, latency_queries=2)
+        assert searched == [3, 1, 1, 1]
+    assert 0 < result['latency_p50_ms'] <= result['latency_p99_ms']
+
+def test_queries_are_the_distinct_sentences(tmp_path):
+    annotations = {
+        'train': {},
+        'val': {},
+        'test': {'Abuse001_x264': {'duration': 10., 'timestamps': [[0., 2.], [3., 5.]], 'sentences': ['A fight.', 'A fight.']},
+                 'Arson002_x264': {'duration': 10., 'timestamps': [[1., 2.]], 'sentences': ['A fire.']}},
+    }
+    write_uca(str(tmp_path), annotations)
+    sentences, relevants = uca_queries(str(tmp_path), ['test'])
+    assert sorted(zip(sentences, map(len, relevants))) == [('A fight.', 2), ('A fire.', 1)]
@@ -0,0 +1,32 @@
+import pytest
+
+from my_utils import video_shard, split_shard, parse_shard, stable_clip_id, stable_frame_id
+
+VIDEOS = [f'Video{i:03d}_x264' for i in range(200)]
+
+def test_shards_partition_the_videos():
+    shards = [video_shard(video, 4) for video in VIDEOS]
+    assert set(shards) == {0, 1, 2, 3}
+
+@pytest.mark.parametrize('num_shards, workers', [(1, 3), (2, 2), (3, 4)])
+def test_worker_sub_shards_only_contain_videos_of_their_shard(num_shards, workers):
+    covered = []
+    for index in range(num_shards):
+        shard_videos = {video for video in VIDEOS if video_shard(video, num_shards) == index}
+        worker_videos = [video for sub_index, sub_num_shards in split_shard((index, num_shards), workers)
+                         for video in VIDEOS if video_shard(video, sub_num_shards) == sub_index]
+        assert sorted(worker_videos) == sorted(shard_videos)
+        covered.extend(worker_videos)
+    assert sorted(covered) == sorted(VIDEOS)
+
+def test_parse_shard():
+    assert parse_shard('1/4') == (1, 4)
+    with pytest.raises(ValueError):
+        parse_shard('4/4')
+
+def test_stable_ids_do_not_depend_on_the_process():
+    assert stable_clip_id('Abuse001_x264', (0.5, 7.2), 'A man hits a woman') == \
+        stable_clip_id('Abuse001_x264', (0.5, 7.2), 'A man hits a woman')
+    ids = {stable_clip_id(video, (0, 1), '') for video in VIDEOS}
+    assert len(ids) == len(VIDEOS) and all(0 <= id < 2**63 for id in ids)
+    assert len({stable_frame_id(1234, frame) for frame in range(100)}) == 100
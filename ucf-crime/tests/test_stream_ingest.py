@@ -0,0 +1,44 @@
+import time
+
+import numpy as np
+
+from stream_ingest import LiveStream, stream_windows
+
+class FakeDecoder:
+
+    def __init__(self, frames:int, fps:float=10.):
+        self.frames = frames
+        self.fps = fps
+
+    def read_frames(self, indices):
+        for index in indices:
+            if index >= self.frames:
+                return
+            yield index, np.full((4, 4, 3), index % 256, dtype=np.uint8)
+
+def windows(frames:int=40, name:str='camera') -> list:
+    return list(stream_windows(LiveStream(FakeDecoder(frames)), name, window_s=1., sample_rate=5.))
+
+def test_windows_cover_the_stream():
+    session = windows()
+    assert [(metadata['start_frame'], metadata['end_frame']) for _, _, metadata, _ in session] == \
+        [(0, 10), (10, 20), (20, 30), (30, 40)]
+    assert all(len(frames) == 5 for _, frames, _, _ in session)
+    assert len({id for id, _, _, _ in session}) == 4
+
+def test_window_times_are_wall_clock_times():
+    before = time.time()
+    session = windows()
+    _, _, first, _ = session[0]
+    assert before <= first['session_start'] <= time.time()
+    assert first['start_time'] == first['session_start']
+    for _, _, metadata, _ in session:
+        assert metadata['start_time'] == first['session_start'] + metadata['start_frame'] / 10
+        assert metadata['capture_time'] == first['session_start'] + (metadata['end_frame'] - 2) / 10
+
+def test_restarted_streams_do_not_reuse_ids():
+    first = windows()
+    time.sleep(0.01)
+    second = windows()
+    assert [metadata['start_frame'] for _, _, metadata, _ in first] == [metadata['start_frame'] for _, _, metadata, _ in second]
+    assert not {id for id, _, _, _ in first} & {id for id, _, _, _ in second}
@@ -0,0 +1,45 @@
+import zlib
+
+import numpy as np
+
+from vision_encoders import EmbeddingModel
+
+class TextEncoder(EmbeddingModel):
+
+    text_batch_size = 2
+
+    def __init__(self):
+        self.batches = []
+
+    def _encode_texts(self, sentences:list) -> np.ndarray:
+        self.batches.append(list(sentences))
+        # A deterministic, non-normalized embedding of each sentence
+        return np.stack([np.random.default_rng(zlib.crc32(sentence.encode())).random(8) * 3 for sentence in sentences])
+
+def test_embeddings_are_normalized_and_in_order():
+    encoder = TextEncoder()
+    embs_array = encoder.get_text_embedding(['a', 'b', 'c'])
+    assert embs_array.shape == (3, 8) and embs_array.dtype == np.float32
+    np.testing.assert_allclose(np.linalg.norm(embs_array, axis=1), 1, rtol=1e-6)
+    np.testing.assert_allclose(encoder.get_text_embedding(['c', 'a'])[0], embs_array[2])
+
+def test_sentences_are_encoded_in_batches_once():
+    encoder = TextEncoder()
+    encoder.get_text_embedding(['a', 'b', 'a', 'c', 'd', 'e'])
+    assert encoder.batches == [['a', 'b'], ['c', 'd'], ['e']]
+    encoder.get_text_embedding(['e', 'f', 'a'])
+    assert encoder.batches[-1] == ['f']
+
+def test_least_recently_requested_sentences_are_evicted():
+    encoder = TextEncoder()
+    encoder.text_cache_size = 2
+    encoder.get_text_embedding(['a', 'b'])
+    encoder.get_text_embedding(['a'])
+    encoder.get_text_embedding(['c'])
+    encoder.get_text_embedding(['a', 'b'])
+    assert encoder.batches[-1] == ['b']
+
+def test_single_sentences_and_no_sentences():
+    encoder = TextEncoder()
+    assert encoder.get_text_embedding('a').shape == (1, 8)
+    assert len(encoder.get_text_embedding([])) == 0
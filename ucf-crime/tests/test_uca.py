@@ -0,0 +1,76 @@
+import json
+import os
+
+import pytest
+
+from my_utils import UCA_JSON_FILES, read_uca_as_df, build_annotation_index, stable_clip_id
+
+ANNOTATIONS = {
+    'train': {'Abuse001_x264': {'duration': 30.5, 'timestamps': [[10.0, 15.0], [0.5, 4.0]],
+                                'sentences': ['A man hits a woman.', 'A woman walks in.']}},
+    'val': {'Normal_Videos_003_x264': {'duration': 12.0, 'timestamps': [[1.0, 3.5]],
+                                       'sentences': ['Cars go by.']}},
+    'test': {'Robbery002_x264': {'duration': 20.0, 'timestamps': [[2.0, 6.0]],
+                                 'sentences': ['A man points a gun.']}},
+}
+
+def write_uca(uca_path:str, annotations:dict=ANNOTATIONS):
+    for dataset, json_file in UCA_JSON_FILES.items():
+        with open(os.path.join(uca_path, json_file), 'w') as fp:
+            json.dump(annotations[dataset], fp)
+
+@pytest.fixture
+def uca_path(tmp_path) -> str:
+    write_uca(str(tmp_path))
+    return str(tmp_path)
+
+def test_one_entry_per_annotation(uca_path):
+    df = read_uca_as_df(uca_path)
+    assert len(df) == 4
+    abuse = df[df['video'] == 'Abuse001_x264'].set_index('sentence')
+    assert abuse.loc['A man hits a woman.', ['start_s', 'end_s', 'clip_duration']].tolist() == [10., 15., 5.]
+    assert set(df['dataset']) == {'train', 'val', 'test'}
+    assert df['video_duration'].dtype == float
+
+def test_classes_and_ids(uca_path):
+    df = read_uca_as_df(uca_path).set_index('video')
+    assert df.loc['Normal_Videos_003_x264', 'class_name'] == 'Normal_Videos'
+    assert not df.loc['Normal_Videos_003_x264', 'anomaly'] and df.loc['Robbery002_x264', 'anomaly']
+    assert df.loc['Robbery002_x264', 'id'] == stable_clip_id('Robbery002_x264', [2.0, 6.0], 'A man points a gun.')
+
+def test_annotations_are_indexed_by_video_and_start(uca_path):
+    index = build_annotation_index(read_uca_as_df(uca_path))
+    assert set(index) == {'Abuse001_x264', 'Normal_Videos_003_x264', 'Robbery002_x264'}
+    assert index['Abuse001_x264']['start_s'].tolist() == [0.5, 10.0]
+
+def test_cached_dataset_is_the_same(uca_path, tmp_path):
+    pytest.importorskip('pyarrow')
+    cache_path = str(tmp_path / 'uca.parquet')
+    df = read_uca_as_df(uca_path, cache_path=cache_path)
+    assert os.path.exists(cache_path)
+    cached = read_uca_as_df(uca_path, cache_path=cache_path)
+    assert cached['timestamp'].tolist() == df['timestamp'].tolist()
+    assert cached['id'].tolist() == df['id'].tolist()
+
+def test_cache_is_ignored_once_the_annotations_change(uca_path, tmp_path):
+    pytest.importorskip('pyarrow')
+    cache_path = str(tmp_path / 'uca.parquet')
+    read_uca_as_df(uca_path, cache_path=cache_path)
+    write_uca(uca_path, {**ANNOTATIONS, 'test': {}})
+    newer = os.path.getmtime(cache_path) + 1
+    os.utime(os.path.join(uca_path, UCA_JSON_FILES['test']), (newer, newer))
+    assert len(read_uca_as_df(uca_path, cache_path=cache_path)) == 3
+
+def test_unwritable_cache_warns(uca_path, tmp_path):
+    cache_path = str(tmp_path / 'missing' / 'uca.parquet')
+    with pytest.warns(UserWarning, match='Could not cache UCA dataset'):
+        df = read_uca_as_df(uca_path, cache_path=cache_path)
+    assert len(df) == 4 and not os.path.exists(cache_path)
+
+def test_unreadable_cache_warns(uca_path, tmp_path):
+    cache_path = str(tmp_path / 'uca.parquet')
+    with open(cache_path, 'w') as fp:
+        fp.write('not parquet')
+    with pytest.warns(UserWarning, match='Could not read cached UCA dataset'):
+        df = read_uca_as_df(uca_path, cache_path=cache_path)
+    assert len(df) == 4
@@ -0,0 +1,45 @@
+import pytest
+
+torch = pytest.importorskip('torch')
+pytest.importorskip('yacs')
+pytest.importorskip('finetunedclip.modified_clip.vclip')
+
+import vclip_encoders
+from vclip_encoders import load_checkpoint
+
+@pytest.fixture
+def checkpoint(tmp_path) -> str:
+    path = str(tmp_path / 'checkpoint.pth')
+    torch.save({'model': {'weight': torch.arange(6, dtype=torch.float32).reshape(2, 3)}}, path)
+    return path
+
+def test_checkpoint_is_loaded(checkpoint):
+    state_dict, mapped = load_checkpoint(checkpoint)
+    assert torch.equal(state_dict['weight'], torch.arange(6, dtype=torch.float32).reshape(2, 3))
+    assert mapped == vclip_encoders._accepts(torch.load, 'mmap')
+
+def test_checkpoint_is_read_without_mmap_support(checkpoint, monkeypatch):
+    # PyTorch before 2.1, whose torch.load passes unknown arguments to the unpickler
+    load = torch.load
+    def legacy_load(f, map_location=None, **pickle_load_args):
+        if 'mmap' in pickle_load_args:
+            raise TypeError("'mmap' is an invalid keyword argument for Unpickler()")
+        return load(f, map_location=map_location)
+    monkeypatch.setattr(torch, 'load', legacy_load)
+
+    state_dict, mapped = load_checkpoint(checkpoint)
+    assert state_dict['weight'].shape == (2, 3) and not mapped
+
+def test_only_weights_outside_the_checkpoint_are_shared(checkpoint):
+    state_dict, mapped = load_checkpoint(checkpoint)
+    if not mapped:
+        pytest.skip('PyTorch cannot memory-map checkpoints')
+    module = torch.nn.Linear(3, 2)
+    module.load_state_dict({'weight': state_dict['weight'], 'bias': torch.zeros(2)}, assign=True)
+
+    encoder = vclip_encoders.VCLIP.__new__(vclip_encoders.VCLIP)
+    encoder.model = module
+    encoder._mapped_weights = {state_dict['weight'].data_ptr()}
+    encoder.share_memory()
+    assert module.weight.data_ptr() == state_dict['weight'].data_ptr() and not module.weight.is_shared()
+    assert module.bias.is_shared()
@@ -1,202 +1,614 @@
 # General
-import numpy as np
 import argparse
 import os
 from alive_progress import alive_bar
-import cv2
 import time
+import queue
+import multiprocessing as mp
+from contextlib import nullcontext
+from functools import partial
 
 # My code
-from my_utils import read_uca_as_df
-from vision_encoders import possible_models, EncoderBuilder
+from video_readers import possible_decoders, DecoderBuilder, sample_clips, sliding_windows
+from my_utils import read_uca_as_df, build_annotation_index, video_shard, split_shard, parse_shard, stable_clip_id
+from vision_encoders import possible_models, possible_poolings, possible_precisions, possible_compile_modes, possible_dtypes, MultiOutputEncoder, set_torch_threads
+from frame_filters import possible_frame_filters
+from model_manager import model_manager
 from databases import possible_databases, DatabaseBuilder
+from pipeline import IngestionPipeline, new_stage_stats, database_write_stats, encode_clips, save_embedding
+from embedding_cache import EmbeddingCache
+from checkpoint import IngestionJournal
+from metrics import metrics, serve_metrics, JsonMetricsLogger
 
 
+# Default duration of the windows of unannotated videos
 CLIP_DURATION_S = 14
-def ucaless_encode(ucf_path, save_path, encoder, database):
 
-    # Build all necessary
-    model = EncoderBuilder.build(encoder_name=encoder)
+def list_ucf_videos(ucf_path:str) -> list:
+    """Lists the videos of the UCF Crime dataset, found in each category's folder.
+
+    Parameters
+    ----------
+    ucf_path : str
+        Directory of the UCF Crime dataset.
+
+    Returns
+    -------
+    list
+        The paths of all the videos.
+    """
+    videos = []
+    for root, dirs, files in os.walk(ucf_path):
+        if not dirs: # It is a category's folder
+            for video in files:
+                videos.append(os.path.join(root, video))
+    return videos
+
+def decode_video_clips(job:tuple, cache=None, decoder:str='opencv', size:int=None):
+    """Decodes the clips of a video given by its annotations.
+
+    Parameters
+    ----------
+    job : tuple
+        The path of the video and its annotations.
+    cache : EmbeddingCache, optional
+        The cache of embeddings. Cached clips are not decoded.
+    decoder : str, optional
+        The name of the decoder, by default 'opencv'
+    size : int, optional
+        The side of the square RGB frames to decode. If not specified, frames keep their resolution.
+
+    Yields
+    ------
+    tuple
+        The id, the frames, the metadata and the cached embedding of each clip. Either
+        the frames or the embedding are None.
+    """
+    video_path, sub_df = job
+    video = os.path.basename(video_path)
+
+    print(f"[MAIN]: Encoding video {video}")
+
+    # Read video
+    video_decoder = DecoderBuilder.build(decoder, video_path, size)
+
+    # Check video was properly read
+    if video_decoder.is_opened():
+
+        # Get FPS
+        fps = video_decoder.fps
+
+        clips = []
+        for entry in sub_df.itertuples():
+
+            id = entry.id
+
+            # Get start and end frame
+            start_frame, end_frame = int(entry.start_s*fps), int(entry.end_s*fps)
+
+            metadata = {'video':video.split('.')[0],
+                        'start_frame':start_frame,
+                        'end_frame':end_frame,
+                        'sentence':entry.sentence,
+                        'dataset':entry.dataset,
+                        'class_name':entry.class_name,
+                        'anomaly':bool(entry.anomaly)}
+
+            # Check the cache before decoding
+            emb = cache.get(entry.video, start_frame, end_frame) if cache else None
+            if emb is not None:
+                keyframes = cache.get_keyframes(entry.video, start_frame, end_frame)
+                if keyframes is not None:
+                    metadata['keyframes'] = keyframes
+                yield id, None, metadata, emb
+            else:
+                clips.append((id, metadata))
+
+        # Decode the video once, sampling one frame per second of every clip
+        frame_ranges = [(metadata['start_frame'], metadata['end_frame']) for _, metadata in clips]
+        for i, clip_frames in sample_clips(video_decoder, frame_ranges, int(fps)):
+            id, metadata = clips[i]
+            yield id, clip_frames, metadata, None
+    else:
+        print(f"[MAIN]: Video {video} could not be read")
+        metrics.counter('unreadable_videos_total', 'Videos which could not be read').inc()
+
+    video_decoder.release()
+
+def decode_video_windows(job:tuple, decoder:str='opencv', size:int=None, window_s:float=CLIP_DURATION_S,
+                         stride_s:float=None, sample_rate:float=1.):
+    """Decodes the consecutive windows of an unannotated video.
+
+    Parameters
+    ----------
+    job : tuple
+        The path of the video.
+    decoder : str, optional
+        The name of the decoder, by default 'opencv'
+    size : int, optional
+        The side of the square RGB frames to decode. If not specified, frames keep their resolution.
+    window_s : float, optional
+        The duration of each window, in seconds, by default CLIP_DURATION_S
+    stride_s : float, optional
+        The seconds between the start of two consecutive windows. If not specified, windows do not overlap.
+    sample_rate : float, optional
+        The number of frames sampled per second, by default 1
+
+    Yields
+    ------
+    tuple
+        The id, the sampled frames, the metadata and None (no cached embedding) of each window.
+    """
+    video_path = job[0]
+    video = os.path.basename(video_path)
+    video_name = video.split('.')[0]
+
+    print(f"[MAIN]: Encoding video {video}")
+
+    # Read video
+    video_decoder = DecoderBuilder.build(decoder, video_path, size)
+
+    # Check video was properly read
+    if video_decoder.is_opened():
+
+        # Window, stride and sampling step in frames
+        fps = video_decoder.fps
+        window = int(window_s * fps)
+        stride = int((stride_s or window_s) * fps)
+        step = round(fps / sample_rate)
+
+        for start_frame, end_frame, window_frames in sliding_windows(video_decoder, window, stride, step):
+            metadata = {'video':video_name,
+                        'start_frame':start_frame,
+                        'end_frame':end_frame,
+                        'class_name':os.path.basename(os.path.dirname(video_path))}
+            yield stable_clip_id(video_name, (start_frame, end_frame), ''), window_frames, metadata, None
+    else:
+        print(f"[MAIN]: Video {video} could not be read")
+        metrics.counter('unreadable_videos_total', 'Videos which could not be read').inc()
+
+    video_decoder.release()
+
+def plan_uca_jobs(ucf_path:str, uca_index:dict, shard:tuple=(0, 1), journal=None) -> list:
+    """Lists the videos of the given shard of the UCF Crime dataset, alongside their pending annotations.
+
+    Parameters
+    ----------
+    ucf_path : str
+        Directory of the UCF Crime dataset.
+    uca_index : dict
+        The annotations of each video of the UCA dataset, sorted by their start second.
+    shard : tuple, optional
+        The index of the shard and the total number of shards, by default (0, 1)
+    journal : IngestionJournal, optional
+        The journal of a previous ingestion. Annotations it already completed are skipped.
+
+    Returns
+    -------
+    list
+        The path and pending annotations of each video of the shard with any.
+    """
+    index, num_shards = shard
+
+    jobs = []
+    for video_path in sorted(list_ucf_videos(ucf_path)):
+        video_name = os.path.basename(video_path).split('.')[0]
+        if video_shard(video_name, num_shards) != index:
+            continue
+
+        # Get all annotations belonging to this video
+        sub_df = uca_index.get(video_name)
+        if sub_df is None:
+            continue
+
+        # Skip those already completed
+        if journal is not None:
+            sub_df = sub_df[~sub_df['id'].map(journal.is_completed)]
+
+        if len(sub_df):
+            jobs.append((video_path, sub_df))
+    return jobs
+
+def _report_failed_jobs(failed_jobs:list):
+    # The clips of these videos are not journaled, so a resumed ingestion decodes them again
+    if failed_jobs:
+        print(f'[MAIN]: Decoding of {len(failed_jobs)} video(s) failed:')
+        for job, error in failed_jobs:
+            print(f'[MAIN]:     {job}: {error}')
+
+def build_encoder_and_database(encoder, database, outputs=None, encoder_kwargs=None, **database_kwargs) -> tuple:
+    """Builds the encoder and the handler of the database where its embeddings are stored.
+
+    Parameters
+    ----------
+    encoder : str
+        The name of the encoder.
+    database : str
+        The name of the database.
+    outputs : list, optional
+        The poolings of a per-frame encoder to generate in a single pass, each one stored in its
+        own collection. If not specified, the encoder's embeddings are stored as they are.
+    encoder_kwargs : dict, optional
+        The arguments of the encoder (e.g. its precision). If not specified, its defaults are used.
+
+    Returns
+    -------
+    tuple
+        The encoder and the database's handler.
+    """
+    # Load model, or reuse it if it is already warm
+    model = model_manager.get(encoder, **(encoder_kwargs or {}))
 
-    database_handler = DatabaseBuilder.build(database_name=database, encoder_params=model.get_encoder_params())
+    # Connect to database
+    if outputs:
+        model = MultiOutputEncoder(model, outputs)
+        database_handler = DatabaseBuilder.build_multi(database_name=database,
+                                                       outputs_params=model.get_outputs_params(),
+                                                       **database_kwargs)
+    else:
+        database_handler = DatabaseBuilder.build(database_name=database,
+                                                encoder_params=model.get_encoder_params(),
+                                                **database_kwargs)
+    return model, database_handler
+
+def ucaless_encode(ucf_path, save_path, encoder, database,
+                   window_s=CLIP_DURATION_S,
+                   stride_s=None,
+                   sample_rate=1.,
+                   decode_workers=2,
+                   decode_queue_size=16,
+                   upload_queue_size=16,
+                   encode_batch_size=8,
+                   buffer_rows=1024,
+                   outputs=None,
+                   decoder='opencv',
+                   model_resolution=False,
+                   rewrite=True,
+                   database_kwargs=None,
+                   metrics_port=None,
+                   metrics_log=None,
+                   metrics_interval=10,
+                   encoder_kwargs=None,
+                   num_threads=None,
+                   num_interop_threads=None):
+    """Encodes every video of the given directory without annotations, as consecutive windows of the given
+    duration. Videos are decoded as a stream, only keeping the sampled frames of the current window, while
+    windows are encoded in batches and uploaded in buffered writes.
+
+    Returns
+    -------
+    dict
+        The StageStats of the decode, encode and upload stages, and of the writes to the database.
+    """
+    # Export the metrics of the ingestion (if specified)
+    metrics_server = serve_metrics(metrics_port) if metrics_port else None
+    metrics_logger = JsonMetricsLogger(metrics_log, metrics_interval).start() if metrics_log else None
+
+    # Limit the threads of the encoder (if specified)
+    if num_threads or num_interop_threads:
+        set_torch_threads(num_threads, num_interop_threads)
+
+    # Load model and connect to database
+    model, database_handler = build_encoder_and_database(encoder, database, outputs,
+                                                         encoder_kwargs=encoder_kwargs,
+                                                         rewrite=rewrite,
+                                                         buffer_rows=buffer_rows,
+                                                         **(database_kwargs or {}))
+    decode_fn = partial(decode_video_windows,
+                        decoder=decoder,
+                        size=model.get_input_size() if model_resolution else None,
+                        window_s=window_s,
+                        stride_s=stride_s,
+                        sample_rate=sample_rate)
 
     # List all videos
-    ucf_videos_list = [os.path.join(ucf_path, video_file) for video_file in os.listdir(ucf_path)]
-    
-    with alive_bar(len(ucf_videos_list)):
-        # Go through each UCF video
-        for video in ucf_videos_list:
-
-            print(f"[MAIN]: Encoding video {video.split('/')[-1]}")
-
-            # Initialize video capture
-            cap = cv2.VideoCapture(video)
-
-            # Get FPS
-            fps = cap.get(cv2.CAP_PROP_FPS)
-
-            # Clip duration in frames
-            max_frames = int(CLIP_DURATION_S * fps)
-
-            # Read first frame
-            ret, frame = cv2.read()
-
-            start_frame = 0
-            end_frame = -1
-            i = 0
-            # Read all frames
-            while ret:
-                
-                i+=1
-                start_frame = end_frame + 1
-                # Read a clip
-                clip_frames = []
-                for frame_index in (range(max_frames)):
-                    if not ret:
-                        frame_index -= 1
-                        break
-                    
-                    clip_frames.append(frame)
-
-                    # Read next
-                    ret, frame = cv2.read()
-                
-                # Obtain metadata
-                end_frame = frame_index
-
-                if end_frame != -1:
-
-                    print(f'\tEncoding clip number {i}')
-                    # Encode model
-                    #emb = model.get_clip_embedding(clip_frames)
-
-                    # Save file
-                    if save_path:
-                        np_file_name = video.split('.')[0] + '_' + str(start_frame) + '-' + str(end_frame) + '.npy'
-                        #np.save(os.path.join(save_path, np_file_name), emb)
-
-                    print(f'\tUploading clip number {i}')
-                    # Upload to database
-                    # database_handler.upload_embedding(id,
-                    #                                 emb,
-                    #                                 metadata={'video':video.split('.')[0],
-                    #                                             'start_frame':start_frame,
-                    #                                             'end_frame':end_frame})
-            
-            # Release video capture
-            cap.release()
-
-
-def uca_encode(ucf_path, uca_path, save_path, encoder, database):
+    jobs = [(video_path,) for video_path in sorted(list_ucf_videos(ucf_path))]
+
+    # Create embeddings, the number of windows being unknown until videos are decoded
+    with database_handler, alive_bar() as bar:
+        ingestion = IngestionPipeline(model, database_handler,
+                                      decode_workers=decode_workers,
+                                      decode_queue_size=decode_queue_size,
+                                      upload_queue_size=upload_queue_size,
+                                      encode_batch_size=encode_batch_size,
+                                      save_path=save_path)
+        stats = ingestion.run(jobs, decode_fn, on_clip_done=bar)
+    stats['write'] = database_write_stats(database_handler)
+    _report_failed_jobs(ingestion.failed_jobs)
+
+    if metrics_logger:
+        metrics_logger.stop()
+    if metrics_server:
+        metrics_server.shutdown()
+
+    for stage_stats in stats.values():
+        print(f'[MAIN]: {stage_stats}')
+
+    return stats
+
+def uca_encode(ucf_path, uca_path, save_path, encoder, database,
+               pipeline=False,
+               decode_workers=2,
+               decode_queue_size=16,
+               upload_queue_size=16,
+               encode_batch_size=1,
+               buffer_rows=1024,
+               cache_path=None,
+               cache_bytes=10*2**30,
+               outputs=None,
+               journal_path=None,
+               resume=False,
+               decoder='opencv',
+               model_resolution=False,
+               uca_cache=None,
+               shard=(0, 1),
+               rewrite=True,
+               progress=None,
+               database_kwargs=None,
+               metrics_port=None,
+               metrics_log=None,
+               metrics_interval=10,
+               encoder_kwargs=None,
+               num_threads=None,
+               num_interop_threads=None,
+               on_ready=None):
+
+    # Export the metrics of the ingestion (if specified)
+    metrics_server = serve_metrics(metrics_port) if metrics_port else None
+    metrics_logger = JsonMetricsLogger(metrics_log, metrics_interval).start() if metrics_log else None
+
+    # Limit the threads of the encoder (if specified)
+    if num_threads or num_interop_threads:
+        set_torch_threads(num_threads, num_interop_threads)
 
     # Read annotations dataset
-    uca_df = read_uca_as_df(uca_path=uca_path)
-
-    # Load model
-    model = EncoderBuilder.build(encoder_name=encoder)
-
-    # Connect to database
-    database_handler = DatabaseBuilder.build(database_name=database,
-                                            encoder_params=model.get_encoder_params())
+    uca_df = read_uca_as_df(uca_path=uca_path, cache_path=uca_cache)
+    uca_index = build_annotation_index(uca_df)
+
+    # Load model and connect to database, keeping previous embeddings when resuming
+    model, database_handler = build_encoder_and_database(encoder, database, outputs,
+                                                         encoder_kwargs=encoder_kwargs,
+                                                         rewrite=rewrite and not resume,
+                                                         buffer_rows=buffer_rows,
+                                                         **(database_kwargs or {}))
+
+    # Open the journal of completed clips (if specified)
+    journal = None
+    if journal_path:
+        journal = IngestionJournal(journal_path, name=f'shard{shard[0]}of{shard[1]}')
+        if rewrite and not resume:
+            journal.clear()
+        database_handler.on_write.append(journal.record)
+
+    # The collections exist from now on (e.g. for other workers waiting to write to them)
+    if on_ready is not None:
+        on_ready()
+
+    # Open embedding cache (if specified)
+    decode_size = model.get_input_size() if model_resolution else None
+    cache = None
+    if cache_path:
+        cache = EmbeddingCache(cache_path,
+                               model_name=model.get_encoder_params()['model_name'],
+                               fingerprint=model.get_fingerprint(),
+                               max_bytes=cache_bytes,
+                               decode_params={'decoder': decoder, 'size': decode_size})
+    decode_fn = partial(decode_video_clips,
+                        cache=cache,
+                        decoder=decoder,
+                        size=decode_size)
+
+    # Get the videos of this shard
+    jobs = plan_uca_jobs(ucf_path, uca_index, shard, journal if resume else None)
 
     # Get total number of annotations
-    total = len(uca_df['timestamp'].tolist())
+    total = sum(len(sub_df) for _, sub_df in jobs)
 
-    id = 0
     # Create embeddings
+    with database_handler, (nullcontext(progress) if progress else alive_bar(int(total))) as bar:
+        if pipeline:
+            ingestion = IngestionPipeline(model, database_handler,
+                                          decode_workers=decode_workers,
+                                          decode_queue_size=decode_queue_size,
+                                          upload_queue_size=upload_queue_size,
+                                          encode_batch_size=encode_batch_size,
+                                          save_path=save_path,
+                                          cache=cache)
+            stats = ingestion.run(jobs, decode_fn, on_clip_done=bar)
+            _report_failed_jobs(ingestion.failed_jobs)
+        else:
+            stats = new_stage_stats()
+            for job in jobs:
+                clips = decode_fn(job)
+                while True:
+
+                    # Decode clip
+                    start_decode = time.perf_counter()
+                    clip = next(clips, None)
+                    end_decode = time.perf_counter()
+                    if clip is None:
+                        break
+                    id, _, metadata, _ = clip
+                    stats['decode'].add(1, end_decode - start_decode)
+
+                    # Get embedding of clip
+                    start_emb = time.perf_counter()
+                    (emb,), encoded = encode_clips(model, [clip], cache)
+                    end_emb = time.perf_counter()
+                    emb_time = end_emb - start_emb
+                    stats['encode'].add(encoded, emb_time)
+
+                    # Save embedding to file (if specified)
+                    if save_path:
+                        save_embedding(save_path, metadata, emb)
+
+                    # Upload embedding to database
+                    start_upload = time.perf_counter()
+                    database_handler.add(id, emb, metadata=metadata)
+                    end_upload = time.perf_counter()
+                    upload_time = end_upload - start_upload
+                    stats['upload'].add(1, upload_time)
+
+                    # Clip embedded
+                    bar()
+    stats['write'] = database_write_stats(database_handler)
+
+    if cache:
+        cache.close()
+
+    if metrics_logger:
+        metrics_logger.stop()
+    if metrics_server:
+        metrics_server.shutdown()
+
+    if not progress:
+        for stage_stats in stats.values():
+            print(f'[MAIN]: {stage_stats}')
+
+    return stats
+
+def _uca_encode_worker(progress_queue, *args, **kwargs):
+    # Report when the collections are ready, each encoded clip, and the stats once done, to the parent process
+    stats = uca_encode(*args, progress=lambda: progress_queue.put(1), on_ready=lambda: progress_queue.put('ready'), **kwargs)
+    progress_queue.put({name: (stage_stats.count, stage_stats.busy_time) for name, stage_stats in stats.items()})
+
+def sharded_uca_encode(ucf_path, uca_path, save_path, encoder, database, workers, shard=(0, 1), fork_workers=False, **kwargs):
+    """Splits the given shard among several worker processes, each of them running uca_encode
+    over its own sub-shard, and merges their progress.
+
+    Parameters
+    ----------
+    workers : int
+        The number of worker processes.
+    shard : tuple, optional
+        The index of the shard and the total number of shards, by default (0, 1)
+    fork_workers : bool, optional
+        Whether to load the encoder once and fork the workers afterwards, so they all share its weights
+        instead of each one loading its own copy, by default False. Only possible if the encoder runs
+        on CPU, since CUDA cannot be used by forked processes.
+
+    Returns
+    -------
+    dict
+        The merged StageStats of the decode, encode and upload stages, and of the writes to the database.
+    """
+    _, num_shards = shard
+
+    # Only a run covering the whole dataset may rewrite the collection. The first worker does it
+    # before any other worker starts, so workers never drop each other's embeddings
+    rewrite = num_shards == 1 and not kwargs.get('resume')
+    if rewrite and kwargs.get('journal_path'):
+        IngestionJournal(kwargs['journal_path']).clear()
+
+    # Get total number of pending annotations of the shard
+    uca_index = build_annotation_index(read_uca_as_df(uca_path=uca_path, cache_path=kwargs.get('uca_cache')))
+    journal = IngestionJournal(kwargs['journal_path']) if kwargs.get('resume') else None
+    total = sum(len(sub_df) for _, sub_df in plan_uca_jobs(ucf_path, uca_index, shard, journal))
+
+    # Load the encoder before forking, so workers inherit its weights from shared memory
+    context = mp.get_context('spawn')
+    if fork_workers:
+        model = model_manager.get(encoder, **(kwargs.get('encoder_kwargs') or {}))
+        if 'cuda' in str(getattr(model, 'device', 'cpu')):
+            print('[MAIN]: Encoder runs on CUDA, workers are spawned and load their own copy of its weights')
+        else:
+            model_manager.share_memory()
+            context = mp.get_context('fork')
+        del model
+
+    # Each worker processes a sub-shard of the shard
+    progress_queue = context.Queue()
+    processes = []
+    for w, worker_shard in enumerate(split_shard(shard, workers)):
+
+        # Each worker exports its own metrics
+        worker_kwargs = {**kwargs, 'shard': worker_shard, 'rewrite': rewrite and w == 0}
+        if kwargs.get('metrics_port'):
+            worker_kwargs['metrics_port'] = kwargs['metrics_port'] + w
+        if kwargs.get('metrics_log'):
+            root, ext = os.path.splitext(kwargs['metrics_log'])
+            worker_kwargs['metrics_log'] = f'{root}.shard{worker_shard[0]}of{worker_shard[1]}{ext}'
+
+        processes.append(context.Process(target=_uca_encode_worker,
+                                         args=(progress_queue, ucf_path, uca_path, save_path, encoder, database),
+                                         kwargs=worker_kwargs))
+    # When rewriting, the rest of the workers start once the first one has created the collections
+    started = processes if not rewrite else processes[:1]
+    for process in started:
+        process.start()
+
+    stats = new_stage_stats(write=True)
+    finished = 0
     with alive_bar(int(total)) as bar:
-        for root, dirs, files in os.walk(ucf_path):
-            if not dirs: # It is a category's folder
-                for video in files:
-
-                    print(f"[MAIN]: Encoding video {video}")
-                    
-                    # Get all annotations belonging to this video
-                    sub_df = uca_df[uca_df['video'] == video.split('.')[0]]
-
-                    # Read video
-                    video_path = os.path.join(root, video)
-                    cap = cv2.VideoCapture(video_path)
-
-                    # Read one frame to check video was properly read
-                    ret, frame = cap.read()
-                    if ret:
-
-                        # Get FPS
-                        fps = cap.get(cv2.CAP_PROP_FPS)
-
-                        # Sort by timestamps
-                        sub_df = sub_df.sort_values(by='timestamp', key=lambda x: x.apply(lambda y: y[0]))
-
-                        # Get timestamps
-                        #timestamps = sub_df['timestamp'].tolist()
-                        #sorted_timestamps = sorted(timestamps, key=lambda x: x[0])
-
-                        for entry in sub_df.itertuples():
-                            
-                            sentence = entry.sentence
-                            dataset = entry.dataset
-                            class_name = entry.class_name
-                            timestamp = entry.timestamp
-                            
-                            print(f"[MAIN]: Encoding clip with timestamps {timestamp}")
-                            # Get start and end frame
-                            start_frame, end_frame = int(timestamp[0]*fps), int(timestamp[1]*fps)
-                            
-                            # Go to start frame in video
-                            cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
-
-                            # Read frames
-                            clip_frames = []
-                            for i in range(start_frame, end_frame, int(fps)):
-                                ret, frame = cap.read()
-                                if ret:
-                                    clip_frames.append(frame)
-
-                            # Get embedding of clip
-                            start_emb = time.perf_counter()
-                            emb = model.get_clip_embedding(clip_frames)
-                            end_emb = time.perf_counter()
-                            emb_time = end_emb - start_emb
-
-                            # Save embedding to file (if specified)
-                            if save_path:
-                                np_file_name = video.split('.')[0] + '_' + str(start_frame) + '-' + str(end_frame) + '.npy'
-                                np.save(os.path.join(save_path, np_file_name), emb)
-
-                            # Upload embedding to database
-                            start_upload = time.perf_counter()
-                            
-                            database_handler.upload_embedding(id,
-                                                            emb,
-                                                            metadata={'video':video.split('.')[0],
-                                                                        'start_frame':start_frame,
-                                                                        'end_frame':end_frame,
-                                                                        'sentence':sentence,
-                                                                        'dataset':dataset,
-                                                                        'class_name':class_name})
-                            
-                            end_upload = time.perf_counter()
-                            upload_time = end_upload - start_upload
-                            id += 1
-
-                            # Clip embedded
-                            bar()
-                    else:
-                        print(f"[MAIN]: Video {video} could not be read")
-
-                    cap.release()
+        while finished < workers:
+            try:
+                message = progress_queue.get(timeout=1)
+            except queue.Empty:
+                if not any(process.is_alive() for process in started):
+                    print(f"[MAIN]: {workers - finished} worker(s) exited without finishing")
+                    break
+                continue
+            if message == 'ready':
+                if len(started) < len(processes):
+                    for process in processes[len(started):]:
+                        process.start()
+                    started = processes
+            elif isinstance(message, dict):
+                for name, (count, busy_time) in message.items():
+                    stats[name].add(count, busy_time, observe=False)
+                finished += 1
+            else:
+                bar(message)
+
+    for process in started:
+        process.join()
+
+    for stage_stats in stats.values():
+        print(f'[MAIN]: {stage_stats}')
+
+    return stats
 
 def get_args():
     
     parser = argparse.ArgumentParser()
 
     parser.add_argument('--ucf-path', type=str, default='/media/pablo/358690d7-e500-45fb-b8f8-bc48c6be13e3/UCF-Crimes/Videos', help='Directory of the UCF Crime dataset')
-    parser.add_argument('--just-ucf', type=bool, default=False)
+    parser.add_argument('--just-ucf', action='store_true', help='Encode the videos without their annotations, as consecutive windows')
+    parser.add_argument('--window', type=float, default=CLIP_DURATION_S, help='Duration of each window in seconds, with --just-ucf')
+    parser.add_argument('--stride', type=float, help='Seconds between the start of two consecutive windows, with --just-ucf. If not specified, windows do not overlap')
+    parser.add_argument('--sample-rate', type=float, default=1., help='Frames sampled per second of each window, with --just-ucf')
     parser.add_argument('--uca-path', type=str, default='/media/pablo/358690d7-e500-45fb-b8f8-bc48c6be13e3/Surveillance-Video-Understanding/UCF Annotation/json', help='Directory of the UCA dataset\' JSON file')
+    parser.add_argument('--uca-cache', type=str, help='Parquet (or .feather) file where the pre-processed UCA dataset is cached. If not specified, it is not cached')
     parser.add_argument('--save-path', type=str, help='Directory where embeddings of the clips will be saved. If not specified, embeddings will not be stored locally')
     parser.add_argument('--encoder', type=str, choices=possible_models, required=True, help='The encoder used to generate the embeddings of the clips')
     parser.add_argument('--database', type=str, choices=possible_databases, required=True, help='The database used to store the embeddings of the clips')
+    parser.add_argument('--pipeline', action='store_true', help='Overlap decoding, encoding and uploading of the clips')
+    parser.add_argument('--decode-workers', type=int, default=2, help='Number of threads decoding videos in pipeline mode')
+    parser.add_argument('--decode-queue-size', type=int, default=16, help='Maximum number of decoded clips waiting to be encoded in pipeline mode')
+    parser.add_argument('--upload-queue-size', type=int, default=16, help='Maximum number of embeddings waiting to be uploaded in pipeline mode')
+    parser.add_argument('--encode-batch-size', type=int, default=1, help='Maximum number of clips encoded together in pipeline mode')
+    parser.add_argument('--buffer-rows', type=int, default=1024, help='Number of rows buffered before they are uploaded to the database together')
+    parser.add_argument('--cache-path', type=str, help='Directory of the embedding cache. If not specified, embeddings are not cached')
+    parser.add_argument('--cache-size-gb', type=float, default=10, help='Maximum size of the embedding cache, in GiB')
+    parser.add_argument('--outputs', type=str, nargs='+', choices=possible_poolings, help='Poolings of a per-frame encoder (clip, vclip) generated in a single pass, each one stored in its own collection')
+    parser.add_argument('--journal-path', type=str, help='Directory of the journal of completed clips, used to resume an interrupted ingestion')
+    parser.add_argument('--resume', action='store_true', help='Skip the clips completed according to the journal, keeping the existing collections')
+    parser.add_argument('--decoder', type=str, choices=possible_decoders, default='opencv', help='The library used to decode the videos')
+    parser.add_argument('--model-resolution', action='store_true', help='Decode frames directly at the input resolution of the encoder')
+    parser.add_argument('--workers', type=int, default=1, help='Number of worker processes, each one encoding a different subset of the videos')
+    parser.add_argument('--fork-workers', action='store_true', help='Load the encoder once and fork the worker processes, which share its weights (CPU only)')
+    parser.add_argument('--shard', type=parse_shard, default=(0, 1), help='Only encode the i-th of N disjoint subsets of the videos, given as i/N')
+    parser.add_argument('--precision', type=str, choices=possible_precisions, help='Precision of the inference of a torch encoder (clip, vclip). int8 quantizes its linear layers dynamically and only runs on CPU')
+    parser.add_argument('--compile-mode', type=str, choices=possible_compile_modes, help='How the image encoder of a torch encoder (clip, vclip) is compiled')
+    parser.add_argument('--device', type=str, help='Device running a torch encoder (clip, vclip), e.g. cpu. If not specified, CUDA if available')
+    parser.add_argument('--dtype', type=str, choices=possible_dtypes, help='Type of the generated and stored embeddings. float16 halves their size')
+    parser.add_argument('--frame-filter', type=str, choices=possible_frame_filters, help='Filter of a torch encoder (clip, vclip) skipping the frames that barely change, which take the embedding of the previous keyframe. If not specified, every frame is encoded')
+    parser.add_argument('--filter-threshold', type=float, help='Threshold of the frame filter: mean absolute difference (0-1) for difference, different bits for hash. If not specified, the filter\'s default')
+    parser.add_argument('--threads', type=int, help='Number of intra-op threads of torch in each worker process')
+    parser.add_argument('--interop-threads', type=int, help='Number of inter-op threads of torch in each worker process')
+    parser.add_argument('--metrics-port', type=int, help='Port where the metrics of the ingestion are served in Prometheus\' format (one port per worker, starting at this one). If not specified, they are not served')
+    parser.add_argument('--metrics-log', type=str, help='JSON lines file where the metrics of the ingestion are periodically logged (one file per worker). If not specified, they are not logged')
+    parser.add_argument('--metrics-interval', type=float, default=10, help='Seconds between two logs of the metrics')
 
     return parser.parse_args()
 
@@ -204,7 +616,68 @@ if __name__ == '__main__':
 
     args = get_args()
 
+    if args.resume and not args.journal_path:
+        raise ValueError('ValueError: --resume requires the --journal-path of the interrupted ingestion')
+
+    # Options of torch encoders, given only if specified
+    encoder_kwargs = {name: value for name, value in (('precision', args.precision),
+                                                      ('compile_mode', args.compile_mode),
+                                                      ('device', args.device),
+                                                      ('dtype', args.dtype),
+                                                      ('frame_filter', args.frame_filter),
+                                                      ('filter_threshold', args.filter_threshold)) if value is not None}
+
     if args.just_ucf:
-        ucaless_encode(args.ucf_path, args.save_path, args.encoder, args.database)
+        ucaless_encode(args.ucf_path, args.save_path, args.encoder, args.database,
+                       window_s=args.window,
+                       stride_s=args.stride,
+                       sample_rate=args.sample_rate,
+                       decode_workers=args.decode_workers,
+                       decode_queue_size=args.decode_queue_size,
+                       upload_queue_size=args.upload_queue_size,
+                       encode_batch_size=args.encode_batch_size,
+                       buffer_rows=args.buffer_rows,
+                       outputs=args.outputs,
+                       decoder=args.decoder,
+                       model_resolution=args.model_resolution,
+                       metrics_port=args.metrics_port,
+                       metrics_log=args.metrics_log,
+                       metrics_interval=args.metrics_interval,
+                       encoder_kwargs=encoder_kwargs,
+                       num_threads=args.threads,
+                       num_interop_threads=args.interop_threads)
     else:
-        uca_encode(args.ucf_path, args.uca_path, args.save_path, args.encoder, args.database)
+        pipeline_params = {
+            'pipeline': args.pipeline,
+            'decode_workers': args.decode_workers,
+            'decode_queue_size': args.decode_queue_size,
+            'upload_queue_size': args.upload_queue_size,
+            'encode_batch_size': args.encode_batch_size,
+            'buffer_rows': args.buffer_rows,
+            'cache_path': args.cache_path,
+            'cache_bytes': int(args.cache_size_gb * 2**30),
+            'outputs': args.outputs,
+            'journal_path': args.journal_path,
+            'resume': args.resume,
+            'decoder': args.decoder,
+            'model_resolution': args.model_resolution,
+            'uca_cache': args.uca_cache,
+            'metrics_port': args.metrics_port,
+            'metrics_log': args.metrics_log,
+            'metrics_interval': args.metrics_interval,
+            'encoder_kwargs': encoder_kwargs,
+            'num_threads': args.threads,
+            'num_interop_threads': args.interop_threads,
+        }
+        if args.workers > 1:
+            sharded_uca_encode(args.ucf_path, args.uca_path, args.save_path, args.encoder, args.database,
+                               args.workers,
+                               shard=args.shard,
+                               fork_workers=args.fork_workers,
+                               **pipeline_params)
+        else:
+            # A single shard of several must not drop the embeddings uploaded by the others
+            uca_encode(args.ucf_path, args.uca_path, args.save_path, args.encoder, args.database,
+                       shard=args.shard,
+                       rewrite=args.shard[1] == 1,
+                       **pipeline_params)
@@ -0,0 +1,215 @@
+import numpy as np
+import torch
+
+import os
+import gc
+import inspect
+
+import finetunedclip.modified_clip.vclip as vclip
+from yacs.config import CfgNode as CN
+
+from PIL import Image
+
+from vision_encoders import EmbeddingModel, CLIP_MEAN, CLIP_STD, _fingerprint, _is_model_ready, _normalize_frames, _encode_clips
+from vision_encoders import _resolve_device, _quantize, _autocast, _compile_forward, _check_dtype
+from frame_filters import FrameFilterBuilder
+from metrics import metrics
+
+def _accepts(function, param:str) -> bool:
+    # Whether the installed PyTorch supports the parameter (e.g. torch.load's mmap, added in 2.1)
+    return param in inspect.signature(function).parameters
+
+def load_checkpoint(checkpoint_path:str) -> tuple:
+    """Loads the state dict of a checkpoint, memory-mapping the file instead of reading it if the
+    installed PyTorch supports it.
+
+    Parameters
+    ----------
+    checkpoint_path : str
+        The path of the checkpoint, either a .safetensors file or a PyTorch file whose 'model' entry
+        is the state dict.
+
+    Returns
+    -------
+    tuple
+        The state dict, and whether its tensors are backed by the memory-mapped file.
+    """
+    if checkpoint_path.endswith('.safetensors'):
+        from safetensors.torch import load_file
+        return load_file(checkpoint_path), False
+
+    if not _accepts(torch.load, 'mmap'):
+        return torch.load(checkpoint_path, map_location='cpu')['model'], False
+    try:
+        return torch.load(checkpoint_path, map_location='cpu', mmap=True)['model'], True
+    except RuntimeError: # Saved with the legacy format, which cannot be memory-mapped
+        return torch.load(checkpoint_path, map_location='cpu')['model'], False
+
+VCLIP_WEIGHTS_PATH = '/home/pregodon@gaps_domain.ssr.upm.es/TFM/ucf-crime/finetunedclip/weights'
+class VCLIP(EmbeddingModel):
+    def __init__(self, batch_size:int=32, precision:str='fp32', compile_mode:str='eager', device:str=None, dtype:str='float32',
+                 frame_filter:str=None, filter_threshold:float=None):
+        """Uses the fine-tuned VCLIP model to obtain the embeddings of the clips.
+
+        Parameters
+        ----------
+        batch_size : int, optional
+            Maximum number of frames encoded in a single forward pass. By default, 32.
+        precision : str, optional
+            The precision of the inference. Can be one of the specified in the \'vision_encoders.possible_precisions\'
+            variable. By default, 'fp32'.
+        compile_mode : str, optional
+            How the image encoder is compiled. Can be one of the specified in the
+            \'vision_encoders.possible_compile_modes\' variable. By default, 'eager'.
+        device : str, optional
+            The device running the model. If not specified, CUDA if available, otherwise CPU.
+        dtype : str, optional
+            The type of the embeddings. Can be one of the specified in the \'vision_encoders.possible_dtypes\'
+            variable. By default, 'float32'.
+        frame_filter : str, optional
+            The filter skipping the frames that barely change, whose embedding is that of the previous
+            keyframe. Can be one of the specified in the \'frame_filters.possible_frame_filters\' variable.
+            If not specified, every frame is encoded.
+        filter_threshold : float, optional
+            The threshold of the frame filter. If not specified, the filter's default.
+        """
+
+        # Apply a default configuration
+        _C = CN()
+        _C.BASE = ['']
+        _C.MODEL = CN()
+        _C.MODEL.ARCH = 'ViT-B/32'
+        _C.MODEL.WEIGHTS_DIR = VCLIP_WEIGHTS_PATH
+        _C.MODEL.RESUME = os.path.join(VCLIP_WEIGHTS_PATH, '100batch_40frames_32.pth')
+        _C.DEVICE = _resolve_device(device).type
+        _C.PRECISION = precision
+        self.config = _C.clone()
+
+        self.batch_size = batch_size
+        self.compile_mode = compile_mode
+        self.dtype = _check_dtype(dtype)
+        self.frame_filter = FrameFilterBuilder.build(frame_filter, threshold=filter_threshold) if frame_filter else None
+
+        self.load()
+
+    def load(self):
+        backbone_name = self.config.MODEL.ARCH
+        root = self.config.MODEL.WEIGHTS_DIR
+
+        self.model, self.preprocess = vclip.load(name=backbone_name,
+                                                 download_root=root,
+                                                 jit=False,
+                                                 device=self.config.DEVICE)
+
+        self.device = self.config.DEVICE
+        self.model = self.model.float().to(self.device)
+
+        # On CPU, the parameters keep pointing to the memory-mapped checkpoint instead of being copied,
+        # so every process loading it shares the same pages of the page cache
+        load_state_dict, mapped = load_checkpoint(self.config.MODEL.RESUME)
+        assign = self.device == 'cpu' and _accepts(self.model.load_state_dict, 'assign')
+        if assign:
+            self.model.load_state_dict(load_state_dict, strict=False, assign=True)
+        else:
+            self.model.load_state_dict(load_state_dict, strict=False)
+        self.model = self.model.float()
+
+        # Weights still backed by the checkpoint, whose pages every process already shares
+        self._mapped_weights = {tensor.data_ptr() for tensor in load_state_dict.values()} if mapped and assign else set()
+        del load_state_dict
+
+        self.precision = self.config.PRECISION
+        self.model = _quantize(self.model, self.precision, torch.device(self.device))
+        self._image_forward = _compile_forward(lambda images: self.model.encode_image(images)[0], self.compile_mode, self.model)
+
+    def share_memory(self):
+        # Moving the weights backed by the memory-mapped checkpoint to shared memory would copy them,
+        # so only the rest (e.g. those converted to another precision) are moved
+        for tensor in list(self.model.parameters()) + list(self.model.buffers()):
+            if tensor.data_ptr() not in self._mapped_weights:
+                tensor.share_memory_()
+
+    def unload(self):
+        del self.model, self.preprocess
+        gc.collect()
+        if self.device == 'cuda':
+            torch.cuda.empty_cache()
+
+    def encode_image(self, img):
+        return self.encode_images([img])
+
+    def encode_images(self, imgs:list):
+        # Stack the preprocessed images and send them to device
+        with metrics.timer('encoder_preprocess_seconds', 'Time spent preprocessing a batch of frames'):
+            if _is_model_ready(imgs, self.get_input_size()):
+                images = _normalize_frames(imgs, CLIP_MEAN, CLIP_STD, self.device)
+            else:
+                images = torch.stack([self.preprocess(Image.fromarray(img)) for img in imgs]).to(self.device)
+
+        # Get features
+        with metrics.timer('encoder_forward_seconds', 'Time spent in the forward pass of a batch of frames'), _autocast(torch.device(self.device), self.precision):
+            image_features = self._image_forward(images)
+            return image_features.float().cpu().detach().numpy()
+
+    def get_input_size(self) -> int:
+        return self.model.visual.input_resolution
+
+    def encode_text(self, text):
+        text = vclip.tokenize(text).to(self.device)
+        text_features, _ = self.model.encode_text(text)
+        return text_features
+
+    def _encode_texts(self, sentences:list) -> np.ndarray:
+        text = vclip.tokenize(sentences, truncate=True).to(self.device)
+        with _autocast(torch.device(self.device), self.precision):
+            text_features, _ = self.model.encode_text(text)
+        return text_features.float().cpu().numpy()
+    
+    def get_clip_embedding(self, clip_array:list):
+        embs_array = _encode_clips(self.encode_images, [clip_array], 512, self.batch_size, self.dtype, self.frame_filter)[0]
+        return embs_array
+
+    def get_clips_embedding(self, clips:list) -> list:
+        return _encode_clips(self.encode_images, clips, 512, self.batch_size, self.dtype, self.frame_filter)
+
+    def get_clips_embedding_and_keyframes(self, clips:list) -> tuple:
+        return _encode_clips(self.encode_images, clips, 512, self.batch_size, self.dtype, self.frame_filter,
+                             return_keyframes=True)
+
+    def get_fingerprint(self) -> str:
+        # Changes with the configuration and whenever the checkpoint file is replaced
+        checkpoint = os.stat(self.config.MODEL.RESUME)
+        return _fingerprint(self.get_encoder_params(), self.config.dump(),
+                            checkpoint.st_size, checkpoint.st_mtime_ns,
+                            self.frame_filter.get_params() if self.frame_filter else None)
+
+    def get_encoder_params(self) -> dict:
+        params = {
+            'model_name': 'vclip',
+            'embedding_size': 512,
+            'embedding_list': True,
+            'dtype': self.dtype
+        }
+        return params
+
+class VCLIPCentroid(VCLIP):
+
+    def get_clip_embedding(self, clip_array:list):
+        emb = np.mean(super().get_clip_embedding(clip_array), axis=0)
+        return emb
+
+    def get_clips_embedding(self, clips:list) -> list:
+        return [np.mean(embs_array, axis=0) for embs_array in super().get_clips_embedding(clips)]
+
+    def get_clips_embedding_and_keyframes(self, clips:list) -> tuple:
+        embs, keyframes = super().get_clips_embedding_and_keyframes(clips)
+        return [np.mean(embs_array, axis=0) for embs_array in embs], keyframes
+    
+    def get_encoder_params(self) -> dict:
+        params = {
+            'model_name': 'vclipcentroid',
+            'embedding_size': 512,
+            'dtype': self.dtype,
+            'embedding_list': False # Means that the get_clip_embedding return a single embedding
+        }
+        return params
@@ -0,0 +1,474 @@
+import cv2
+import numpy as np
+import os
+import stat
+import time
+from itertools import count, islice
+
+possible_decoders = [
+    'opencv',
+    'pyav',
+    'decord'
+]
+
+def sample_frame_indices(start_frame:int, end_frame:int, step:int) -> list:
+    """Returns the indices of the frames sampled from a clip, one every step frames.
+
+    Parameters
+    ----------
+    start_frame : int
+        The first frame of the clip.
+    end_frame : int
+        The last frame of the clip (not included).
+    step : int
+        The number of frames between two sampled frames.
+
+    Returns
+    -------
+    list
+        The indices of the sampled frames.
+    """
+    return list(range(start_frame, end_frame, max(1, step)))
+
+def _scaled_size(width:int, height:int, size:int) -> tuple:
+    # Size of the frame once its shortest side is resized to the given size
+    scale = size / min(width, height)
+    return max(size, round(width * scale)), max(size, round(height * scale))
+
+def _center_crop(frame:np.ndarray, size:int) -> np.ndarray:
+    height, width = frame.shape[:2]
+    top, left = (height - size) // 2, (width - size) // 2
+    return frame[top:top+size, left:left+size]
+
+class VideoDecoder:
+    def __init__(self, video_path:str, size:int=None):
+        raise NotImplementedError
+
+    def is_opened(self) -> bool:
+        """Returns whether the video could be opened and its first frame read.
+        """
+        return self.opened
+
+    def read_frames(self, indices:list):
+        """Reads the given frames of the video in a single forward pass, without seeking.
+
+        Frames are RGB. If a size was given to the decoder, they are resized so that their shortest side
+        matches it and center-cropped to a square, as expected by CLIP-like encoders. The yielded frame is
+        a reusable buffer, only valid until the next frame is read, so it must be copied to be kept.
+
+        Parameters
+        ----------
+        indices : list
+            The sorted indices of the frames to read. Any iterable is accepted, even an unbounded one
+            (e.g. itertools.count), in which case frames are read until the end of the video.
+
+        Yields
+        ------
+        tuple
+            The index and the image of each frame, until the end of the video.
+        """
+        raise NotImplementedError
+
+    def release(self):
+        """Releases the video.
+        """
+        raise NotImplementedError
+
+class DecoderBuilder:
+
+    def build(decoder_name, video_path:str, size:int=None) -> VideoDecoder:
+        """Returns the decoder's object corresponding to the specified name.
+
+        Parameters
+        ----------
+        decoder_name : str
+            The name of the decoder. Can be one of the specified in the \'video_readers.possible_decoders\' variable.
+        video_path : str
+            The path of the video to decode.
+        size : int, optional
+            The side of the square frames to decode. If not specified, frames keep their resolution.
+
+        Returns
+        -------
+        VideoDecoder
+            The decoder's object.
+
+        Raises
+        ------
+        TypeError
+            If the specified decoder is not implemented.
+        """
+
+        match decoder_name:
+            case 'opencv':
+                return OpenCVDecoder(video_path, size)
+            case 'pyav':
+                return PyAVDecoder(video_path, size)
+            case 'decord':
+                return DecordDecoder(video_path, size)
+            case _:
+                raise TypeError(f'TypeError: Decoder {decoder_name} not found among implemented. Please, use one of the following: {possible_decoders}.')
+
+class OpenCVDecoder(VideoDecoder):
+
+    def __init__(self, video_path:str, size:int=None):
+        """Decodes the video with OpenCV. Frames which are not needed are grabbed but not
+        converted into images.
+
+        Parameters
+        ----------
+        video_path : str
+            The path of the video to decode.
+        size : int, optional
+            The side of the square frames to decode. If not specified, frames keep their resolution.
+        """
+        self.size = size
+        self.cap = cv2.VideoCapture(video_path)
+
+        # Read one frame to check video was properly read, and go back to the start
+        self.opened, _ = self.cap.read()
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+
+        # Reusable buffers
+        self._resized = None
+        self._buffer = None
+
+    def _to_rgb(self, frame:np.ndarray) -> np.ndarray:
+        if self.size:
+            # Crop before resizing, so only the kept pixels are interpolated
+            height, width = frame.shape[:2]
+            side = min(height, width)
+            frame = _center_crop(frame, side)
+            if self._resized is None:
+                self._resized = np.empty((self.size, self.size, 3), dtype=np.uint8)
+            cv2.resize(frame, (self.size, self.size), dst=self._resized, interpolation=cv2.INTER_AREA)
+            frame = self._resized
+
+        if self._buffer is None or self._buffer.shape != frame.shape:
+            self._buffer = np.empty(frame.shape, dtype=np.uint8)
+        cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=self._buffer)
+        return self._buffer
+
+    def read_frames(self, indices:list):
+        position = 0
+        for index in indices:
+            while position < index:
+                if not self.cap.grab():
+                    return
+                position += 1
+
+            ret, frame = self.cap.read()
+            position += 1
+            if not ret:
+                return
+            yield index, self._to_rgb(frame)
+
+    def release(self):
+        self.cap.release()
+
+class PyAVDecoder(VideoDecoder):
+
+    def __init__(self, video_path:str, size:int=None):
+        """Decodes the video with PyAV, letting FFmpeg resize and convert the frames to RGB
+        in a single step.
+
+        Parameters
+        ----------
+        video_path : str
+            The path of the video to decode.
+        size : int, optional
+            The side of the square frames to decode. If not specified, frames keep their resolution.
+        """
+        import av
+
+        self.size = size
+        try:
+            self.container = av.open(video_path)
+            self.stream = self.container.streams.video[0]
+            self.stream.thread_type = 'AUTO'
+            self.fps = float(self.stream.average_rate)
+            self.opened = True
+        except (av.error.FFmpegError, IndexError, TypeError):
+            self.container = None
+            self.fps = 0.
+            self.opened = False
+
+        self._buffer = None
+
+    def read_frames(self, indices:list):
+        if not indices:
+            return
+        wanted = iter(indices)
+        index = next(wanted)
+        for position, frame in enumerate(self.container.decode(self.stream)):
+            if position < index:
+                continue
+
+            if self.size:
+                width, height = _scaled_size(frame.width, frame.height, self.size)
+                image = _center_crop(frame.to_ndarray(width=width, height=height, format='rgb24'), self.size)
+            else:
+                image = frame.to_ndarray(format='rgb24')
+
+            if self._buffer is None or self._buffer.shape != image.shape:
+                self._buffer = np.empty(image.shape, dtype=np.uint8)
+            np.copyto(self._buffer, image)
+            yield index, self._buffer
+
+            index = next(wanted, None)
+            if index is None:
+                return
+
+    def release(self):
+        if self.container is not None:
+            self.container.close()
+
+class DecordDecoder(VideoDecoder):
+
+    def __init__(self, video_path:str, size:int=None, batch_size:int=32):
+        """Decodes the video with decord, which resizes the frames while decoding them.
+
+        Parameters
+        ----------
+        video_path : str
+            The path of the video to decode.
+        size : int, optional
+            The side of the square frames to decode. If not specified, frames keep their resolution.
+        batch_size : int, optional
+            Number of frames decoded at once, by default 32
+        """
+        import decord
+
+        self.size = size
+        self.batch_size = batch_size
+        try:
+            if size:
+                height, width, _ = decord.VideoReader(video_path, num_threads=1)[0].shape
+                width, height = _scaled_size(width, height, size)
+                self.reader = decord.VideoReader(video_path, width=width, height=height)
+            else:
+                self.reader = decord.VideoReader(video_path)
+            self.fps = self.reader.get_avg_fps()
+            self.opened = len(self.reader) > 0
+        except (decord.DECORDError, RuntimeError):
+            self.reader = None
+            self.fps = 0.
+            self.opened = False
+
+        self._buffer = None
+
+    def read_frames(self, indices:list):
+        indices = iter(indices)
+        while True:
+            batch_indices = [index for index in islice(indices, self.batch_size) if index < len(self.reader)]
+            if not batch_indices:
+                return
+            batch = self.reader.get_batch(batch_indices).asnumpy()
+            for index, image in zip(batch_indices, batch):
+                if self.size:
+                    image = _center_crop(image, self.size)
+                if self._buffer is None or self._buffer.shape != image.shape:
+                    self._buffer = np.empty(image.shape, dtype=np.uint8)
+                np.copyto(self._buffer, image)
+                yield index, self._buffer
+
+    def release(self):
+        self.reader = None
+
+class RawStreamDecoder(VideoDecoder):
+
+    def __init__(self, stream_path:str, width:int, height:int, fps:float, size:int=None,
+                 poll_interval:float=0.05, idle_timeout:float=10.):
+        """Decodes a live stream of raw RGB frames (e.g. written by "ffmpeg -f rawvideo -pix_fmt rgb24")
+        from a named pipe, or from a regular file which is tailed while it grows.
+
+        Parameters
+        ----------
+        stream_path : str
+            The path of the pipe or file.
+        width : int
+            The width of the frames.
+        height : int
+            The height of the frames.
+        fps : float
+            The frames per second of the stream.
+        size : int, optional
+            The side of the square frames to decode. If not specified, frames keep their resolution.
+        poll_interval : float, optional
+            Seconds waited before reading a file again once its end is reached, by default 0.05
+        idle_timeout : float, optional
+            Seconds without new frames after which a file is considered finished, by default 10. Pipes
+            finish once their writer closes them.
+        """
+        self.size = size
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.poll_interval = poll_interval
+        self.idle_timeout = idle_timeout
+        try:
+            self.stream = open(stream_path, 'rb', buffering=0)
+            self.is_pipe = stat.S_ISFIFO(os.fstat(self.stream.fileno()).st_mode)
+            self.opened = True
+        except OSError:
+            self.stream = None
+            self.opened = False
+
+        # Reusable buffers
+        self._frame = np.empty((height, width, 3), dtype=np.uint8)
+        self._resized = None
+
+    def _read_frame(self) -> bool:
+        # Fill the frame buffer, waiting for the stream to grow. False once the stream is finished
+        view = memoryview(self._frame).cast('B')
+        filled = 0
+        last_data = time.monotonic()
+        while filled < len(view):
+            read = self.stream.readinto(view[filled:])
+            if read:
+                filled += read
+                last_data = time.monotonic()
+            elif self.is_pipe or time.monotonic() - last_data >= self.idle_timeout:
+                return False
+            else:
+                time.sleep(self.poll_interval)
+        return True
+
+    def read_frames(self, indices:list):
+        position = 0
+        for index in indices:
+            while position <= index:
+                if not self._read_frame():
+                    return
+                position += 1
+
+            frame = self._frame
+            if self.size:
+                frame = _center_crop(frame, min(self.height, self.width))
+                if self._resized is None:
+                    self._resized = np.empty((self.size, self.size, 3), dtype=np.uint8)
+                cv2.resize(frame, (self.size, self.size), dst=self._resized, interpolation=cv2.INTER_AREA)
+                frame = self._resized
+            yield index, frame
+
+    def release(self):
+        if self.stream is not None:
+            self.stream.close()
+
+def sample_clips(decoder:VideoDecoder, clips:list, step:int):
+    """Samples the frames of several, possibly overlapping, clips of a video while decoding it
+    only once. Each frame is decoded once even if it belongs to several clips, and only the frames
+    of clips not yet completed are kept in memory.
+
+    Parameters
+    ----------
+    decoder : VideoDecoder
+        The decoder of the video.
+    clips : list
+        The start and end frame of each clip.
+    step : int
+        The number of frames between two sampled frames.
+
+    Yields
+    ------
+    tuple
+        The position of the clip in the given list and a uint8 array with its sampled frames, as soon
+        as its last frame is decoded. Clips reaching beyond the end of the video are yielded at the end
+        with the frames that could be read.
+    """
+    clip_indices = [sample_frame_indices(start_frame, end_frame, step) for start_frame, end_frame in clips]
+
+    # Clips each frame belongs to, and clips completed at each frame
+    wanted = {}
+    completed_at = {}
+    for i, indices in enumerate(clip_indices):
+        for position, index in enumerate(indices):
+            wanted.setdefault(index, []).append((i, position))
+        if indices:
+            completed_at.setdefault(indices[-1], []).append(i)
+
+    # Frames of each clip, allocated once its first frame is decoded
+    clip_frames = [None] * len(clips)
+    read_frames = [0] * len(clips)
+    pending = set(range(len(clips)))
+
+    # Clips without frames are already complete
+    for i, indices in enumerate(clip_indices):
+        if not indices:
+            pending.discard(i)
+            yield i, []
+
+    for index, frame in decoder.read_frames(sorted(wanted)):
+        for i, position in wanted[index]:
+            if clip_frames[i] is None:
+                clip_frames[i] = np.empty((len(clip_indices[i]), *frame.shape), dtype=frame.dtype)
+            clip_frames[i][position] = frame
+            read_frames[i] = position + 1
+        for i in completed_at.get(index, []):
+            pending.discard(i)
+            yield i, clip_frames[i]
+            clip_frames[i] = None
+
+    # The video ended before these clips did
+    for i in sorted(pending):
+        yield i, clip_frames[i][:read_frames[i]] if clip_frames[i] is not None else []
+
+def sliding_windows(decoder:VideoDecoder, window:int, stride:int, step:int):
+    """Samples the frames of consecutive, possibly overlapping, windows of a video of unknown length
+    while decoding it only once. Sampled frames are kept in a ring buffer holding a single window, so
+    memory does not grow with the length of the video.
+
+    Parameters
+    ----------
+    decoder : VideoDecoder
+        The decoder of the video.
+    window : int
+        The number of frames of each window.
+    stride : int
+        The number of frames between the start of two consecutive windows.
+    step : int
+        The number of frames between two sampled frames.
+
+    Yields
+    ------
+    tuple
+        The start frame, the end frame (not included) and a uint8 array with the sampled frames of each
+        window, as soon as its last sampled frame is decoded. The last window is yielded with the frames that could
+        be read, unless they all belong to the previous one.
+    """
+    window, stride, step = max(1, window), max(1, stride), max(1, step)
+
+    # Sampled frames of the current window, and the index of the frame held by each slot
+    capacity = -(-window // step)
+    ring = None
+    ring_indices = np.full(capacity, -1)
+    slot = 0
+
+    def window_frames(start:int, end:int) -> np.ndarray:
+        # Copy of the sampled frames of the window, in order
+        slots = [s for s in np.argsort(ring_indices) if start <= ring_indices[s] < end]
+        return ring[slots]
+
+    start = 0
+    last_end = 0
+    last_index = -1
+    for index, frame in decoder.read_frames(count(0, step)):
+        if ring is None:
+            ring = np.empty((capacity, *frame.shape), dtype=frame.dtype)
+        ring[slot] = frame
+        ring_indices[slot] = index
+        slot = (slot + 1) % capacity
+        last_index = index
+
+        # Yield the windows whose last sampled frame is this one, skipping those without sampled frames
+        while index + step >= start + window:
+            frames = window_frames(start, start + window)
+            if len(frames):
+                yield start, start + window, frames
+            last_end = start + window
+            start += stride
+
+    # The video ended before the current window did
+    if last_index >= max(start, last_end):
+        yield start, last_index + 1, window_frames(start, last_index + 1)
@@ -1,32 +1,108 @@
 import numpy as np
-import torch
-#from transformers import CLIPModel, AutoProcessor
 
-import os
-
-import finetunedclip.modified_clip.vclip as vclip
-from yacs.config import CfgNode as CN
-from yacs.config import CfgNode as CN
-
-from PIL import Image
-
-possible_models = [
-    'default',
-    'random',
-    'clip',
-    'clip-centroid',
-    'vclip',
-    'vclipcentroid'
-]
+import sys
+import json
+import hashlib
+import importlib
+from collections import OrderedDict
+from contextlib import nullcontext
+
+from metrics import metrics
+
+# Module and class of each encoder. Encoders depending on torch and their weights live in their own
+# modules, so those are only imported when the encoder is used.
+encoder_registry = {
+    'default': ('vision_encoders', 'DefaultEncoder'),
+    'random': ('vision_encoders', 'RandomEncoder'),
+    'clip': ('clip_encoders', 'CLIP'),
+    'clip-centroid': ('clip_encoders', 'CLIPCentroid'),
+    'vclip': ('vclip_encoders', 'VCLIP'),
+    'vclipcentroid': ('vclip_encoders', 'VCLIPCentroid'),
+}
+possible_models = list(encoder_registry)
+
+# Inference options of the encoders running torch models
+possible_precisions = ['fp32', 'bf16', 'int8']
+possible_compile_modes = ['eager', 'torchscript', 'compile']
+
+# Types of the embeddings generated by the encoders
+possible_dtypes = ['float32', 'float16']
+
+def register_encoder(encoder_name:str, module_name:str, class_name:str):
+    """Registers an encoder, which is only imported once it is built.
+
+    Parameters
+    ----------
+    encoder_name : str
+        The name of the encoder.
+    module_name : str
+        The module of the encoder.
+    class_name : str
+        The class of the encoder.
+    """
+    encoder_registry[encoder_name] = (module_name, class_name)
+    if encoder_name not in possible_models:
+        possible_models.append(encoder_name)
+
+def __getattr__(name:str):
+    # Encoders moved to their own modules can still be imported from this one
+    for module_name, class_name in encoder_registry.values():
+        if class_name == name and module_name != __name__:
+            return getattr(importlib.import_module(module_name), class_name)
+    if name == 'VCLIP_WEIGHTS_PATH':
+        return importlib.import_module('vclip_encoders').VCLIP_WEIGHTS_PATH
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+
+def _inference_mode():
+    # Encoders running torch models have already imported it, the rest do not need it
+    if 'torch' in sys.modules:
+        return sys.modules['torch'].inference_mode()
+    return nullcontext()
 
 class EmbeddingModel:
     def __init__(self):
         raise NotImplementedError
 
+    # Type of the generated embeddings, which is also the type stored by the databases by default
+    dtype = 'float32'
+
     def get_clip_embedding(self):
         """Generates the embedding of the clip.
         """
         raise NotImplementedError
+
+    def get_clips_embedding(self, clips:list) -> list:
+        """Generates the embeddings of several clips. Encoders able to batch frames
+        coming from different clips should override this method.
+
+        Parameters
+        ----------
+        clips : list
+            A list of clips, each of them being a list of frames.
+
+        Returns
+        -------
+        list
+            The embedding of each one of the clips, in the same order.
+        """
+        return [self.get_clip_embedding(clip_array) for clip_array in clips]
+
+    def get_clips_embedding_and_keyframes(self, clips:list) -> tuple:
+        """Generates the embeddings of several clips, along with the frames that were actually
+        encoded. Encoders skipping near-duplicate frames should override this method.
+
+        Parameters
+        ----------
+        clips : list
+            A list of clips, each of them being a list of frames.
+
+        Returns
+        -------
+        tuple
+            The embedding of each one of the clips and, per clip, the index of the keyframe whose
+            embedding each one of its frames took, or None if every frame was encoded.
+        """
+        return self.get_clips_embedding(clips), [None] * len(clips)
     
     def get_encoder_params(self) -> dict:
         """Returns the params related with the encoder, to properly configure a database's
@@ -39,6 +115,97 @@ class EmbeddingModel:
         """
         raise NotImplementedError
 
+    def get_input_size(self):
+        """Returns the side of the square RGB frames the encoder takes as input, so frames can be
+        decoded directly at that resolution.
+
+        Returns
+        -------
+        int
+            The side of the frames in pixels, or None if the encoder takes frames of any resolution.
+        """
+        return None
+
+    def get_fingerprint(self) -> str:
+        """Returns a fingerprint of the encoder's weights and configuration, which changes whenever
+        the embeddings it generates may change.
+
+        Returns
+        -------
+        str
+            The fingerprint as an hexadecimal string.
+        """
+        return _fingerprint(self.get_encoder_params())
+
+    def share_memory(self):
+        """Moves the weights of the encoder to shared memory, so processes forked afterwards use them
+        without copying them. Encoders without weights have nothing to share.
+        """
+        pass
+
+    def unload(self):
+        """Frees the memory held by the weights of the encoder, which can no longer be used.
+        Encoders without weights have nothing to free.
+        """
+        pass
+
+    # Maximum number of sentences whose embeddings are kept in memory, and sentences encoded at once
+    text_cache_size = 65536
+    text_batch_size = 256
+
+    def _encode_texts(self, sentences:list) -> np.ndarray:
+        """Generates the embeddings of a batch of sentences. Encoders with a text tower should
+        override this method.
+
+        Parameters
+        ----------
+        sentences : list
+            The sentences to encode.
+
+        Returns
+        -------
+        np.ndarray
+            A NumPy array with the embedding of each sentence.
+        """
+        raise NotImplementedError
+
+    def get_text_embedding(self, sentences:list) -> np.ndarray:
+        """Generates the embeddings of several sentences, in the space of the clips' embeddings, so
+        they can be used to query the database. Sentences are encoded in batches, and the embeddings
+        of the most recently requested sentences are cached, so repeated queries are not encoded again.
+
+        Parameters
+        ----------
+        sentences : list
+            The sentences to encode (or a single sentence).
+
+        Returns
+        -------
+        np.ndarray
+            A float32 NumPy array with the L2-normalized embedding of each sentence, in the same order.
+        """
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        cache = self.__dict__.setdefault('_text_cache', OrderedDict())
+
+        missing = list(dict.fromkeys(sentence for sentence in sentences if sentence not in cache))
+        with _inference_mode():
+            for start in range(0, len(missing), self.text_batch_size):
+                batch = missing[start:start+self.text_batch_size]
+                embs_array = np.asarray(self._encode_texts(batch), dtype=np.float32).reshape(len(batch), -1)
+                embs_array /= np.maximum(np.linalg.norm(embs_array, axis=1, keepdims=True), 1e-12)
+                cache.update(zip(batch, embs_array))
+
+        embs_array = np.stack([cache[sentence] for sentence in sentences]) if sentences else np.empty((0, 0), dtype=np.float32)
+
+        # Evict the least recently requested sentences
+        for sentence in sentences:
+            cache.move_to_end(sentence)
+        while len(cache) > self.text_cache_size:
+            cache.popitem(last=False)
+
+        return embs_array
+
 class EncoderBuilder:
 
     def build(encoder_name, *args, **kwargs) -> EmbeddingModel:
@@ -60,55 +227,296 @@ class EncoderBuilder:
             If the specified encoder is not implemented.
         """
 
-        match encoder_name:
-            case 'default':
-                return DefaultEncoder(*args, **kwargs)
-            case 'random':
-                return RandomEncoder(*args, **kwargs)
-            case 'clip':
-                return CLIP(*args, **kwargs)
-            case 'clip-centroid':
-                return CLIPCentroid(*args, **kwargs)
-            case 'vclip':
-                return VCLIP(*args, **kwargs)
-            case 'vclipcentroid':
-                return VCLIPCentroid(*args, **kwargs)
-            case _:
-                raise TypeError(f'TypeError: Encoder {encoder_name} not found among implemented. Please, use one of the following: {possible_models}.')
+        if encoder_name not in encoder_registry:
+            raise TypeError(f'TypeError: Encoder {encoder_name} not found among implemented. Please, use one of the following: {possible_models}.')
+
+        # Import the encoder's module only once it is used
+        module_name, class_name = encoder_registry[encoder_name]
+        encoder_class = getattr(importlib.import_module(module_name), class_name)
+        return encoder_class(*args, **kwargs)
+
+def _fingerprint(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+# Normalization applied by OpenAI's CLIP preprocessing
+CLIP_MEAN = (0.48145466, 0.4578275, 0.40821073)
+CLIP_STD = (0.26862954, 0.26130258, 0.27577711)
+
+def _is_model_ready(frames, size:int) -> bool:
+    # Whether the frames were already decoded as RGB at the encoder's input resolution
+    return size is not None and all(getattr(frame, 'shape', None) == (size, size, 3) and frame.dtype == np.uint8
+                                    for frame in frames)
+
+def _normalize_frames(frames, mean:tuple, std:tuple, device):
+    """Turns a batch of uint8 RGB frames, already at the encoder's input resolution, into
+    its normalized input tensor, without going through PIL.
+    """
+    import torch
+    batch = torch.from_numpy(np.ascontiguousarray(np.stack(frames))).to(device)
+    batch = batch.permute(0, 3, 1, 2).float().div_(255)
+    mean = torch.tensor(mean, device=batch.device).view(1, 3, 1, 1)
+    std = torch.tensor(std, device=batch.device).view(1, 3, 1, 1)
+    return batch.sub_(mean).div_(std)
+
+def _check_dtype(dtype:str) -> str:
+    if dtype not in possible_dtypes:
+        raise ValueError(f'ValueError: Type {dtype} not found among implemented. Please, use one of the following: {possible_dtypes}.')
+    return dtype
+
+def _batched_encode(encode_fn, frames:list, embedding_size:int, batch_size:int, dtype:str='float32') -> np.ndarray:
+    """Runs the encoding function over the frames in batches of the given size.
+
+    Parameters
+    ----------
+    encode_fn : Callable
+        Function that receives a list of frames and returns a NumPy array with one
+        embedding per frame.
+    frames : list
+        The frames to encode.
+    embedding_size : int
+        The size of each embedding.
+    batch_size : int
+        Maximum number of frames per forward pass.
+    dtype : str, optional
+        The type of the embeddings, by default 'float32'
+
+    Returns
+    -------
+    np.ndarray
+        A NumPy array with the embedding of each one of the frames.
+    """
+    embs_array = np.zeros((len(frames), embedding_size), dtype=dtype)
+    with _inference_mode():
+        for start in range(0, len(frames), batch_size):
+            batch = frames[start:start+batch_size]
+            embs_array[start:start+len(batch)] = encode_fn(batch)
+    metrics.counter('encoder_frames_total', 'Frames encoded').inc(len(frames))
+    return embs_array
+
+def _encode_clips(encode_fn, clips:list, embedding_size:int, batch_size:int, dtype:str='float32', frame_filter=None,
+                  return_keyframes:bool=False):
+    """Encodes the frames of several clips, batching frames of different clips together. If a frame
+    filter is given, only the keyframes of each clip are encoded, and every other frame takes the
+    embedding of the keyframe representing it. Thus, each clip keeps one embedding per frame, and
+    its centroid weights each keyframe by the number of frames it represents.
+
+    Parameters
+    ----------
+    encode_fn : Callable
+        Function that receives a list of frames and returns a NumPy array with one
+        embedding per frame.
+    clips : list
+        A list of clips, each of them being a list of frames.
+    embedding_size : int
+        The size of each embedding.
+    batch_size : int
+        Maximum number of frames per forward pass.
+    dtype : str, optional
+        The type of the embeddings, by default 'float32'
+    frame_filter : FrameFilter, optional
+        The filter selecting the keyframes of each clip. If not specified, every frame is encoded.
+    return_keyframes : bool, optional
+        Whether to also return the keyframe representing each frame, by default False
+
+    Returns
+    -------
+    list | tuple
+        A NumPy array per clip with the embeddings of each one of its frames. If return_keyframes is True,
+        also the index of the keyframe whose embedding each frame of each clip takes, or None per clip
+        if every frame was encoded.
+    """
+    if frame_filter is None:
+        frames = [frame for clip_array in clips for frame in clip_array]
+        embs = _split_clips(_batched_encode(encode_fn, frames, embedding_size, batch_size, dtype), clips)
+        return (embs, [None] * len(clips)) if return_keyframes else embs
+
+    keyframes = []
+    clips_representatives = []
+    rows = []
+    for clip_array in clips:
+        clip_representatives = frame_filter.keyframes(clip_array)
+        clip_keyframes = np.unique(clip_representatives)
+        clips_representatives.append(clip_representatives)
+        rows.append(len(keyframes) + np.searchsorted(clip_keyframes, clip_representatives))
+        keyframes.extend(clip_array[i] for i in clip_keyframes)
+
+    metrics.counter('encoder_skipped_frames_total', 'Frames not encoded since a keyframe represents them').inc(
+        sum(len(clip_array) for clip_array in clips) - len(keyframes))
+    embs_array = _batched_encode(encode_fn, keyframes, embedding_size, batch_size, dtype)
+    embs = [embs_array[clip_rows] for clip_rows in rows]
+    return (embs, clips_representatives) if return_keyframes else embs
+
+def _split_clips(embs_array:np.ndarray, clips:list) -> list:
+    """Splits the embeddings of the concatenated frames of several clips back into
+    one array per clip.
+    """
+    if not clips:
+        return []
+    lengths = np.cumsum([len(clip_array) for clip_array in clips])[:-1]
+    return np.split(embs_array, lengths)
+
+def set_torch_threads(num_threads:int=None, num_interop_threads:int=None):
+    """Sets the number of threads used by torch within an operation and among operations, so that
+    several workers sharing a machine do not oversubscribe its cores.
+
+    Parameters
+    ----------
+    num_threads : int, optional
+        Number of intra-op threads. If not specified, it is not changed.
+    num_interop_threads : int, optional
+        Number of inter-op threads. If not specified, it is not changed.
+    """
+    import torch
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    if num_interop_threads:
+        try:
+            torch.set_num_interop_threads(num_interop_threads)
+        except RuntimeError as e: # It can only be set before any inter-op parallel work
+            print(f'[ENCODER]: Could not set the number of inter-op threads. {e}')
+
+def _resolve_device(device:str=None):
+    import torch
+    return torch.device(device or ("cuda" if torch.cuda.is_available() else "cpu"))
+
+def _quantize(model, precision:str, device):
+    """Prepares a torch model for inference with the given precision. 'int8' replaces its linear
+    layers by dynamically quantized ones, while 'bf16' is applied with autocast while encoding.
+    """
+    import torch
+    if precision not in possible_precisions:
+        raise ValueError(f'ValueError: Precision {precision} not found among implemented. Please, use one of the following: {possible_precisions}.')
+    model.eval()
+    if precision == 'int8':
+        if device.type != 'cpu':
+            raise ValueError('ValueError: int8 dynamic quantization can only run on CPU')
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+def _autocast(device, precision:str):
+    import torch
+    if precision == 'bf16':
+        return torch.autocast(device_type=device.type, dtype=torch.bfloat16)
+    return nullcontext()
+
+class _TracedForward:
+
+    def __init__(self, forward_fn, module):
+        """Runs the forward function as a TorchScript graph, traced the first time it receives
+        inputs of each shape. If it cannot be traced, it runs eagerly.
+        """
+        self.forward_fn = forward_fn
+        self.module = module
+        self.traced = {}
+
+    def __call__(self, inputs):
+        import torch
+        if self.traced is None:
+            return self.forward_fn(inputs)
+
+        key = (tuple(inputs.shape), inputs.dtype)
+        if key not in self.traced:
+            forward_fn = self.forward_fn
+
+            # The model is registered as a submodule, so its weights are traced as parameters
+            class Forward(torch.nn.Module):
+                def __init__(self, model):
+                    super().__init__()
+                    self.model = model
+
+                def forward(self, inputs):
+                    return forward_fn(inputs)
+            try:
+                self.traced[key] = torch.jit.trace(Forward(self.module), inputs, check_trace=False)
+            except Exception as e:
+                print(f'[ENCODER]: Could not trace the encoder, running it eagerly. {str(e).splitlines()[0]}')
+                self.traced = None
+                return self.forward_fn(inputs)
+        return self.traced[key](inputs)
+
+def _compile_forward(forward_fn, compile_mode:str, module=None):
+    """Returns the forward function of the module compiled with TorchScript or torch.compile,
+    if available.
+    """
+    import torch
+    match compile_mode:
+        case 'eager':
+            return forward_fn
+        case 'torchscript':
+            return _TracedForward(forward_fn, module)
+        case 'compile':
+            if not hasattr(torch, 'compile'):
+                print('[ENCODER]: torch.compile is not available, running the encoder eagerly')
+                return forward_fn
+            return torch.compile(forward_fn, dynamic=True)
+        case _:
+            raise ValueError(f'ValueError: Compile mode {compile_mode} not found among implemented. Please, use one of the following: {possible_compile_modes}.')
+
+def check_accuracy(model:'EmbeddingModel', reference:'EmbeddingModel', clips:list) -> dict:
+    """Compares the embeddings generated by an optimized encoder (e.g. with a lower precision)
+    with those of the reference encoder for the same clips.
+
+    Parameters
+    ----------
+    model : EmbeddingModel
+        The optimized encoder.
+    reference : EmbeddingModel
+        The reference encoder, usually the same encoder running in fp32.
+    clips : list
+        A list of clips, each of them being a list of frames.
+
+    Returns
+    -------
+    dict
+        The minimum and mean cosine similarity between the embeddings of both encoders.
+    """
+    embs_array = np.concatenate([np.atleast_2d(emb) for emb in model.get_clips_embedding(clips)])
+    reference_array = np.concatenate([np.atleast_2d(emb) for emb in reference.get_clips_embedding(clips)])
+    norms = np.linalg.norm(embs_array, axis=1) * np.linalg.norm(reference_array, axis=1)
+    similarities = np.sum(embs_array * reference_array, axis=1) / np.maximum(norms, 1e-12)
+    return {'min_cosine': float(similarities.min()), 'mean_cosine': float(similarities.mean())}
 
 class DefaultEncoder(EmbeddingModel):
 
-    def __init__(self, defaul_embedding=(1,2,3,4)):
+    def __init__(self, defaul_embedding=(1,2,3,4), dtype:str='float32'):
         """This encoder always return the same embedding whenever it is asked to do so.
 
         Parameters
         ----------
         defaul_embedding : Any, optional
             The embedding which will be returned whenever get_clip_embedding is called. By default, (1,2,3,4).
+        dtype : str, optional
+            The type of the embedding. Can be one of the specified in the \'vision_encoders.possible_dtypes\'
+            variable. By default, 'float32'.
         """
-        self.default_embedding = defaul_embedding
+        self.dtype = _check_dtype(dtype)
+        self.default_embedding = np.asarray(defaul_embedding, dtype=self.dtype)
 
-    def get_clip_embedding(self):
+    def get_clip_embedding(self, *args, **kwargs):
         """Returns the embedding specified in the constructor of the class.
 
         Returns
         -------
-        Any
+        np.ndarray
             The embedding specified in the constructor of the class.
         """
         return self.default_embedding
     
+    def _encode_texts(self, sentences:list) -> np.ndarray:
+        return np.tile(np.asarray(self.default_embedding, dtype=np.float32), (len(sentences), 1))
+
     def get_encoder_params(self) -> dict:
         params = {
             'model_name': 'default',
             'embedding_size': len(self.default_embedding),
-            'embedding_list': False
+            'embedding_list': False,
+            'dtype': self.dtype
         }
         return params
 
 class RandomEncoder(EmbeddingModel):
 
-    def __init__(self, embedding_size:tuple=(768,)):
+    def __init__(self, embedding_size:tuple=(768,), dtype:str='float32'):
         """Generates a random embedding of the given size whenever
         get_clip_embedding is called.
 
@@ -116,6 +524,9 @@ class RandomEncoder(EmbeddingModel):
         ----------
         embedding_size : tuple, optional
             The desired size for the embedding. By default, (768,).
+        dtype : str, optional
+            The type of the embedding. Can be one of the specified in the \'vision_encoders.possible_dtypes\'
+            variable. By default, 'float32'.
 
         Raises
         ------
@@ -126,6 +537,7 @@ class RandomEncoder(EmbeddingModel):
             raise TypeError(f'TypeError: The specified size for the embedding must be a list of integers')
         else:
             self.embedding_size = embedding_size
+        self.dtype = _check_dtype(dtype)
 
     def get_clip_embedding(self, *args, **kwargs):
         """Returns a random embedding of the size specified in the constructor of the class.
@@ -136,170 +548,135 @@ class RandomEncoder(EmbeddingModel):
             A random NumPy array of float values with the size specified in the constructor of
             the class.
         """
-        return np.random.rand(*self.embedding_size)
+        return np.random.rand(*self.embedding_size).astype(self.dtype)
     
+    def _encode_texts(self, sentences:list) -> np.ndarray:
+        return np.random.rand(len(sentences), *self.embedding_size)
+
     def get_encoder_params(self) -> dict:
         params = {
             'model_name': 'random',
             'embedding_size': self.embedding_size,
-            'embedding_list': False
+            'embedding_list': False,
+            'dtype': self.dtype
         }
         return params
 
-class CLIP(EmbeddingModel):
-
-    def __init__(self, model_name:str='openai/clip-vit-large-patch14'):
-        """Uses HuggingFace's CLIP model to obtain the embeddings of the clips.
+def _attention_pooling(embs_array:np.ndarray, temperature:float=0.1) -> np.ndarray:
+    # Weight each frame by its (softmaxed) cosine similarity to the centroid of the clip,
+    # so frames far from the dominant content of the clip contribute less
+    embs_array = embs_array.astype(np.float32, copy=False)
+    centroid = np.mean(embs_array, axis=0)
+    norms = np.linalg.norm(embs_array, axis=1) * np.linalg.norm(centroid)
+    similarities = embs_array @ centroid / np.maximum(norms, 1e-12)
+    weights = np.exp((similarities - similarities.max()) / temperature)
+    return weights @ embs_array / weights.sum()
+
+poolings = {
+    'frames': lambda embs_array: embs_array,
+    'centroid': lambda embs_array: np.mean(embs_array, axis=0),
+    'max': lambda embs_array: np.max(embs_array, axis=0),
+    'attention': _attention_pooling,
+}
+possible_poolings = list(poolings)
+
+class MultiOutputEncoder(EmbeddingModel):
+
+    def __init__(self, encoder:EmbeddingModel, outputs:list=('frames', 'centroid')):
+        """Encodes the frames of each clip once with a per-frame encoder, and pools them in several
+        ways, so that each pooling can be stored in its own collection.
 
         Parameters
         ----------
-        model_name : str, optional
-            The specific CLIP model from the HuggingFace repository. By default, openai/clip-vit-large-patch14
-        """
-        try:
-            self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-            self.model = CLIPModel.from_pretrained(model_name)
-            self.model.to(self.device)
-            self.processor = AutoProcessor.from_pretrained(model_name)
-        except OSError as e:
-            print(f'OSError: Model \'{model_name}\' not listed in HuggingFace repository. {e}')
-
-    def _get_img_embedding(self, img:np.ndarray):
-        inputs = self.processor(images=img, return_tensors='pt').to(self.device)
+        encoder : EmbeddingModel
+            An encoder generating one embedding per frame (e.g. CLIP or VCLIP).
+        outputs : list, optional
+            The poolings to generate. Can be any of the specified in the \'vision_encoders.possible_poolings\'
+            variable. By default, ('frames', 'centroid').
 
-        image_features = self.model.get_image_features(**inputs)
+        Raises
+        ------
+        ValueError
+            If the encoder does not generate one embedding per frame, or a pooling is not implemented.
+        """
+        if not encoder.get_encoder_params()['embedding_list']:
+            raise ValueError(f'ValueError: Encoder {encoder.get_encoder_params()["model_name"]} does not generate one embedding per frame')
+        for output in outputs:
+            if output not in poolings:
+                raise ValueError(f'ValueError: Pooling {output} not found among implemented. Please, use one of the following: {possible_poolings}.')
 
-        return image_features.cpu().detach().numpy()
+        self.encoder = encoder
+        self.outputs = list(outputs)
+        self.dtype = encoder.dtype
 
-    def get_clip_embedding(self, clip_array:list):
-        """Generates the embeddings for each frame of the clip. One should be careful with this implementation,
-        since it returns a list of embeddings, not an embedding.
+    def pool(self, embs_array:np.ndarray) -> dict:
+        """Pools the embeddings of the frames of a clip in each one of the outputs' ways.
 
         Parameters
         ----------
-        clip_array : list
-            A list of the frames belonging to the clip.
+        embs_array : np.ndarray
+            The embeddings of the frames of the clip.
 
         Returns
         -------
-        np.ndarray
-            A NumPy array with all the embeddings of each one of the frames.
+        dict
+            The embedding (or list of embeddings) of each output.
         """
-        embs_array = np.zeros((len(clip_array), 768))
-        for i, frame in enumerate(clip_array):
-            embs_array[i] = self._get_img_embedding(frame)
-        print(f"[ENCODER]: Encoded {len(embs_array)} embeddings")
-        return embs_array
-    
-    def get_encoder_params(self) -> dict:
-        params = {
-            'model_name': 'clip',
-            'embedding_size': 768,
-            'embedding_list': True
-        }
-        return params
-    
-class CLIPCentroid(CLIP):
+        return {output: poolings[output](embs_array).astype(embs_array.dtype, copy=False) for output in self.outputs}
 
-    def get_clip_embedding(self, clip_array:list):
-        """Generates the embedding of the clip by averaging the CLIP-generated embeddings
-        of the frames.
+    def get_clip_embedding(self, clip_array:list) -> dict:
+        return self.pool(self.encoder.get_clip_embedding(clip_array))
 
-        Parameters
-        ----------
-        clip_array : list
-            A list of the frames belonging to the clip.
+    def get_clips_embedding(self, clips:list) -> list:
+        return [self.pool(embs_array) for embs_array in self.encoder.get_clips_embedding(clips)]
 
-        Returns
-        -------
-        np.ndarray
-            A single embedding which is the average of the embeddings of the clip's frames.
-        """
-        emb = np.mean(super().get_clip_embedding(clip_array), axis=0)
-        return emb
-    
-    def get_encoder_params(self) -> dict:
-        params = {
-            'model_name': 'clipcentroid',
-            'embedding_size': 768,
-            'embedding_list': False
-        }
-        return params
-
-VCLIP_WEIGHTS_PATH = '/home/pregodon@gaps_domain.ssr.upm.es/TFM/ucf-crime/finetunedclip/weights'
-class VCLIP(EmbeddingModel):
-    def __init__(self):
+    def get_clips_embedding_and_keyframes(self, clips:list) -> tuple:
+        embs, keyframes = self.encoder.get_clips_embedding_and_keyframes(clips)
+        return [self.pool(embs_array) for embs_array in embs], keyframes
 
-        # Apply a default configuration
-        _C = CN()
-        _C.BASE = ['']
-        _C.MODEL = CN()
-        _C.MODEL.ARCH = 'ViT-B/32'
-        _C.MODEL.WEIGHTS_DIR = VCLIP_WEIGHTS_PATH
-        _C.MODEL.RESUME = os.path.join(VCLIP_WEIGHTS_PATH, '100batch_40frames_32.pth')
-        _C.DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-        self.config = _C.clone()
-
-        self.load()
-
-    def load(self):
-        backbone_name = self.config.MODEL.ARCH
-        root = self.config.MODEL.WEIGHTS_DIR
-
-        self.model, self.preprocess = vclip.load(name=backbone_name,
-                                                 download_root=root,
-                                                 jit=False,
-                                                 device=self.config.DEVICE)
-        
-        self.model = self.model.float().cuda()
-        checkpoint = torch.load(self.config.MODEL.RESUME, map_location='cpu')
-        load_state_dict = checkpoint['model']
-        self.model.load_state_dict(load_state_dict, strict=False)
-
-        self.device = self.config.DEVICE
-    
-    def unload(self):
-        pass
+    def get_input_size(self):
+        return self.encoder.get_input_size()
 
-    def encode_image(self, img):
-        # Send image to device
-        img = Image.fromarray(img)
-        image = self.preprocess(img).unsqueeze(0).to(self.device)
+    def get_text_embedding(self, sentences:list) -> np.ndarray:
+        return self.encoder.get_text_embedding(sentences)
 
-        # Get features
-        image_features, attention_weights = self.model.encode_image(image)
-        return image_features.cpu().detach().numpy()
+    def share_memory(self):
+        self.encoder.share_memory()
 
-    def encode_text(self, text):
-        text = vclip.tokenize(text).to(self.device)
-        text_features, _ = self.model.encode_text(text)
-        return text_features
-    
-    def get_clip_embedding(self, clip_array:list):
-        embs_array = np.zeros((len(clip_array), 512))
-        for i, frame in enumerate(clip_array):
-            embs_array[i] = self.encode_image(frame)
-        print(f"[ENCODER]: Encoded {len(embs_array)} embeddings")
-        return embs_array
+    def unload(self):
+        self.encoder.unload()
 
-    def get_encoder_params(self) -> dict:
-        params = {
-            'model_name': 'vclip',
-            'embedding_size': 512,
-            'embedding_list': True
-        }
-        return params
+    def get_outputs_params(self) -> dict:
+        """Returns the params of each output, to properly configure its database's collection.
 
-class VCLIPCentroid(VCLIP):
+        Returns
+        -------
+        dict
+            The parameters of each output as a dictionary
+        """
+        encoder_params = self.encoder.get_encoder_params()
+        outputs_params = {}
+        for output in self.outputs:
+            if output == 'frames':
+                outputs_params[output] = encoder_params
+            else:
+                outputs_params[output] = {
+                    **encoder_params,
+                    'model_name': encoder_params['model_name'] + output,
+                    'embedding_list': False
+                }
+        return outputs_params
 
-    def get_clip_embedding(self, clip_array:list):
-        emb = np.mean(super().get_clip_embedding(clip_array), axis=0)
-        return emb
-    
     def get_encoder_params(self) -> dict:
+        encoder_params = self.encoder.get_encoder_params()
         params = {
-            'model_name': 'vclipcentroid',
-            'embedding_size': 512,
-            'embedding_list': False # Means that the get_clip_embedding return a single embedding
+            'model_name': '+'.join(params['model_name'] for params in self.get_outputs_params().values()),
+            'embedding_size': encoder_params['embedding_size'],
+            'embedding_list': encoder_params['embedding_list'],
+            'dtype': self.dtype,
+            'outputs': self.outputs
         }
         return params
+
+    def get_fingerprint(self) -> str:
+        return _fingerprint(self.get_encoder_params(), self.encoder.get_fingerprint())